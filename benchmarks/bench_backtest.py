@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Time to load and backtest years of minute candles (a random walk written
+to a temporary CSV file).
+
+Usage: python benchmarks/bench_backtest.py [--years 3] [--buy-interval 86400]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from optimal_buy_cbpro.backtest import load_candles, run_backtest
+
+
+def write_candles(path, minutes, seed=7):
+    rng = random.Random(seed)
+    price = 30000.0
+    start = 1600000000
+    with open(path, "w") as f:
+        f.write("time,open,high,low,close,volume\n")
+        for i in range(minutes):
+            close = price * (1 + rng.gauss(0, 0.0008))
+            low = min(price, close) * (1 - abs(rng.gauss(0, 0.0004)))
+            high = max(price, close) * (1 + abs(rng.gauss(0, 0.0004)))
+            f.write(f"{start + 60 * i},{price:.2f},{high:.2f},{low:.2f},{close:.2f},1\n")
+            price = close
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--buy-interval", type=float, default=86400)
+    args = parser.parse_args()
+
+    minutes = int(args.years * 365 * 24 * 60)
+    coins_config = {"BTC": {"minimum_order_size": 1.0, "base_increment": "0.00000001", "price_increment": "0.01"}}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "candles.csv")
+        write_candles(path, minutes)
+
+        start = time.perf_counter()
+        candles = load_candles(path)
+        loaded = time.perf_counter()
+        load_candles(path)
+        cached = time.perf_counter()
+        report = run_backtest(candles, SimpleNamespace(buy_interval=args.buy_interval), coins_config)
+        done = time.perf_counter()
+
+    print(f"{len(candles)} minute candles ({args.years} years), {report['cycles']} cycles")
+    print(f"load: {loaded - start:.2f}s (cached: {cached - loaded:.3f}s), backtest: {done - cached:.3f}s")
+    print(f"fill rate {report['fill_rate']:.2%}, cost vs DCA {report['cost_vs_dca']:+.2%}, idle cash {report['idle_cash_fraction']:.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""Wall-clock time of a full buy cycle, sync engine against async engine.
+
+Runs a real RESTClient against a local mock of the Advanced Trade API (HTTPS,
+self-signed certificate) and a local mock of CoinGecko, both answering every
+request after a fixed delay, like a round trip to the real services.
+
+Usage: python benchmarks/bench_engines.py [--latency 0.05] [--runs 3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import sys
+import tempfile
+import threading
+import time
+import urllib3
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from coinbase.rest import RESTClient
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from optimal_buy_cbpro import optimal_buy_cbpro
+from optimal_buy_cbpro.engine_async import async_buy
+from optimal_buy_cbpro.history import get_session
+from optimal_buy_cbpro.ratelimit import RateLimitedClient
+
+COINS = {
+    "BTC": {"name": "Bitcoin", "withdrawal_address": None, "external_balance": 0},
+    "ETH": {"name": "Ethereum", "withdrawal_address": None, "external_balance": 0},
+    "LTC": {"name": "Litecoin", "withdrawal_address": None, "external_balance": 0},
+    "SOL": {"name": "Solana", "withdrawal_address": None, "external_balance": 0},
+}
+PRICES = {"BTC": 60000.0, "ETH": 3000.0, "LTC": 80.0, "SOL": 150.0}
+
+
+def write_key_and_cert(directory):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    )
+    key_path = os.path.join(directory, "key.pem")
+    cert_path = os.path.join(directory, "cert.pem")
+    with open(key_path, "wb") as f:
+        f.write(key_pem)
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    # The same EC key doubles as the API secret the client signs its JWTs with
+    return key_pem.decode(), key_path, cert_path
+
+
+def mock_response(method, url):
+    path = url.path
+    query = parse_qs(url.query)
+    if path.endswith("/coins/list"):
+        return [{"id": c["name"].lower(), "symbol": s.lower(), "name": c["name"]} for s, c in COINS.items()]
+    if path.endswith("/coins/markets"):
+        ids = query.get("ids", [""])[0].split(",")
+        return [{"id": i, "market_cap": 1000000 * (n + 1)} for n, i in enumerate(ids)]
+    if path.endswith("/brokerage/accounts"):
+        accounts = [{"uuid": "fiat", "currency": "USD", "available_balance": {"value": "10000.00", "currency": "USD"}}]
+        accounts += [
+            {"uuid": s, "currency": s, "available_balance": {"value": "0.1", "currency": s}} for s in COINS
+        ]
+        return {"accounts": accounts, "has_next": False, "cursor": "", "size": len(accounts)}
+    if path.endswith("/brokerage/orders/historical/batch"):
+        return {"orders": [], "has_next": False, "cursor": ""}
+    if path.endswith("/brokerage/products"):
+        return {"products": [
+            {
+                "product_id": f"{s}-USD",
+                "base_currency_id": s,
+                "quote_currency_id": "USD",
+                "price": str(PRICES[s]),
+                "base_min_size": "0.00000001",
+                "base_increment": "0.00000001",
+                "quote_increment": "0.01",
+                "trading_disabled": False,
+            }
+            for s in COINS
+        ]}
+    if path.endswith("/brokerage/best_bid_ask"):
+        return {"pricebooks": [
+            {
+                "product_id": f"{s}-USD",
+                "bids": [{"price": str(PRICES[s] - 1), "size": "1"}],
+                "asks": [{"price": str(PRICES[s] + 1), "size": "1"}],
+            }
+            for s in COINS
+        ]}
+    if path.endswith("/brokerage/orders") and method == "POST":
+        return {"success": True, "success_response": {"order_id": f"order-{time.perf_counter_ns()}"}}
+    return None
+
+
+def make_handler(latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def handle_one(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            time.sleep(latency)
+            body = mock_response(method, urlparse(self.path))
+            payload = json.dumps(body if body is not None else {"error": "not found"}).encode()
+            self.send_response(200 if body is not None else 404)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self.handle_one("GET")
+
+        def do_POST(self):
+            self.handle_one("POST")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(handler, cert_path=None, key_path=None):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    if cert_path:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_client(api_port, secret, pool_size):
+    rest_client = RESTClient(
+        api_key="organizations/bench/apiKeys/bench",
+        api_secret=secret,
+        base_url=f"127.0.0.1:{api_port}",
+    )
+    # Self-signed certificate; REQUESTS_CA_BUNDLE and friends would override verify
+    rest_client.session.trust_env = False
+    rest_client.session.verify = False
+    client = RateLimitedClient(rest_client, private_rate=0, public_rate=0)
+    optimal_buy_cbpro.configure_connection_pool(client, pool_size)
+    return client
+
+
+def make_args(db_dir):
+    return SimpleNamespace(
+        fiat_currency="USD",
+        base_fee=0.006,
+        withdrawal_threshold=25.0,
+        starting_discount=0.005,
+        discount_step=0.01,
+        order_count=5,
+        # A fresh file DB per run, so the weights and product caches start empty
+        db_engine=f"sqlite:///{db_dir}/cbpro_history.db",
+    )
+
+
+def time_cycle(engine, client, latency):
+    with tempfile.TemporaryDirectory() as db_dir:
+        args = make_args(db_dir)
+        db_session = get_session(args.db_engine)
+        optimal_buy_cbpro._coin_id_index = None
+        start = time.perf_counter()
+        if engine == "async":
+            asyncio.run(async_buy(args, COINS, client, db_session))
+        else:
+            optimal_buy_cbpro.buy(args, COINS, client, db_session)
+        elapsed = time.perf_counter() - start
+        db_session.close()
+        return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated round trip in seconds")
+    parser.add_argument("--runs", type=int, default=3, help="Cycles per engine, best time is reported")
+    args = parser.parse_args()
+
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    with tempfile.TemporaryDirectory() as cert_dir:
+        secret, key_path, cert_path = write_key_and_cert(cert_dir)
+        handler = make_handler(args.latency)
+        api_server = start_server(handler, cert_path, key_path)
+        coingecko_server = start_server(handler)
+        optimal_buy_cbpro.COINGECKO_API_URL = f"http://127.0.0.1:{coingecko_server.server_address[1]}/api/v3"
+        client = make_client(api_server.server_address[1], secret, 16)
+
+        # Keep the cycle's own output out of the table
+        devnull = open(os.devnull, "w")
+        results = {}
+        for engine in ("sync", "async"):
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                results[engine] = min(time_cycle(engine, client, args.latency) for _ in range(args.runs))
+            finally:
+                sys.stdout = stdout
+        api_server.shutdown()
+        coingecko_server.shutdown()
+
+    orders = len(COINS) * 5
+    print(f"{len(COINS)} coins, {orders} orders, {args.latency * 1000:.0f} ms simulated latency")
+    print(f"{'engine':>6} {'cycle (s)':>10}")
+    for engine, elapsed in results.items():
+        print(f"{engine:>6} {elapsed:>10.3f}")
+    print(f"speedup {results['sync'] / results['async']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Wall-clock time of get_prices against basket size, using a stubbed RESTClient.
+
+Usage: python benchmarks/bench_get_prices.py [--latency 0.05] [--workers 8]
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from optimal_buy_cbpro import optimal_buy_cbpro
+
+
+class StubRESTClient:
+    """Answers get_product after a fixed delay, like a round trip to the API."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def get_product(self, product_id):
+        time.sleep(self.latency)
+        return SimpleNamespace(product_id=product_id, price="100.00")
+
+
+def time_get_prices(client, coins, workers):
+    start = time.perf_counter()
+    optimal_buy_cbpro.get_prices(client, coins, "USD", max_workers=workers)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated round trip in seconds")
+    parser.add_argument("--workers", type=int, default=optimal_buy_cbpro.DEFAULT_PRICE_WORKERS)
+    args = parser.parse_args()
+
+    client = StubRESTClient(args.latency)
+    # Keep the per-ticker output from get_prices out of the table
+    devnull = open(os.devnull, "w")
+    print(f"{'coins':>6} {'serial (s)':>12} {f'{args.workers} workers (s)':>16} {'speedup':>8}")
+    for basket_size in (1, 5, 10, 20, 40):
+        coins = [f"C{i}" for i in range(basket_size)]
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            serial = time_get_prices(client, coins, 1)
+            concurrent = time_get_prices(client, coins, args.workers)
+        finally:
+            sys.stdout = stdout
+        print(f"{basket_size:>6} {serial:>12.3f} {concurrent:>16.3f} {serial / concurrent:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
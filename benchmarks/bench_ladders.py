@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Time to build buy ladders for a basket of coins: the old per-rung loop
+against ladder.build_ladders.
+
+Usage: python benchmarks/bench_ladders.py [--order-count 5]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from decimal import Decimal, localcontext
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from optimal_buy_cbpro.ladder import build_ladders, ladder_orders
+from optimal_buy_cbpro.optimal_buy_cbpro import quantize_down
+
+
+def legacy_buy_orders(coin_symbol, amount_to_buy_fiat, current_price, minimum_order_value_fiat, size_precision, price_precision, args):
+    # generate_buy_orders before the ladder module, prints included
+    with localcontext() as ctx:
+        ctx.prec = 8
+        buy_orders = []
+        if amount_to_buy_fiat < minimum_order_value_fiat:
+            return buy_orders
+        number_of_orders = min(args.order_count, max(1, math.floor(amount_to_buy_fiat / minimum_order_value_fiat)))
+        amount_fiat_per_order = quantize_down(Decimal(str(amount_to_buy_fiat)) / Decimal(str(number_of_orders)), size_precision)
+        print(f"precision: {size_precision}")
+        print(f"Initial amount fiat per order: {amount_fiat_per_order}")
+        discount_factor = Decimal(str(1 - args.starting_discount))
+        price_decimal = Decimal(str(current_price))
+        print(f"Starting discount factor: {discount_factor}, price: {price_decimal}")
+        for i in range(number_of_orders):
+            discounted_price = quantize_down(price_decimal * discount_factor, price_precision)
+            print(f"Calculated discounted price: {discounted_price} for {coin_symbol} (original: {price_decimal}, discount: {discount_factor}, precision: {price_precision})")
+            print(f"Discounted price for {coin_symbol}: {discounted_price}")
+            if discounted_price <= Decimal("0"):
+                continue
+            print(f"Amount fiat per order for {coin_symbol}: {amount_fiat_per_order}")
+            print(f"Discounted price for {coin_symbol}: {discounted_price}")
+            size_base_currency = quantize_down(amount_fiat_per_order / discounted_price, size_precision)
+            if size_base_currency * discounted_price < Decimal(str(minimum_order_value_fiat)):
+                continue
+            buy_orders.append({"price": float(discounted_price), "size": float(size_base_currency)})
+            discount_factor -= Decimal(str(args.discount_step))
+        return buy_orders
+
+
+def make_specs(basket_size, rng):
+    return [
+        (f"C{i}", rng.uniform(100, 5000), rng.uniform(0.01, 60000), 1.0, Decimal("0.00000001"), Decimal("0.01"))
+        for i in range(basket_size)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--order-count", type=int, default=5)
+    args = parser.parse_args()
+    ladder_args = SimpleNamespace(order_count=args.order_count, starting_discount=0.005, discount_step=0.01)
+
+    rng = random.Random(0)
+    devnull = open(os.devnull, "w")
+    print(f"{'coins':>6} {'per-rung loop (ms)':>19} {'build_ladders (ms)':>19} {'speedup':>8}")
+    for basket_size in (1, 10, 100, 1000):
+        specs = make_specs(basket_size, rng)
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            start = time.perf_counter()
+            legacy = {spec[0]: legacy_buy_orders(*spec, ladder_args) for spec in specs}
+            legacy_time = time.perf_counter() - start
+        finally:
+            sys.stdout = stdout
+        start = time.perf_counter()
+        ladders = build_ladders(specs, ladder_args.order_count, ladder_args.starting_discount, ladder_args.discount_step)
+        orders = {coin: ladder_orders(ladders[coin]) for coin in ladders}
+        batched_time = time.perf_counter() - start
+        assert orders == legacy
+        print(f"{basket_size:>6} {legacy_time * 1000:>19.2f} {batched_time * 1000:>19.2f} {legacy_time / batched_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
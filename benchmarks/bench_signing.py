@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Per-call cost of signing a raw REST request: parsing the PEM key and
+signing a fresh JWT every time (as the coinbase_trade scripts used to) against
+signing.JWTSigner's parsed key and per-URI token cache.
+
+Usage: python benchmarks/bench_signing.py [--calls 1000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from optimal_buy_cbpro import signing
+
+URI = signing.format_uri("POST", "/v2/accounts/account/deposits")
+
+
+def uncached(api_key, pem):
+    # One script call before the shared module
+    signer = signing.JWTSigner(api_key, pem)
+    return signer.sign(URI, int(time.time()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    pem = ec.generate_private_key(ec.SECP256R1()).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    api_key = "organizations/bench/apiKeys/bench"
+    signer = signing.JWTSigner(api_key, pem)
+
+    timings = {}
+    for name, call in (
+        ("parse + sign", lambda: uncached(api_key, pem)),
+        ("sign", lambda: signer.sign(URI, int(time.time()))),
+        ("cached", lambda: signer.token(URI)),
+    ):
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            call()
+        timings[name] = (time.perf_counter() - start) / args.calls
+
+    print(f"{'':>14} {'us/call':>10} {'speedup':>8}")
+    for name, seconds in timings.items():
+        print(f"{name:>14} {seconds * 1e6:>10.1f} {timings['parse + sign'] / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
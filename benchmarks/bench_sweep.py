@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Parameter sweep throughput: the same combinations backtested one after the
+other in this process, and by sweep.run_sweep on a process pool.
+
+Usage: python benchmarks/bench_sweep.py [--years 1] [--combinations 64] [--workers N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_backtest import write_candles
+from optimal_buy_cbpro.backtest import load_candles, run_backtest
+from optimal_buy_cbpro.sweep import run_sweep, sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--combinations", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    coins_config = {"BTC": {"minimum_order_size": 1.0, "base_increment": "0.00000001", "price_increment": "0.01"}}
+    values = {"starting_discount": (0.0, 0.03), "discount_step": (0.002, 0.03), "order_count": (1, 8), "buy_interval": [86400.0, 604800.0]}
+    combinations = sample(values, args.combinations, seed=1)
+    base_args = SimpleNamespace(base_fee=0.006, withdrawal_threshold=0.0, deposit_amount=100.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "candles.csv")
+        write_candles(path, int(args.years * 365 * 24 * 60))
+        candles = load_candles(path)
+
+        start = time.perf_counter()
+        for combination in combinations:
+            run_backtest(candles, SimpleNamespace(**vars(base_args), **combination), coins_config)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        run_sweep(path, combinations, base_args, coins_config, workers=args.workers)
+        parallel = time.perf_counter() - start
+
+    print(f"{args.combinations} combinations over {args.years} years of minute candles")
+    print(f"sequential: {sequential:.2f}s, {args.workers} workers: {parallel:.2f}s ({sequential / parallel:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""Replays historical candles through the buy ladder to compare settings
+without placing real orders.
+
+    python -m optimal_buy_cbpro.backtest --candles btc-usd-1m.csv --deposit-amount 100
+
+Every --buy-interval seconds the open orders are cancelled, --deposit-amount
+is added to the cash, and a new ladder is built from the cash (less the
+--base-fee reserve) at that moment's open price, exactly as the bot builds
+it. A rung fills at its limit price, paying --base-fee, once a candle trades
+below it before the next cycle. The report compares the average cost
+with plain DCA, i.e. buying --deposit-amount at the open price every cycle.
+
+Candles are CSV (with a header) or Parquet files with time, open, low and
+close columns; times may be unix seconds or milliseconds, or ISO 8601. The
+parsed candles are cached in <file>.candles, so later runs load in an instant.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+from .columns import map_columns, read_columns, write_columns
+from .defaults import (
+    DEFAULT_BASE_FEE,
+    DEFAULT_BUY_INTERVAL,
+    DEFAULT_DISCOUNT_STEP,
+    DEFAULT_ORDER_COUNT,
+    DEFAULT_STARTING_DISCOUNT,
+    DEFAULT_WITHDRAWAL_THRESHOLD,
+)
+
+DEFAULT_DEPOSIT_AMOUNT = 100.0
+# Accepted spellings of the candle columns, matched case-insensitively
+CANDLE_COLUMNS = {
+    "time": ("time", "timestamp", "date", "datetime", "open_time", "start"),
+    "open": ("open", "o"),
+    "low": ("low", "l"),
+    "close": ("close", "c"),
+}
+# Unix times above this are in milliseconds (it is 5138 AD in seconds)
+MILLISECONDS_THRESHOLD = 1e11
+
+
+class Candles:
+    """Candles as parallel arrays of doubles (or memoryviews of a mapped
+    cache file, see map_candles), sorted by time. The simulation only ever
+    takes the minimum of a slice of lows, which runs in C, so years of minute
+    candles replay in well under a second."""
+
+    __slots__ = ("times", "opens", "lows", "closes")
+
+    def __init__(self, times, opens, lows, closes):
+        if any(a > b for a, b in zip(times, times[1:])):
+            order = sorted(range(len(times)), key=times.__getitem__)
+            times, opens, lows, closes = ([column[i] for i in order] for column in (times, opens, lows, closes))
+        self.times = array("d", times)
+        self.opens = array("d", opens)
+        self.lows = array("d", lows)
+        self.closes = array("d", closes)
+
+    @classmethod
+    def from_columns(cls, columns):
+        # Already sorted columns (arrays or memoryviews), used as they are
+        candles = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(candles, name, columns[name])
+        return candles
+
+    def __len__(self):
+        return len(self.times)
+
+
+def parse_candle_time(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    try:
+        seconds = float(value)
+    except ValueError:
+        return parse_candle_time(datetime.fromisoformat(value))
+    return seconds / 1000 if seconds > MILLISECONDS_THRESHOLD else seconds
+
+
+def parse_candle_times(values):
+    # Unix times are converted in one pass; anything else value by value
+    try:
+        times = array("d", map(float, values))
+    except (TypeError, ValueError):
+        return array("d", map(parse_candle_time, values))
+    if times and times[0] > MILLISECONDS_THRESHOLD:
+        times = array("d", (t / 1000 for t in times))
+    return times
+
+
+def find_columns(path, names):
+    lowered = [str(name).strip().lower() for name in names]
+    columns = {}
+    for column, spellings in CANDLE_COLUMNS.items():
+        index = next((lowered.index(s) for s in spellings if s in lowered), None)
+        if index is None:
+            raise Exception(f"{path}: no {column} column (looked for {', '.join(spellings)})")
+        columns[column] = index
+    return columns
+
+
+def read_csv_candles(path):
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        columns = find_columns(path, next(reader))
+        rows = [row for row in reader if row]
+    return Candles(
+        parse_candle_times([row[columns["time"]] for row in rows]),
+        *(array("d", (float(row[columns[name]]) for row in rows)) for name in ("open", "low", "close")),
+    )
+
+
+def read_parquet_candles(path):
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception(f"Reading {path} needs pyarrow: pip install pyarrow")
+    table = pyarrow.parquet.read_table(path)
+    columns = find_columns(path, table.column_names)
+    values = {column: table.column(index).to_pylist() for column, index in columns.items()}
+    return Candles(
+        parse_candle_times(values["time"]),
+        values["open"],
+        values["low"],
+        values["close"],
+    )
+
+
+def candle_cache_path(path):
+    return f"{path}.candles"
+
+
+def candle_cache_current(header, path):
+    stat = os.stat(path)
+    return header.get("mtime_ns") == stat.st_mtime_ns and header.get("size") == stat.st_size
+
+
+def read_candle_cache(path):
+    # The arrays of an earlier load, if the source file hasn't changed since
+    try:
+        header, columns = read_columns(candle_cache_path(path))
+    except (OSError, ValueError, KeyError, EOFError):
+        return None
+    if not candle_cache_current(header, path):
+        return None
+    return Candles.from_columns(columns)
+
+
+def write_candle_cache(path, candles):
+    stat = os.stat(path)
+    try:
+        write_columns(
+            candle_cache_path(path),
+            {name: getattr(candles, name) for name in Candles.__slots__},
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+        )
+    except OSError as e:
+        print(f"Could not cache candles for {path}: {e}")
+
+
+def load_candles(path, cache=True):
+    # Parsing is by far the slowest part of a backtest, so the parsed arrays
+    # are kept in a binary file next to the candles and reused until the
+    # candle file changes
+    candles = read_candle_cache(path) if cache else None
+    if candles is not None:
+        return candles
+    if str(path).lower().endswith((".parquet", ".pq")):
+        candles = read_parquet_candles(path)
+    else:
+        candles = read_csv_candles(path)
+    if cache:
+        write_candle_cache(path, candles)
+    return candles
+
+
+def map_candles(path):
+    # Candles backed by a read-only memory map of the cache file (written
+    # first if needed), so processes replaying the same file share one copy
+    load_candles(path)
+    header, columns = map_columns(candle_cache_path(path))
+    if not candle_cache_current(header, path):
+        raise Exception(f"Could not cache candles for {path}")
+    return Candles.from_columns(columns)
+
+
+def run_backtest(candles, args, coins_config=None, coin_symbol="BTC"):
+    # Returns the report as a dict; see the module docstring for the model
+    from .ladder import build_ladders
+    from .optimal_buy_cbpro import ladder_spec
+
+    coins_config = coins_config or {coin_symbol: {}}
+    order_count = getattr(args, "order_count", DEFAULT_ORDER_COUNT)
+    starting_discount = getattr(args, "starting_discount", DEFAULT_STARTING_DISCOUNT)
+    discount_step = getattr(args, "discount_step", DEFAULT_DISCOUNT_STEP)
+    base_fee = getattr(args, "base_fee", DEFAULT_BASE_FEE)
+    withdrawal_threshold = getattr(args, "withdrawal_threshold", DEFAULT_WITHDRAWAL_THRESHOLD)
+    buy_interval = getattr(args, "buy_interval", DEFAULT_BUY_INTERVAL)
+    deposit_amount = getattr(args, "deposit_amount", DEFAULT_DEPOSIT_AMOUNT)
+    minimum_order_value = coins_config[coin_symbol].get("minimum_order_size", 0.01)
+    if not len(candles):
+        raise Exception("No candles to backtest")
+    if buy_interval <= 0:
+        raise Exception("--buy-interval must be positive")
+
+    times, opens, lows = candles.times, candles.opens, candles.lows
+    cash = coins = spent = 0.0
+    dca_coins = 0.0
+    placed = filled = 0
+    placed_value = filled_value = 0.0
+    idle_cash = available_cash = 0.0
+    cycles = 0
+
+    start = 0
+    cycle_time = times[0]
+    while start < len(times):
+        # Open orders from the last cycle were cancelled; their cash is free again
+        cycle_time += buy_interval
+        end = bisect_left(times, cycle_time, start)
+        if end == start:
+            # A gap in the candles: nothing happened this cycle
+            continue
+        cycles += 1
+        price = opens[start]
+        cash += deposit_amount
+        dca_coins += deposit_amount / (price * (1 + base_fee))
+
+        to_spend = cash - base_fee * cash
+        available_cash += cash
+        if to_spend > withdrawal_threshold and to_spend >= minimum_order_value and price > 0:
+            spec = ladder_spec(coins_config, coin_symbol, to_spend, price)
+            rungs = build_ladders([spec], order_count, starting_discount, discount_step)[coin_symbol]
+            # The ladder goes up at the open of the cycle's first candle
+            window_low = min(lows[start:end])
+            for rung_price, rung_size in rungs:
+                rung_price, rung_size = float(rung_price), float(rung_size)
+                value = rung_price * rung_size
+                placed += 1
+                placed_value += value
+                # Resting below the market, a rung only fills once it trades through
+                if window_low < rung_price:
+                    filled += 1
+                    filled_value += value
+                    cash -= value * (1 + base_fee)
+                    spent += value * (1 + base_fee)
+                    coins += rung_size
+        idle_cash += cash
+        start = end
+
+    deposited = deposit_amount * cycles
+    last_price = candles.closes[-1]
+    average_cost = spent / coins if coins else None
+    dca_average_cost = deposited / dca_coins if dca_coins else None
+    return {
+        "cycles": cycles,
+        "deposited": deposited,
+        "orders_placed": placed,
+        "orders_filled": filled,
+        "fill_rate": filled / placed if placed else None,
+        "value_fill_rate": filled_value / placed_value if placed_value else None,
+        "coins": coins,
+        "average_cost": average_cost,
+        "dca_coins": dca_coins,
+        "dca_average_cost": dca_average_cost,
+        # Below 0 when the ladder bought cheaper than plain DCA
+        "cost_vs_dca": average_cost / dca_average_cost - 1 if average_cost and dca_average_cost else None,
+        "idle_cash": cash,
+        # Share of the cash on hand each cycle that was left unspent at its end
+        "idle_cash_fraction": idle_cash / available_cash if available_cash else None,
+        "value": coins * last_price + cash,
+        "dca_value": dca_coins * last_price,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candles", help="CSV or Parquet file of candles", required=True)
+    parser.add_argument("--coin", help="Coin the candles are for (default: BTC)", default="BTC")
+    parser.add_argument("--starting-discount", type=float, help=f"Starting discount for limit buy orders (default: {DEFAULT_STARTING_DISCOUNT})", default=DEFAULT_STARTING_DISCOUNT)
+    parser.add_argument("--discount-step", type=float, help=f"Incremental discount step for subsequent buy orders (default: {DEFAULT_DISCOUNT_STEP})", default=DEFAULT_DISCOUNT_STEP)
+    parser.add_argument("--order-count", type=int, help=f"Number of buy orders to split into (default: {DEFAULT_ORDER_COUNT})", default=DEFAULT_ORDER_COUNT)
+    parser.add_argument("--base-fee", type=float, help=f"Fee rate paid on every fill (default: {DEFAULT_BASE_FEE})", default=DEFAULT_BASE_FEE)
+    parser.add_argument("--withdrawal-threshold", type=float, help=f"No ladder is built while the cash to spend is below this (default: {DEFAULT_WITHDRAWAL_THRESHOLD})", default=DEFAULT_WITHDRAWAL_THRESHOLD)
+    parser.add_argument("--buy-interval", type=float, help=f"Seconds between cancel-and-replace cycles (default: {DEFAULT_BUY_INTERVAL})", default=DEFAULT_BUY_INTERVAL)
+    parser.add_argument("--deposit-amount", type=float, help=f"Fiat deposited every cycle (default: {DEFAULT_DEPOSIT_AMOUNT})", default=DEFAULT_DEPOSIT_AMOUNT)
+    parser.add_argument("--minimum-order-size", type=float, help="Minimum order value in fiat (default: 1.0)", default=1.0)
+    parser.add_argument("--base-increment", help="Order size increment (default: the bot's built-in precision for the coin)")
+    parser.add_argument("--price-increment", help="Order price increment (default: the bot's built-in precision for the coin)")
+    parser.add_argument("--no-cache", action="store_true", help="Parse the candle file even if a cached copy of it is up to date")
+    args = parser.parse_args(argv)
+
+    coin_symbol = args.coin.upper()
+    coin_config = {"minimum_order_size": args.minimum_order_size}
+    if args.base_increment:
+        coin_config["base_increment"] = args.base_increment
+    if args.price_increment:
+        coin_config["price_increment"] = args.price_increment
+
+    candles = load_candles(args.candles, cache=not args.no_cache)
+    report = run_backtest(candles, args, {coin_symbol: coin_config}, coin_symbol)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
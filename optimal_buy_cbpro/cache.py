@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+import json
+import os
+import threading
+import time
+
+
+def cache_path(db_engine, name):
+    # Cache files live next to the SQLite history DB. Other engines (and
+    # in-memory SQLite) get no on-disk cache.
+    if not db_engine or not db_engine.startswith("sqlite:///"):
+        return None
+    db_path = db_engine[len("sqlite:///"):].split("?")[0]
+    if not db_path or db_path == ":memory:":
+        return None
+    return os.path.join(os.path.dirname(db_path), f"cbpro_{name}_cache.json")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(db_engine, name):
+    # One FileCache per file, so hit/miss counters and in-flight revalidations
+    # are shared by everything in this process using the same cache
+    path = cache_path(db_engine, name)
+    if path is None:
+        return None
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = FileCache(path, name)
+        return _caches[path]
+
+
+class FileCache:
+    """JSON file of {key: {"value": ..., "stored_at": unix time}} entries."""
+
+    def __init__(self, path, name="file"):
+        self.path = path
+        self.name = name
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._revalidating = {}
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data):
+        # Write to a temporary file first so a crash never leaves a torn cache
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        entry = self._read().get(key)
+        if not entry:
+            return None, None
+        return entry["value"], entry["stored_at"]
+
+    def put(self, key, value):
+        with self._lock:
+            data = self._read()
+            data[key] = {"value": value, "stored_at": time.time()}
+            self._write(data)
+
+    def invalidate(self, key=None):
+        # Drop one entry, or every entry when no key is given
+        with self._lock:
+            data = self._read()
+            if key is None:
+                data = {}
+            else:
+                data.pop(key, None)
+            self._write(data)
+
+    def fetch(self, key, fetch_fn, ttl, max_staleness):
+        # Fresh entries (younger than `ttl`) are served as is. Stale entries
+        # younger than `max_staleness` are served while a background thread
+        # refreshes them for the next run. Anything older, or missing, has to
+        # be fetched now, and a failed fetch is raised rather than served stale.
+        value, stored_at = self.get(key)
+        age = time.time() - stored_at if stored_at is not None else None
+        if age is not None and age < ttl:
+            self.hits += 1
+            return value
+        if age is not None and age < max_staleness:
+            self.stale_hits += 1
+            print(f"Serving {self.name} cache entry {age:.0f}s old (ttl {ttl}s), revalidating in the background.")
+            self._revalidate(key, fetch_fn)
+            return value
+
+        self.misses += 1
+        try:
+            value = fetch_fn()
+        except Exception as e:
+            if age is not None:
+                raise Exception(
+                    f"Could not refresh {self.name} cache ({e}) and the cached entry is {age:.0f}s old, "
+                    f"past the maximum staleness of {max_staleness}s."
+                ) from e
+            raise
+        self.put(key, value)
+        return value
+
+    def _revalidate(self, key, fetch_fn):
+        with self._lock:
+            thread = self._revalidating.get(key)
+            if thread is not None and thread.is_alive():
+                return
+
+            def refresh():
+                try:
+                    self.put(key, fetch_fn())
+                except Exception as e:
+                    print(f"Background refresh of {self.name} cache failed, keeping the stale entry: {e}")
+
+            # Not a daemon thread: a one-shot run waits for the refresh on exit
+            # so the next run starts with a fresh entry
+            thread = threading.Thread(target=refresh, name=f"{self.name}-cache-revalidate")
+            self._revalidating[key] = thread
+            thread.start()
+
+    def wait(self, timeout=None):
+        for thread in list(self._revalidating.values()):
+            thread.join(timeout)
+
+    def stats(self):
+        return f"{self.name} cache: {self.hits} hits, {self.stale_hits} stale hits, {self.misses} misses"
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Command line entry point. Imports only the standard library and defaults.py
+# until the arguments have been parsed, so --help and argument errors return
+# without loading the Coinbase SDK, requests or SQLAlchemy.
+import argparse
+import json
+import sys
+
+from .defaults import (
+    DEFAULT_ASYNC_WORKERS,
+    DEFAULT_BASE_FEE,
+    DEFAULT_BUY_INTERVAL,
+    DEFAULT_DAEMON_RETRY_DELAY,
+    DEFAULT_DEPOSIT_INTERVAL,
+    DEFAULT_DEPOSIT_POLL_TIMEOUT,
+    DEFAULT_DISCOUNT_STEP,
+    DEFAULT_LADDER_TOLERANCE,
+    DEFAULT_ORDER_COUNT,
+    DEFAULT_ORDER_RATE,
+    DEFAULT_ORDER_SYNC,
+    DEFAULT_ORDER_WORKERS,
+    DEFAULT_PRICE_ANCHOR,
+    DEFAULT_PRICE_SOURCE,
+    DEFAULT_PRICE_TIMEOUT,
+    DEFAULT_PRICE_WORKERS,
+    DEFAULT_PRIVATE_RATE,
+    DEFAULT_PRODUCTS_TTL,
+    DEFAULT_PUBLIC_RATE,
+    DEFAULT_RATE_LIMIT_RETRIES,
+    DEFAULT_REANCHOR_BAND,
+    DEFAULT_RECONCILE_INTERVAL,
+    DEFAULT_STARTING_DISCOUNT,
+    DEFAULT_STREAM_CHANNEL,
+    DEFAULT_TRANSIENT_RETRIES,
+    DEFAULT_WEIGHTS_MAX_STALENESS,
+    DEFAULT_WEIGHTS_TTL,
+    DEFAULT_WITHDRAWAL_FEE_MULTIPLE,
+    DEFAULT_WITHDRAWAL_FEE_TTL,
+    DEFAULT_WITHDRAWAL_THRESHOLD,
+    ORDER_SYNC_MODES,
+    PRICE_ANCHORS,
+    PRICE_SOURCE_NAMES,
+    STREAM_CHANNEL_NAMES,
+)
+
+
+def build_parser():
+    default_coins_str = """
+    {
+      "BTC":{
+        "name":"Bitcoin",
+        "withdrawal_address":null,
+        "external_balance":0
+      },
+      "ETH":{
+        "name":"Ethereum",
+        "withdrawal_address":null,
+        "external_balance":0
+      },
+      "LTC":{
+        "name":"Litecoin",
+        "withdrawal_address":null,
+        "external_balance":0
+      }
+    }
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Coinbase Advanced Trade Bot: Buy coins based on market cap weights or deposit funds.",
+        epilog=f"Default coins configuration: {default_coins_str}",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--mode", choices=['deposit', 'buy', 'reconcile', 'daemon', 'stream'], help="Operational mode: 'deposit', 'buy' or 'reconcile' (sync fills and order statuses into the history DB) run once, 'daemon' stays running and does them on the intervals below, 'stream' buys once and then moves each coin's ladder as its price moves", required=True)
+    parser.add_argument("--amount", type=float, help="Amount for deposit (only in 'deposit' and 'daemon' modes)")
+    parser.add_argument("--key", help="Coinbase API Key (name, e.g., organizations/org-id/apiKeys/key-id)", required=True)
+    parser.add_argument("--secret", help="Coinbase API Secret (the private key string)", required=True)
+    # Passphrase is not used with CDP API keys for Advanced Trade
+    # parser.add_argument("--passphrase", help="API passphrase", required=True) 
+    # API URL is handled by the SDK, using its default or allowing base_url override if necessary,
+    # but for typical use, it's not needed.
+    # parser.add_argument("--api-url", help="API URL", default="https://api.coinbase.com")
+
+    parser.add_argument("--payment-method-id", help="Payment Method ID for fiat deposits (only in 'deposit' and 'daemon' modes)")
+    parser.add_argument("--deposit-account-id", help="Account ID to deposit into (default: the account of --fiat-currency)")
+    parser.add_argument("--deposit-poll-timeout", help=f"Seconds to poll a committed deposit for its final status; later buy cycles check it again once its payout time passes (default: {DEFAULT_DEPOSIT_POLL_TIMEOUT})", type=float, default=DEFAULT_DEPOSIT_POLL_TIMEOUT)
+    parser.add_argument("--wait-for-deposits", action="store_true", help="Skip buy cycles while a deposit is pending, until its payout time; in 'daemon' mode the buy runs again at that time")
+    parser.add_argument("--starting-discount", type=float, help=f"Starting discount for limit buy orders (e.g., 0.005 for 0.5%%, default: {DEFAULT_STARTING_DISCOUNT})", default=DEFAULT_STARTING_DISCOUNT)
+    parser.add_argument("--discount-step", type=float, help=f"Incremental discount step for subsequent buy orders (e.g., 0.01 for 1%%, default: {DEFAULT_DISCOUNT_STEP})", default=DEFAULT_DISCOUNT_STEP)
+    parser.add_argument("--order-count", type=int, help=f"Number of buy orders to split into (default: {DEFAULT_ORDER_COUNT})", default=DEFAULT_ORDER_COUNT)
+    parser.add_argument("--fiat-currency", help="Fiat currency for trading and balances (default: USD)", default="USD")
+    parser.add_argument("--withdrawal-threshold", help=f"If fiat balance (after reserving fees) is below this, withdraw instead of buying (default: {DEFAULT_WITHDRAWAL_THRESHOLD})", type=float, default=DEFAULT_WITHDRAWAL_THRESHOLD)
+    parser.add_argument("--withdrawal-fee-multiple", help=f"Withdraw a coin only once its balance is worth this many network fees (default: {DEFAULT_WITHDRAWAL_FEE_MULTIPLE})", type=float, default=DEFAULT_WITHDRAWAL_FEE_MULTIPLE)
+    parser.add_argument("--withdrawal-fee-ttl", help=f"Seconds to reuse a coin's cached network fee estimate before looking it up again (default: {DEFAULT_WITHDRAWAL_FEE_TTL})", type=float, default=DEFAULT_WITHDRAWAL_FEE_TTL)
+    parser.add_argument("--db-engine", help="SQLAlchemy DB engine string (default: sqlite:///cbpro_history.db)", default="sqlite:///cbpro_history.db")
+    parser.add_argument("--max-retries", help="Max retries of a single API request on server or network errors (default: 3)", type=int, default=DEFAULT_TRANSIENT_RETRIES)
+    parser.add_argument("--buy-interval", help=f"Seconds between buy cycles in 'daemon' mode, 0 to disable (default: {DEFAULT_BUY_INTERVAL})", type=float, default=DEFAULT_BUY_INTERVAL)
+    parser.add_argument("--deposit-interval", help=f"Seconds between deposits in 'daemon' mode, 0 to disable (default: {DEFAULT_DEPOSIT_INTERVAL})", type=float, default=DEFAULT_DEPOSIT_INTERVAL)
+    parser.add_argument("--reconcile-interval", help=f"Seconds between fill reconciliations in 'daemon' mode, 0 to disable (default: {DEFAULT_RECONCILE_INTERVAL})", type=float, default=DEFAULT_RECONCILE_INTERVAL)
+    parser.add_argument("--reanchor-band", help=f"In 'stream' mode, rebuild a coin's ladder once its price moves this fraction away from where the ladder was built (default: {DEFAULT_REANCHOR_BAND})", type=float, default=DEFAULT_REANCHOR_BAND)
+    parser.add_argument("--stream-channel", choices=STREAM_CHANNEL_NAMES, help=f"WebSocket channel 'stream' mode prices come from: 'ticker', or the full 'level2' order book (default: {DEFAULT_STREAM_CHANNEL})", default=DEFAULT_STREAM_CHANNEL)
+    parser.add_argument("--daemon-retry-delay", help=f"Seconds before a failed cycle is retried in 'daemon' mode (default: {DEFAULT_DAEMON_RETRY_DELAY})", type=float, default=DEFAULT_DAEMON_RETRY_DELAY)
+    parser.add_argument("--run-id", help="Identifier the buy orders' client_order_ids are derived from, so rerunning the same run doesn't duplicate orders (default: a new id per run)")
+    parser.add_argument("--coins", help="JSON string for coins to trade, their names, withdrawal addresses, and external balances. A coin may set \"coingecko_id\" to pin its market cap source when its ticker is shared by several coins.", default=default_coins_str)
+    parser.add_argument("--price-source", choices=PRICE_SOURCE_NAMES, help=f"Where to fetch prices from: one bulk best bid/ask call, one bulk product listing, or one ticker request per coin (default: {DEFAULT_PRICE_SOURCE})", default=DEFAULT_PRICE_SOURCE)
+    parser.add_argument("--price-anchor", choices=PRICE_ANCHORS, help=f"Price the discounts are applied to when using the best_bid_ask source (default: {DEFAULT_PRICE_ANCHOR})", default=DEFAULT_PRICE_ANCHOR)
+    parser.add_argument("--price-workers", help=f"Number of concurrent ticker requests when fetching prices (default: {DEFAULT_PRICE_WORKERS})", type=int, default=DEFAULT_PRICE_WORKERS)
+    parser.add_argument("--price-timeout", help=f"Seconds to wait for the ticker requests before reporting unfinished ones as failed (default: {DEFAULT_PRICE_TIMEOUT})", type=float, default=DEFAULT_PRICE_TIMEOUT)
+    parser.add_argument("--weights-ttl", help=f"Seconds to reuse cached CoinGecko market caps before refreshing them (default: {DEFAULT_WEIGHTS_TTL})", type=float, default=DEFAULT_WEIGHTS_TTL)
+    parser.add_argument("--weights-max-staleness", help=f"Seconds after which cached market caps are no longer used if CoinGecko can't be reached (default: {DEFAULT_WEIGHTS_MAX_STALENESS})", type=float, default=DEFAULT_WEIGHTS_MAX_STALENESS)
+    parser.add_argument("--products-ttl", help=f"Seconds to reuse the cached product catalog (minimum sizes, increments, trading status) before refreshing it (default: {DEFAULT_PRODUCTS_TTL})", type=float, default=DEFAULT_PRODUCTS_TTL)
+    parser.add_argument("--order-workers", help=f"Number of buy orders submitted concurrently (default: {DEFAULT_ORDER_WORKERS})", type=int, default=DEFAULT_ORDER_WORKERS)
+    parser.add_argument("--order-rate", help=f"Maximum buy orders submitted per second, 0 for no limit (default: {DEFAULT_ORDER_RATE})", type=float, default=DEFAULT_ORDER_RATE)
+    parser.add_argument("--order-sync", choices=ORDER_SYNC_MODES, help=f"How each buy cycle treats the open orders: 'diff' keeps those matching the new ladder and edits or replaces only the rest, 'replace' cancels them all first (default: {DEFAULT_ORDER_SYNC})", default=DEFAULT_ORDER_SYNC)
+    parser.add_argument("--ladder-tolerance", help=f"With --order-sync diff, relative price and size difference within which an open order is kept as a rung of the new ladder (default: {DEFAULT_LADDER_TOLERANCE})", type=float, default=DEFAULT_LADDER_TOLERANCE)
+    parser.add_argument("--no-edit-orders", dest="edit_orders", action="store_false", help="With --order-sync diff, cancel and place orders instead of editing them in place")
+    parser.add_argument("--private-rate", help=f"Maximum authenticated API requests per second (default: {DEFAULT_PRIVATE_RATE})", type=float, default=DEFAULT_PRIVATE_RATE)
+    parser.add_argument("--public-rate", help=f"Maximum public API requests per second (default: {DEFAULT_PUBLIC_RATE})", type=float, default=DEFAULT_PUBLIC_RATE)
+    parser.add_argument("--rate-limit-retries", help=f"Times a request answered with 429 Too Many Requests is retried (default: {DEFAULT_RATE_LIMIT_RETRIES})", type=int, default=DEFAULT_RATE_LIMIT_RETRIES)
+    parser.add_argument("--engine", choices=["sync", "async"], help="Buy cycle engine: 'sync' runs each step in turn, 'async' fetches products, prices and weights while open orders are listed or cancelled (default: sync)", default="sync")
+    parser.add_argument("--async-workers", help=f"Threads the async engine runs API calls on (default: {DEFAULT_ASYNC_WORKERS})", type=int, default=DEFAULT_ASYNC_WORKERS)
+    parser.add_argument("--base-fee", help=f"Estimated trading fee rate to reserve from fiat balance (e.g., 0.006 for 0.6%%, default: {DEFAULT_BASE_FEE})", type=float, default=DEFAULT_BASE_FEE)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        coins_config = json.loads(args.coins)
+        # Ensure coin symbols are uppercase for consistency
+        coins_config = {k.upper(): v for k,v in coins_config.items()}
+    except json.JSONDecodeError as e:
+        print(f"Error: Invalid JSON string for --coins argument: {e}")
+        sys.exit(1)
+
+    # Only now load the SDK, requests and SQLAlchemy
+    from .optimal_buy_cbpro import run
+    run(args, coins_config)
+
+
+if __name__ == "__main__":
+    main()
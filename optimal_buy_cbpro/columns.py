@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# A minimal columnar file: one JSON header line, padded to a multiple of 8
+# bytes, then every column as raw machine-order array data, one after the
+# other. Used for the backtester's candle cache and the parameter sweep's
+# results; memory mapping one gives zero-copy access to its columns.
+import json
+import mmap
+from array import array
+
+ALIGNMENT = 8
+
+
+def write_columns(path, columns, **metadata):
+    # columns: {name: array}, all the same length; metadata goes in the header
+    lengths = {len(column) for column in columns.values()}
+    if len(lengths) > 1:
+        raise Exception(f"Columns of different lengths: {sorted(lengths)}")
+    header = {
+        **metadata,
+        "count": lengths.pop() if lengths else 0,
+        "columns": [[name, column.typecode] for name, column in columns.items()],
+    }
+    line = json.dumps(header).encode()
+    line += b" " * (-(len(line) + 1) % ALIGNMENT) + b"\n"
+    with open(path, "wb") as f:
+        f.write(line)
+        for column in columns.values():
+            column.tofile(f)
+
+
+def read_header(f):
+    header = json.loads(f.readline())
+    return header, f.tell()
+
+
+def read_columns(path):
+    # (header, {name: array}) read into memory
+    with open(path, "rb") as f:
+        header, _ = read_header(f)
+        columns = {}
+        for name, typecode in header["columns"]:
+            column = array(typecode)
+            column.fromfile(f, header["count"])
+            columns[name] = column
+    return header, columns
+
+
+def map_columns(path):
+    # (header, {name: memoryview}) over a read-only memory map of the file;
+    # processes mapping the same file share its pages
+    with open(path, "rb") as f:
+        header, offset = read_header(f)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    columns = {}
+    for name, typecode in header["columns"]:
+        size = array(typecode).itemsize * header["count"]
+        columns[name] = view[offset:offset + size].cast(typecode)
+        offset += size
+    return header, columns
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Helpers shared by the buy cycle and the modules it calls into, such as
+# withdrawals.py. They live apart from optimal_buy_cbpro.py so those modules
+# can import them at top level without a circular import.
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+# Use different precision for different coins
+DECIMAL_PRECISION_MAP = {
+    'BTC': Decimal('0.00001'),  # 6 decimal places for BTC
+    'ETH': Decimal('0.00001'),  # 6 decimal places for ETH
+    'JASMY': Decimal('1'),     # 1 decimal place for JASMY
+}
+
+# Price precision can be different from size precision for some coins
+PRICE_PRECISION_MAP = {
+    'BTC': Decimal('0.01'),      # 2 decimal places for BTC price
+    'ETH': Decimal('0.01'),      # 2 decimal places for ETH price
+    'JASMY': Decimal('0.00001'), # 6 decimal places for JASMY price
+}
+
+DEFAULT_PRECISION = Decimal('0.00001')  # Default 4 decimal places
+DEFAULT_PRICE_PRECISION = Decimal('0.01')  # Default 2 decimal places for price
+
+# Namespace for the uuid5 client_order_ids of buy orders
+CLIENT_ORDER_ID_NAMESPACE = uuid.UUID("6f0c1f8e-3d5a-4b7e-9a51-2f4b8c1d7e30")
+
+def get_catalog_increment(coins_config, coin_symbol, field):
+    coin_config = (coins_config or {}).get(coin_symbol.upper()) or {}
+    increment = coin_config.get(field)
+    return Decimal(increment) if increment else None
+
+# Size and price increments come from the product catalog merged into
+# coins_config by get_products_info; the maps above are only a fallback
+def get_decimal_precision(coin_symbol, coins_config=None):
+    increment = get_catalog_increment(coins_config, coin_symbol, "base_increment")
+    if increment:
+        return increment
+    return DECIMAL_PRECISION_MAP.get(coin_symbol.upper(), DEFAULT_PRECISION)
+
+def get_price_precision(coin_symbol, coins_config=None):
+    increment = get_catalog_increment(coins_config, coin_symbol, "price_increment")
+    if increment:
+        return increment
+    return PRICE_PRECISION_MAP.get(coin_symbol.upper(), DEFAULT_PRICE_PRECISION)
+
+def get_account_by_currency(accounts_response, currency_symbol):
+    if accounts_response and accounts_response.accounts:
+        for acc in accounts_response.accounts:
+            if acc.currency == currency_symbol:
+                return acc
+    return None
+
+
+def new_run_id():
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{uuid.uuid4().hex[:8]}"
+
+
+def make_client_order_id(run_id, coin_symbol, rung):
+    # The same run, coin and rung always map to the same id, so a resubmitted
+    # order is recognised by the exchange instead of being placed twice
+    return str(uuid.uuid5(CLIENT_ORDER_ID_NAMESPACE, f"{run_id}:{coin_symbol}:{rung}"))
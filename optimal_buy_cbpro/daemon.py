@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import copy
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from .cache import get_cache
+from .defaults import DEFAULT_BUY_INTERVAL, DEFAULT_DAEMON_RETRY_DELAY, DEFAULT_DEPOSIT_INTERVAL, DEFAULT_RECONCILE_INTERVAL
+from .optimal_buy_cbpro import buy_cycle, deposit
+from .reconcile import reconcile
+
+
+class Job:
+    def __init__(self, name, interval, fn):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.next_run = None
+
+
+class Scheduler:
+    """Runs jobs at fixed intervals. The last successful start of every job is
+    kept in `state_cache`, so a restarted daemon picks up the cadence where it
+    left off instead of running everything again straight away."""
+
+    def __init__(self, state_cache=None, retry_delay=DEFAULT_DAEMON_RETRY_DELAY, clock=time.time):
+        self.jobs = []
+        self.state_cache = state_cache
+        self.retry_delay = retry_delay
+        self.clock = clock
+
+    def add(self, name, interval, fn):
+        job = Job(name, interval, fn)
+        last_run = None
+        if self.state_cache is not None:
+            state, _ = self.state_cache.get(name)
+            last_run = state["started_at"] if state else None
+        now = self.clock()
+        job.next_run = max(last_run + interval, now) if last_run is not None else now
+        self.jobs.append(job)
+        print(f"Scheduled {name} every {interval}s, next run in {job.next_run - now:.0f}s.")
+        return job
+
+    def next_job(self):
+        return min(self.jobs, key=lambda job: job.next_run) if self.jobs else None
+
+    def run_job(self, job):
+        started_at = self.clock()
+        print(f"\n=== Starting {job.name} cycle ===")
+        try:
+            # A job may return a timestamp to run again at, if sooner
+            run_again_at = job.fn()
+        except Exception as e:
+            print(f"{job.name} cycle failed: {e}")
+            traceback.print_exc()
+            job.next_run = started_at + min(self.retry_delay, job.interval)
+            print(f"Retrying {job.name} in {job.next_run - started_at:.0f}s.")
+            return False
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        if self.state_cache is not None:
+            self.state_cache.put(job.name, {"started_at": started_at})
+        # Keep the cadence anchored to the start times, without bursting to
+        # catch up on intervals missed while a cycle overran
+        job.next_run = max(job.next_run + job.interval, started_at + job.interval)
+        if run_again_at is not None:
+            job.next_run = min(job.next_run, run_again_at)
+        print(f"=== {job.name} cycle done in {self.clock() - started_at:.1f}s, next run in {job.next_run - self.clock():.0f}s ===")
+        return True
+
+    def run_pending(self):
+        ran = []
+        for job in sorted(self.jobs, key=lambda job: job.next_run):
+            if job.next_run <= self.clock():
+                self.run_job(job)
+                ran.append(job.name)
+        return ran
+
+    def run_forever(self, stop_event):
+        while not stop_event.is_set():
+            job = self.next_job()
+            if job is None:
+                return
+            delay = job.next_run - self.clock()
+            if delay > 0:
+                # Woken early by a stop request; otherwise loops to run the job
+                stop_event.wait(delay)
+                continue
+            self.run_job(job)
+
+
+def install_stop_handlers(stop_event):
+    # SIGTERM from systemd/docker stop lets the current cycle finish
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    def stop(signum, frame):
+        print(f"Received signal {signum}, stopping after the current cycle.")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+
+def build_scheduler(args, coins_config, client, db_session):
+    buy_interval = getattr(args, "buy_interval", DEFAULT_BUY_INTERVAL)
+    deposit_interval = getattr(args, "deposit_interval", DEFAULT_DEPOSIT_INTERVAL)
+    reconcile_interval = getattr(args, "reconcile_interval", DEFAULT_RECONCILE_INTERVAL)
+    if deposit_interval and (args.amount is None or args.payment_method_id is None):
+        raise Exception("--deposit-interval needs --amount and --payment-method-id")
+    if not buy_interval and not deposit_interval and not reconcile_interval:
+        raise Exception("Nothing to schedule: --buy-interval, --deposit-interval and --reconcile-interval are all 0")
+
+    def cycle_args():
+        # A new run id every cycle; a fixed --run-id would make every cycle's
+        # client_order_ids collide with the first one's
+        cycle = copy.copy(args)
+        cycle.run_id = None
+        return cycle
+
+    def run_cycle(fn):
+        def job():
+            try:
+                return fn(cycle_args(), client, db_session)
+            except Exception:
+                # Leave the long-lived session usable for the next cycle
+                db_session.rollback()
+                raise
+            finally:
+                print(client.stats())
+        return job
+
+    scheduler = Scheduler(
+        state_cache=get_cache(getattr(args, "db_engine", None), "schedule"),
+        retry_delay=getattr(args, "daemon_retry_delay", DEFAULT_DAEMON_RETRY_DELAY),
+    )
+    # Deposits first, so a buy due at the same moment sees the new funds
+    if deposit_interval:
+        scheduler.add("deposit", deposit_interval, run_cycle(deposit))
+    if buy_interval:
+        scheduler.add("buy", buy_interval, run_cycle(
+            lambda cycle, client, db_session: buy_cycle(cycle, coins_config, client, db_session)
+        ))
+    if reconcile_interval:
+        scheduler.add("reconcile", reconcile_interval, run_cycle(reconcile))
+    return scheduler
+
+
+def run_daemon(args, coins_config, client, db_session, stop_event=None):
+    # The client (and its connection pool and rate limiters), DB session and
+    # caches are created once and shared by every cycle
+    stop_event = stop_event or threading.Event()
+    install_stop_handlers(stop_event)
+    scheduler = build_scheduler(args, coins_config, client, db_session)
+    print("Daemon started.")
+    sys.stdout.flush()
+    scheduler.run_forever(stop_event)
+    print("Daemon stopped.")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Defaults of every tunable the command line exposes. Kept free of third-party
+# imports so the CLI can build its parser (and answer --help or reject bad
+# arguments) without loading the Coinbase SDK, requests or SQLAlchemy.
+
+# The buy ladder and the cash it is built from (also the backtest's defaults)
+DEFAULT_STARTING_DISCOUNT = 0.005
+DEFAULT_DISCOUNT_STEP = 0.01
+DEFAULT_ORDER_COUNT = 5
+DEFAULT_WITHDRAWAL_THRESHOLD = 25.0
+DEFAULT_BASE_FEE = 0.0060  # Typical taker fee
+
+# Concurrent ticker fetching in get_prices
+DEFAULT_PRICE_WORKERS = 8
+DEFAULT_PRICE_TIMEOUT = 10.0  # Seconds to wait for all ticker requests
+
+# Price the ladder discounts are applied to: midpoint of the best bid and ask,
+# or the best bid itself (the more conservative anchor for buy orders)
+PRICE_ANCHORS = ("mid", "bid")
+DEFAULT_PRICE_ANCHOR = "mid"
+PRICE_SOURCE_NAMES = ("best_bid_ask", "products", "ticker")  # See prices.PRICE_SOURCES
+DEFAULT_PRICE_SOURCE = "best_bid_ask"
+
+# Coinbase Advanced Trade allows 30 requests/s on private (authenticated)
+# endpoints and 10/s on public ones; stay a little under both
+DEFAULT_PRIVATE_RATE = 25.0
+DEFAULT_PUBLIC_RATE = 8.0
+DEFAULT_RATE_LIMIT_RETRIES = 5
+DEFAULT_RATE_LIMIT_BACKOFF = 0.5  # Seconds, doubled on every retry
+# Server errors and dropped connections are retried too, request by request.
+# Orders carry deterministic client_order_ids, so resending one is safe.
+DEFAULT_TRANSIENT_RETRIES = 3
+
+# CoinGecko market caps barely move between runs, so they are cached next to the
+# history DB (see cache.py)
+DEFAULT_WEIGHTS_TTL = 3600.0  # Seconds before cached market caps are refreshed
+DEFAULT_WEIGHTS_MAX_STALENESS = 86400.0  # Seconds after which cached market caps are refused
+
+# Order submission: limit orders are sent from a worker pool, throttled to
+# stay under the private endpoint rate limit
+DEFAULT_ORDER_WORKERS = 4
+DEFAULT_ORDER_RATE = 10.0  # Orders per second
+
+# How a buy cycle treats the open orders: "diff" keeps those already close
+# enough to a rung of the new ladder and edits or replaces only the rest;
+# "replace" cancels them all and places the whole ladder again
+ORDER_SYNC_MODES = ("diff", "replace")
+DEFAULT_ORDER_SYNC = "diff"
+# Relative price and size difference within which an open order counts as
+# already matching a rung; a quarter of the default discount step
+DEFAULT_LADDER_TOLERANCE = 0.0025
+
+# The product catalog (see get_products_info) is cached next to the history DB and
+# refreshed daily, or right after an order is rejected
+DEFAULT_PRODUCTS_TTL = 86400.0  # Seconds
+
+# Blocking SDK calls in the async engine run on this many threads; it also
+# bounds how many requests the async engine has in flight
+DEFAULT_ASYNC_WORKERS = 8
+
+# Deposits are polled (with backoff) for up to this many seconds after they
+# are committed; bank transfers take days to clear, so one that is still
+# pending then is looked up again by later buy cycles once its payout time passes
+DEFAULT_DEPOSIT_POLL_TIMEOUT = 60.0
+
+# A coin is withdrawn once its balance is worth this many network fees (so a
+# fee costs at most 2% of what is sent); fee estimates are cached next to the
+# history DB
+DEFAULT_WITHDRAWAL_FEE_MULTIPLE = 50.0
+DEFAULT_WITHDRAWAL_FEE_TTL = 86400.0  # Seconds
+DEFAULT_WITHDRAWAL_FEE_MAX_STALENESS = 7 * 86400.0  # Seconds
+
+# Daemon mode cadences, in seconds; 0 disables a job
+DEFAULT_BUY_INTERVAL = 86400
+DEFAULT_DEPOSIT_INTERVAL = 0
+DEFAULT_RECONCILE_INTERVAL = 3600
+# A failed cycle is tried again after this long rather than a whole interval later
+DEFAULT_DAEMON_RETRY_DELAY = 300
+
+# Streaming mode: a coin's ladder is rebuilt once its price moves this far
+# (either way) from the price the ladder was built at
+DEFAULT_REANCHOR_BAND = 0.01
+STREAM_CHANNEL_NAMES = ("ticker", "level2")
+DEFAULT_STREAM_CHANNEL = "ticker"
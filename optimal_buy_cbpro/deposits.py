@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# Fiat deposits through the v2 API, which the SDK doesn't wrap: a deposit is
+# created from a payment method, committed, then polled with backoff until it
+# clears or the poll times out. The history keeps its status and payout_at,
+# so a buy cycle can tell cash that is still on its way from cash it can spend.
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from .defaults import DEFAULT_DEPOSIT_POLL_TIMEOUT
+from .history import Deposit, to_decimal
+from .signing import get_raw_client
+
+FINAL_DEPOSIT_STATUSES = ("completed", "canceled")
+# Poll delays double from the first to the last, until the poll timeout
+DEPOSIT_POLL_INITIAL_DELAY = 1.0  # Seconds
+DEPOSIT_POLL_MAX_DELAY = 16.0  # Seconds
+
+
+def deposits_path(account_id, deposit_id=None, action=None):
+    path = f"/v2/accounts/{account_id}/deposits"
+    if deposit_id:
+        path += f"/{deposit_id}"
+    if action:
+        path += f"/{action}"
+    return path
+
+
+def parse_time(value):
+    # v2 timestamps end in "Z"; stored as naive UTC like the other DateTime columns
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def utc_naive(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def fiat_account_id(args, client):
+    # The v2 account of the fiat currency; its id is the v3 account uuid
+    account_id = getattr(args, "deposit_account_id", None)
+    if account_id:
+        return account_id
+    accounts_response = client.get_accounts()
+    for account in accounts_response.accounts or []:
+        if account.currency == args.fiat_currency.upper():
+            return account.uuid
+    raise Exception(f"No {args.fiat_currency.upper()} account to deposit into")
+
+
+def create_deposit(raw, account_id, amount, currency, payment_method_id):
+    return raw.post(
+        deposits_path(account_id),
+        json={"amount": str(amount), "currency": currency, "payment_method": payment_method_id, "commit": False},
+    )["data"]
+
+
+def commit_deposit(raw, account_id, deposit_id):
+    return raw.post(deposits_path(account_id, deposit_id, "commit"))["data"]
+
+
+def get_deposit(raw, account_id, deposit_id):
+    return raw.get(deposits_path(account_id, deposit_id))["data"]
+
+
+def poll_deposit(raw, account_id, data, timeout, sleep=time.sleep, clock=time.monotonic):
+    # The deposit's latest state: once final, or when the timeout runs out
+    deadline = clock() + timeout
+    delay = DEPOSIT_POLL_INITIAL_DELAY
+    while data.get("status") not in FINAL_DEPOSIT_STATUSES:
+        remaining = deadline - clock()
+        if remaining <= 0:
+            break
+        sleep(min(delay, remaining))
+        delay = min(delay * 2, DEPOSIT_POLL_MAX_DELAY)
+        data = get_deposit(raw, account_id, data["id"])
+        print(f"Deposit {data['id']} is {data.get('status')}.")
+    return data
+
+
+def update_deposit(row, data):
+    row.status = data.get("status") or row.status
+    row.payout_at = parse_time(data.get("payout_at")) or row.payout_at
+
+
+def make_deposit(args, client, db_session, raw=None, sleep=time.sleep, clock=time.monotonic):
+    raw = raw or get_raw_client(args.key, args.secret)
+    currency = args.fiat_currency.upper()
+    account_id = fiat_account_id(args, client)
+
+    created = create_deposit(raw, account_id, args.amount, currency, args.payment_method_id)
+    print(f"Created deposit {created['id']}, committing it.")
+    try:
+        committed = commit_deposit(raw, account_id, created["id"])
+    except Exception as e:
+        raise Exception(f"Deposit {created['id']} was created but not committed: {e}") from e
+
+    # Recorded as soon as it's committed, so a failed poll doesn't lose it
+    amount = (committed.get("amount") or {}).get("amount", args.amount)
+    row = Deposit(
+        currency=currency,
+        amount=to_decimal(amount),
+        payment_method_id=args.payment_method_id,
+        cbpro_deposit_id=committed["id"],
+    )
+    update_deposit(row, committed)
+    db_session.add(row)
+    db_session.commit()
+    print(f"Committed deposit {row.cbpro_deposit_id} of {row.amount} {currency}, payout at {row.payout_at}.")
+
+    timeout = getattr(args, "deposit_poll_timeout", DEFAULT_DEPOSIT_POLL_TIMEOUT)
+    if timeout > 0:
+        try:
+            update_deposit(row, poll_deposit(raw, account_id, committed, timeout, sleep, clock))
+            db_session.commit()
+        except Exception as e:
+            # The deposit is made; raising would have the daemon make another.
+            # refresh_pending_deposits looks its status up again later.
+            print(f"Error polling deposit {row.cbpro_deposit_id}: {e}")
+            db_session.rollback()
+    print(f"Deposit {row.cbpro_deposit_id} is {row.status}.")
+    return row
+
+
+def pending_deposits(db_session, currency):
+    return list(db_session.scalars(
+        select(Deposit)
+        .where(Deposit.currency == currency)
+        .where(Deposit.status.is_not(None))
+        .where(Deposit.status.not_in(FINAL_DEPOSIT_STATUSES))
+        .order_by(Deposit.payout_at)
+    ))
+
+
+def refresh_pending_deposits(args, client, db_session, raw=None, now=None):
+    # Pending deposits that haven't cleared. Only those past their payout_at
+    # are looked up again; the others can't have cleared yet, which costs no
+    # API call at all.
+    currency = args.fiat_currency.upper()
+    pending = pending_deposits(db_session, currency)
+    now = utc_naive(now or datetime.now(timezone.utc))
+    due = [row for row in pending if row.payout_at is None or row.payout_at <= now]
+    if due:
+        raw = raw or get_raw_client(args.key, args.secret)
+        account_id = fiat_account_id(args, client)
+        for row in due:
+            try:
+                update_deposit(row, get_deposit(raw, account_id, row.cbpro_deposit_id))
+            except Exception as e:
+                print(f"Error refreshing deposit {row.cbpro_deposit_id}: {e}")
+        db_session.commit()
+    return [row for row in pending if row.status not in FINAL_DEPOSIT_STATUSES]
+
+
+def deposit_hold(args, client, db_session, raw=None, now=None):
+    # Checked before a buy cycle: prints the deposits still on their way and,
+    # with --wait-for-deposits, returns the payout time to wait for, when the
+    # cycle is better skipped than run on a balance that hasn't cleared
+    now = utc_naive(now or datetime.now(timezone.utc))
+    pending = refresh_pending_deposits(args, client, db_session, raw, now)
+    if not pending:
+        return None
+    total = sum(row.amount for row in pending)
+    print(f"{len(pending)} deposits totalling {total} {args.fiat_currency.upper()} haven't cleared yet.")
+    upcoming = [row.payout_at for row in pending if row.payout_at is not None and row.payout_at > now]
+    if not upcoming or not getattr(args, "wait_for_deposits", False):
+        return None
+    return min(upcoming).replace(tzinfo=timezone.utc)
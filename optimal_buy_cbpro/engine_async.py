@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .defaults import DEFAULT_ASYNC_WORKERS
+from .optimal_buy_cbpro import (
+    buy_with_balances,
+    get_configured_prices,
+    get_configured_products_info,
+    get_configured_weights,
+    new_run_id,
+    prepare_open_orders,
+)
+
+
+async def async_buy(args, coins_config, client, db_session, max_workers=DEFAULT_ASYNC_WORKERS):
+    # Same cycle as buy(), but the steps that don't depend on each other run
+    # concurrently: products, prices and CoinGecko weights are fetched while the
+    # open orders are being listed or cancelled. Only the account balances have
+    # to wait for that step, since cancelling releases the funds held by those
+    # orders and listing tells how much they hold.
+    run_id = getattr(args, "run_id", None) or new_run_id()
+    print(f"Starting async buy and (maybe) withdrawal process, run id {run_id}.")
+    loop = asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async-buy") as executor:
+        def run(fn, *fn_args, **fn_kwargs):
+            return loop.run_in_executor(executor, partial(fn, *fn_args, **fn_kwargs))
+
+        products_task = run(get_configured_products_info, args, coins_config, client)
+        prices_task = run(get_configured_prices, args, list(coins_config.keys()), client)
+        weights_task = run(get_configured_weights, args, coins_config)
+
+        try:
+            open_orders = await run(prepare_open_orders, args, coins_config, client)
+        except Exception as e:
+            print(f"Error listing open orders: {e}. Aborting buy cycle.")
+            await asyncio.gather(products_task, prices_task, weights_task, return_exceptions=True)
+            return
+        accounts_task = run(client.get_accounts)
+
+        print("\nStep 2: Fetching current account balances and market prices.")
+        try:
+            accounts_response, coins_config_updated, prices = await asyncio.gather(
+                accounts_task, products_task, prices_task
+            )
+        except Exception as e:
+            print(f"Critical error fetching accounts/products/prices: {e}. Aborting buy cycle.")
+            # Let the weights request finish before the executor shuts down
+            await asyncio.gather(weights_task, return_exceptions=True)
+            return
+
+        try:
+            weights = await weights_task
+        except Exception as e:
+            # buy_with_balances fetches them again if it turns out to need them
+            print(f"Error fetching weights concurrently: {e}")
+            weights = None
+
+        await run(
+            buy_with_balances,
+            args,
+            coins_config_updated,
+            accounts_response,
+            prices,
+            client,
+            db_session,
+            run_id,
+            weights=weights,
+            open_orders=open_orders,
+        )
+
+
+def run_async_buy(args, coins_config, client, db_session):
+    asyncio.run(async_buy(args, coins_config, client, db_session, getattr(args, "async_workers", DEFAULT_ASYNC_WORKERS)))
@@ -1,47 +1,479 @@
 #!/usr/bin/env python3
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, String, Float, DateTime, Integer
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from sqlalchemy import Column, String, Float, DateTime, Integer, Numeric, TypeDecorator
+from sqlalchemy import create_engine, delete, event, func, insert, inspect, literal, select, true, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, column_property, declarative_base, sessionmaker
 
 Base = declarative_base()
 
+# Bump whenever the models change, so existing databases are migrated once
+# instead of being inspected on every start
+SCHEMA_VERSION = 3
+
+# Set on every new SQLite connection. WAL lets readers (a report, the ledger
+# check) run while the buy cycle writes, and commits only sync at checkpoints;
+# writers that do collide wait instead of failing with "database is locked".
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", SQLITE_BUSY_TIMEOUT_MS),
+)
+
+
+class ExactDecimal(TypeDecorator):
+    """NUMERIC(38, 18) holding Decimal values. SQLite has no exact decimal type
+    (its NUMERIC columns store REAL) and its integers stop at 19 digits, so
+    there the value is kept as plain decimal text instead. Sums go through the
+    decimal_sum() aggregate and decimal_add() function registered on every
+    SQLite connection (see sum_by_currency and add_to_ledger); SQL
+    comparisons and ORDER BY on these columns would be textual there, so the
+    code doesn't filter or sort on them in SQL."""
+
+    impl = Numeric(38, 18)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(String(40))
+        return dialect.type_descriptor(Numeric(38, 18, asdecimal=True))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        value = to_decimal(value)
+        return format(value, "f") if dialect.name == "sqlite" else value
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return Decimal(value)
+
+
+def to_decimal(value):
+    # Floats go through str(), as everywhere else amounts are converted
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
 
 class Order(Base):
     __tablename__ = "orders"
 
     id = Column(Integer, primary_key=True)
-    currency = Column(String)
-    price = Column(Float)
-    size = Column(Float)
+    currency = Column(String, index=True)
+    price = Column(ExactDecimal)
+    size = Column(ExactDecimal)
     cbpro_order_id = Column(String)
-    created_at = Column(DateTime)
+    created_at = Column(DateTime, index=True)
 
 
 class Withdrawal(Base):
     __tablename__ = "withdrawals"
 
     id = Column(Integer, primary_key=True)
-    currency = Column(String)
-    amount = Column(Float)
+    currency = Column(String, index=True)
+    amount = Column(ExactDecimal)
     crypto_address = Column(String)
     cbpro_withdrawal_id = Column(String)
+    created_at = Column(DateTime, index=True, default=utcnow)
+    # The v2 send's status when it was made, and the network fee it paid
+    # (see withdrawals.py). active_history keeps the old status around when it
+    # changes, for update_ledger.
+    status = column_property(Column(String), active_history=True)
+    network_fee = Column(ExactDecimal)
 
 
 class Deposit(Base):
     __tablename__ = "deposits"
 
     id = Column(Integer, primary_key=True)
-    currency = Column(String)
-    amount = Column(Float)
+    currency = Column(String, index=True)
+    amount = Column(ExactDecimal)
     payment_method_id = Column(String)
     payout_at = Column(DateTime)
     cbpro_deposit_id = Column(String)
+    created_at = Column(DateTime, index=True, default=utcnow)
+    # The v2 transfer status ("created" until the funds clear, then
+    # "completed" or "canceled"; see deposits.py)
+    status = column_property(Column(String, index=True), active_history=True)
+
+
+class Fill(Base):
+    # Fills as reported by the exchange (see reconcile.py), one row per fill entry
+    __tablename__ = "fills"
+
+    entry_id = Column(String, primary_key=True)
+    trade_id = Column(String)
+    cbpro_order_id = Column(String, index=True)
+    product_id = Column(String)
+    currency = Column(String, index=True)
+    side = Column(String)
+    price = Column(ExactDecimal)
+    size = Column(ExactDecimal)
+    commission = Column(ExactDecimal)
+    trade_time = Column(DateTime, index=True)
+    sequence_timestamp = Column(String)
+
+
+class OrderStatus(Base):
+    # Latest known exchange status of each placed order (see reconcile.py)
+    __tablename__ = "order_statuses"
+
+    cbpro_order_id = Column(String, primary_key=True)
+    product_id = Column(String)
+    status = Column(String, index=True)
+    filled_size = Column(ExactDecimal)
+    average_filled_price = Column(ExactDecimal)
+    total_fees = Column(ExactDecimal)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
+
+
+class SyncCursor(Base):
+    # Where each reconciliation stream left off, as JSON
+    __tablename__ = "sync_cursors"
+
+    name = Column(String, primary_key=True)
+    state = Column(String)
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+
+
+class Balance(Base):
+    # The balance ledger: one running total per currency and account
+    # ("withdrawn", "deposited", "filled"), kept up to date as history rows are added so
+    # reading balances doesn't aggregate the whole history
+    __tablename__ = "balances"
+
+    currency = Column(String, primary_key=True)
+    account = Column(String, primary_key=True)
+    total = Column(ExactDecimal, nullable=False)
+
+
+# History rows that feed the ledger: model -> (ledger account, amount column)
+LEDGER_ACCOUNTS = {
+    Withdrawal: ("withdrawn", Withdrawal.amount),
+    Deposit: ("deposited", Deposit.amount),
+    # Base currency size filled; the bot only places buys
+    Fill: ("filled", Fill.size),
+}
+# Statuses of deposits and withdrawals that never moved any money. Such rows
+# stay in the history but are left out of the ledger.
+VOID_STATUSES = ("canceled", "failed", "expired")
+
+
+def counts_in_ledger(row):
+    return getattr(row, "status", None) not in VOID_STATUSES
+
+
+def counted_rows(model):
+    # The SQL side of counts_in_ledger, for aggregating the history
+    if not hasattr(model, "status"):
+        return true()
+    return model.status.is_(None) | model.status.not_in(VOID_STATUSES)
+
+
+def add_to_ledger(db_session, currency, account, amount):
+    # Adds amount to a running total in the session's current transaction.
+    # Rows added through the session are counted automatically (see
+    # update_ledger); bulk inserts that bypass the ORM call this directly.
+    # The total is moved by one UPDATE ... SET total = total + amount, so
+    # writers sharing the database (the daemon, reconcile, a manual run) can't
+    # overwrite each other's updates with a total they read earlier.
+    connection = db_session.connection()
+    amount = to_decimal(amount)
+    delta = literal(amount, ExactDecimal)
+    if connection.dialect.name == "sqlite":
+        new_total = func.decimal_add(Balance.total, delta, type_=ExactDecimal)
+    else:
+        new_total = Balance.total + delta
+    add = update(Balance).where(Balance.currency == currency, Balance.account == account).values(total=new_total)
+    if connection.execute(add).rowcount:
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(Balance).values(currency=currency, account=account, total=amount))
+    except IntegrityError:
+        # Another writer started this total in the meantime
+        connection.execute(add)
+
+
+@event.listens_for(Session, "before_flush")
+def update_ledger(db_session, flush_context, instances):
+    # New and deleted history rows move the ledger within the same flush, so
+    # the totals commit or roll back together with the rows, and so does a
+    # row whose status turns void (or back). Amounts edited in place aren't
+    # tracked; check_ledger() finds those.
+    deltas = {}
+
+    def move(row, sign):
+        account, column = LEDGER_ACCOUNTS[type(row)]
+        amount = getattr(row, column.key)
+        if row.currency is None or amount is None:
+            return
+        key = (row.currency, account)
+        deltas[key] = deltas.get(key, Decimal(0)) + sign * to_decimal(amount)
+
+    for rows, sign in ((db_session.new, 1), (db_session.deleted, -1)):
+        for row in rows:
+            if type(row) in LEDGER_ACCOUNTS and counts_in_ledger(row):
+                move(row, sign)
+    for row in db_session.dirty:
+        if type(row) not in LEDGER_ACCOUNTS or not hasattr(row, "status"):
+            continue
+        history = inspect(row).attrs.status.history
+        if not history.deleted:
+            continue
+        was_counted = history.deleted[0] not in VOID_STATUSES
+        if was_counted != counts_in_ledger(row):
+            move(row, -1 if was_counted else 1)
+    for (currency, account), amount in deltas.items():
+        add_to_ledger(db_session, currency, account, amount)
 
 
-def get_session(engine):
-    engine = create_engine(engine)
+def ledger_totals(db_session, account):
+    # {CURRENCY: Decimal} for one ledger account, read from the ledger alone
+    totals = {}
+    for currency, total in db_session.execute(select(Balance.currency, Balance.total).where(Balance.account == account)):
+        totals[currency.upper()] = totals.get(currency.upper(), Decimal(0)) + total
+    return totals
+
+
+def raw_totals(db_session):
+    # {(currency, account): Decimal} aggregated from the history rows
+    totals = {}
+    for account, column in LEDGER_ACCOUNTS.values():
+        for currency, total in sum_by_currency(db_session, column).items():
+            if currency is not None:
+                totals[(currency, account)] = total
+    return totals
+
+
+def check_ledger(db_session):
+    # Compares every running total with the history rows; returns the
+    # mismatches as [(currency, account, ledger total, history total)]
+    ledger = {(currency, account): total for currency, account, total in db_session.execute(select(Balance.currency, Balance.account, Balance.total))}
+    raw = raw_totals(db_session)
+    mismatches = []
+    for key in sorted(ledger.keys() | raw.keys()):
+        ledger_total = ledger.get(key, Decimal(0))
+        raw_total = raw.get(key, Decimal(0))
+        if ledger_total != raw_total:
+            mismatches.append((*key, ledger_total, raw_total))
+    return mismatches
+
+
+def rebuild_ledger(db_session):
+    # Replaces the running totals with ones aggregated from the history rows;
+    # the caller commits
+    db_session.execute(delete(Balance))
+    for (currency, account), total in raw_totals(db_session).items():
+        db_session.add(Balance(currency=currency, account=account, total=total))
+    db_session.flush()
+
+
+def outdated_columns(inspector, table):
+    # Columns that tables written by older versions lack (created_at) or hold
+    # as Float (amounts), as ([missing], [float])
+    columns = {c["name"]: c["type"] for c in inspector.get_columns(table.name)}
+    missing = [c for c in table.columns if c.name not in columns]
+    floats = [
+        c for c in table.columns
+        if c.name in columns and isinstance(c.type, ExactDecimal) and isinstance(columns[c.name], Float)
+    ]
+    return missing, floats
+
+
+def rebuild_table(connection, table, existing_columns):
+    # SQLite can't change a column's type in place: rename the table, create
+    # the new one, copy the rows and drop the old table. Floats are copied
+    # through repr(), the shortest string that reads back as the same float,
+    # which is the value that was meant to be stored.
+    old_name = f"{table.name}_old"
+    connection.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {old_name}")
+    table.create(connection)
+    copied = [c for c in table.columns if c.name in existing_columns]
+    rows = connection.exec_driver_sql(f"SELECT {', '.join(c.name for c in copied)} FROM {old_name}").fetchall()
+    values = []
+    for row in rows:
+        value = {}
+        for column, cell in zip(copied, row):
+            if isinstance(column.type, ExactDecimal) and isinstance(cell, (int, float)):
+                cell = Decimal(repr(cell))
+            elif isinstance(column.type, DateTime) and isinstance(cell, str):
+                cell = datetime.fromisoformat(cell)
+            value[column.name] = cell
+        values.append(value)
+    if values:
+        connection.execute(table.insert(), values)
+    connection.exec_driver_sql(f"DROP TABLE {old_name}")
+    return len(values)
+
+
+def alter_table(connection, table, missing, floats):
+    dialect = connection.dialect
+    for column in missing:
+        connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}")
+    for column in floats:
+        column_type = column.type.compile(dialect=dialect)
+        if dialect.name == "postgresql":
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE {column_type} USING {column.name}::numeric"
+            )
+        elif dialect.name in ("mysql", "mariadb"):
+            connection.exec_driver_sql(f"ALTER TABLE {table.name} MODIFY {column.name} {column_type}")
+        else:
+            raise Exception(
+                f"Don't know how to change {table.name}.{column.name} to {column_type} on {dialect.name}; "
+                "please migrate this column by hand."
+            )
+
+
+def migrate(engine):
+    # Brings tables created by older versions up to the current models (exact
+    # decimal amounts, created_at, indexes); a no-op once they match
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            missing, floats = outdated_columns(inspector, table)
+            if floats and connection.dialect.name == "sqlite":
+                existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+                rows = rebuild_table(connection, table, existing_columns)
+                print(f"Migrated {rows} rows of {table.name} to exact decimal columns.")
+            elif missing or floats:
+                alter_table(connection, table, missing, floats)
+                print(f"Migrated {table.name}: added {[c.name for c in missing]}, exact decimal {[c.name for c in floats]}.")
+            inspector = inspect(connection)
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
     Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    return session
+    if Balance.__tablename__ not in existing_tables and existing_tables:
+        # First run with the ledger on an existing database: start it from the history
+        with Session(engine) as db_session:
+            rebuild_ledger(db_session)
+            db_session.commit()
+            print("Built the balance ledger from the existing history.")
+
+
+def sum_by_currency(db_session, column):
+    # Exact per-currency totals of an ExactDecimal column, as {currency: Decimal},
+    # over the rows that count in the ledger. SQLite's SUM() works in floating
+    # point, so there decimal_sum() is used instead; other databases sum
+    # NUMERIC exactly.
+    model = column.class_
+    if db_session.get_bind().dialect.name == "sqlite":
+        total = func.decimal_sum(column, type_=ExactDecimal)
+    else:
+        total = func.sum(column)
+    rows = db_session.execute(select(model.currency, total).where(counted_rows(model)).group_by(model.currency))
+    return {currency: total or Decimal(0) for currency, total in rows}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+class DecimalSum:
+    # SUM() over ExactDecimal text, in Decimal; SQLite's own SUM() converts
+    # the text to floating point
+    def __init__(self):
+        self.total = None
+
+    def step(self, value):
+        if value is not None:
+            self.total = (self.total or Decimal(0)) + to_decimal(value)
+
+    def finalize(self):
+        return None if self.total is None else format(self.total, "f")
+
+
+def decimal_add(a, b):
+    return format(to_decimal(a) + to_decimal(b), "f")
+
+
+def register_sqlite_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_aggregate("decimal_sum", 1, DecimalSum)
+    dbapi_connection.create_function("decimal_add", 2, decimal_add, deterministic=True)
+
+
+def create_db_engine(db_engine):
+    engine = create_engine(db_engine, pool_pre_ping=not db_engine.startswith("sqlite"))
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", set_sqlite_pragmas)
+        event.listen(engine, "connect", register_sqlite_functions)
+    return engine
+
+
+def schema_version(engine):
+    with engine.connect() as connection:
+        if not inspect(connection).has_table(SchemaVersion.__tablename__):
+            return None
+        return connection.scalar(select(func.max(SchemaVersion.version)))
+
+
+def ensure_schema(engine):
+    # Migrates and creates tables only when the stored version is behind
+    if schema_version(engine) == SCHEMA_VERSION:
+        return
+    migrate(engine)
+    with Session(engine) as db_session:
+        db_session.execute(delete(SchemaVersion))
+        db_session.add(SchemaVersion(version=SCHEMA_VERSION))
+        db_session.commit()
+
+
+_session_factories = {}
+_session_factories_lock = threading.Lock()
+
+
+def get_session_factory(db_engine):
+    # One engine (and connection pool) per database for the whole process; the
+    # schema is checked when it is first opened. In-memory SQLite databases are
+    # private to their engine, so those get a new one every time.
+    with _session_factories_lock:
+        factory = _session_factories.get(db_engine)
+        if factory is None:
+            engine = create_db_engine(db_engine)
+            ensure_schema(engine)
+            factory = sessionmaker(bind=engine)
+            if engine.url.database not in (None, "", ":memory:"):
+                _session_factories[db_engine] = factory
+        return factory
+
+
+@contextmanager
+def unit_of_work(session_factory):
+    # A session whose writes are committed together when the block ends, or
+    # rolled back if it raises
+    db_session = session_factory()
+    try:
+        yield db_session
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+
+def get_session(db_engine):
+    return get_session_factory(db_engine)()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import math
+from decimal import Context, Decimal, ROUND_DOWN
+
+from .money import FixedPoint
+
+# The order maths rounds every intermediate result to 8 significant digits.
+# It runs in its own context instead of setting getcontext().prec, which used
+# to leave the whole process at 8 digits after the first ladder was built.
+LADDER_CONTEXT = Context(prec=8)
+# Wide enough for scaling any catalog increment (down to 1e-8) exactly
+UNITS_CONTEXT = Context(prec=28)
+
+
+def unit_exponent(increment):
+    # Prices and sizes are truncated to the increment's exponent, so a ladder
+    # holds integer counts of 10**exponent: ticks for prices, lots for sizes
+    # (see money.FixedPoint)
+    return increment.as_tuple().exponent
+
+
+def to_units(value, exponent):
+    # Truncates toward zero, like quantize(..., rounding=ROUND_DOWN)
+    return int(value.scaleb(-exponent, UNITS_CONTEXT))
+
+
+def from_units(units, exponent):
+    return Decimal(units).scaleb(exponent, UNITS_CONTEXT)
+
+
+def ladder_size(amount_to_buy_fiat, minimum_order_value_fiat, order_count, size_exponent):
+    # Number of rungs and the fiat amount of each (in size units, as before),
+    # or (0, None) when the amount is below the minimum order value
+    if amount_to_buy_fiat < minimum_order_value_fiat:
+        return 0, None
+    number_of_orders = min(order_count, max(1, math.floor(amount_to_buy_fiat / minimum_order_value_fiat)))
+    if number_of_orders == 0:
+        return 0, None
+
+    amount = Decimal(str(amount_to_buy_fiat))
+    minimum = Decimal(str(minimum_order_value_fiat))
+    amount_per_order = from_units(to_units(LADDER_CONTEXT.divide(amount, Decimal(number_of_orders)), size_exponent), size_exponent)
+    if amount_per_order < minimum:
+        # Too many rungs for the amount: as many as the minimum order value allows
+        number_of_orders = max(1, math.floor(LADDER_CONTEXT.divide(amount, minimum)))
+        amount_per_order = from_units(to_units(LADDER_CONTEXT.divide(amount, Decimal(number_of_orders)), size_exponent), size_exponent)
+    return number_of_orders, amount_per_order
+
+
+def build_ladders(specs, order_count, starting_discount, discount_step):
+    # specs: [(coin_symbol, amount_to_buy_fiat, current_price, minimum_order_value_fiat,
+    #          size_increment, price_increment)], one per coin
+    # Returns {coin_symbol: [(price, size), ...]} with FixedPoint prices (ticks)
+    # and sizes (lots), the rungs in ladder order from the smallest discount down.
+    #
+    # Every rung is computed exactly as generate_buy_orders always has: the
+    # discounted price and the size are rounded to 8 significant digits, then
+    # truncated to their increments. A rung whose price isn't positive, or whose
+    # value is under the minimum, ends the ladder, since the discount only
+    # moves on after a rung is accepted and every later rung would repeat it.
+    start_factor = Decimal(str(1 - starting_discount))
+    step = Decimal(str(discount_step))
+    multiply, divide, subtract = LADDER_CONTEXT.multiply, LADDER_CONTEXT.divide, LADDER_CONTEXT.subtract
+    ladders = {}
+    for coin_symbol, amount_to_buy_fiat, current_price, minimum_order_value_fiat, size_increment, price_increment in specs:
+        price_exponent = unit_exponent(price_increment)
+        size_exponent = unit_exponent(size_increment)
+        price_unit = from_units(1, price_exponent)
+        size_unit = from_units(1, size_exponent)
+        number_of_orders, amount_per_order = ladder_size(amount_to_buy_fiat, minimum_order_value_fiat, order_count, size_exponent)
+        price = Decimal(str(current_price))
+        minimum = Decimal(str(minimum_order_value_fiat))
+        rungs = []
+        factor = start_factor
+        for _ in range(number_of_orders):
+            rung_price = multiply(price, factor).quantize(price_unit, ROUND_DOWN, UNITS_CONTEXT)
+            if rung_price <= 0:
+                break
+            size = divide(amount_per_order, rung_price).quantize(size_unit, ROUND_DOWN, UNITS_CONTEXT)
+            if multiply(size, rung_price) < minimum:
+                break
+            rungs.append((FixedPoint(to_units(rung_price, price_exponent), price_exponent), FixedPoint(to_units(size, size_exponent), size_exponent)))
+            factor = subtract(factor, step)
+        ladders[coin_symbol] = rungs
+    return ladders
+
+
+def ladder_orders(rungs):
+    # One coin's ladder as the [{"price": float, "size": float}] orders of generate_buy_orders
+    return [{"price": float(price), "size": float(size)} for price, size in rungs]
+
+
+def within_tolerance(live, wanted, tolerance):
+    # Relative difference of a live order's price or size from the wanted one
+    return abs(live - wanted) <= abs(wanted) * tolerance
+
+
+def diff_ladder(rungs, orders, tolerance, edit=True):
+    # rungs: one coin's wanted [(price, size)] in ladder order; orders: its live
+    # [(order_id, price, remaining_size)]. Returns (keep, edits, cancels, places):
+    # the live orders already within tolerance of a rung, (order_id, rung,
+    # price, size) edits moving the other live orders onto the remaining rungs,
+    # the order ids left over to cancel and the (rung, price, size) rungs still
+    # to place, where rung is the index in `rungs`. Only what changed costs an
+    # API call, and kept orders keep their place in the book.
+    unmatched = list(orders)
+    keep = []
+    missing = []
+    for rung, (price, size) in enumerate(rungs):
+        wanted_price, wanted_size = float(price), float(size)
+        candidates = [
+            order for order in unmatched
+            if within_tolerance(order[1], wanted_price, tolerance) and within_tolerance(order[2], wanted_size, tolerance)
+        ]
+        if candidates:
+            best = min(candidates, key=lambda order: abs(order[1] - wanted_price))
+            unmatched.remove(best)
+            keep.append(best[0])
+        else:
+            missing.append((rung, price, size))
+
+    edits = []
+    if edit:
+        # Highest leftover order onto the highest missing rung, and so on down
+        unmatched.sort(key=lambda order: order[1], reverse=True)
+        paired = min(len(unmatched), len(missing))
+        edits = [(order[0],) + rung for order, rung in zip(unmatched[:paired], missing[:paired])]
+        unmatched, missing = unmatched[paired:], missing[paired:]
+    return keep, edits, [order[0] for order in unmatched], missing
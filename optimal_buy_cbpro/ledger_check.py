@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Checks the balance ledger against the withdrawal and deposit history.
+
+    python -m optimal_buy_cbpro.ledger_check --db-engine sqlite:///cbpro_history.db
+
+Exits 1 if any running total differs from its history rows, unless --rebuild
+is given, in which case the ledger is rebuilt from the history.
+"""
+import argparse
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-engine", help="SQLAlchemy DB engine string (default: sqlite:///cbpro_history.db)", default="sqlite:///cbpro_history.db")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the ledger from the history if it doesn't match")
+    args = parser.parse_args(argv)
+
+    from .history import check_ledger, get_session_factory, rebuild_ledger, unit_of_work
+
+    with unit_of_work(get_session_factory(args.db_engine)) as db_session:
+        mismatches = check_ledger(db_session)
+        for currency, account, ledger_total, raw_total in mismatches:
+            print(f"{currency} {account}: ledger {ledger_total}, history {raw_total}")
+        if not mismatches:
+            print("Balance ledger matches the history.")
+            return 0
+        if args.rebuild:
+            rebuild_ledger(db_session)
+            print("Rebuilt the balance ledger from the history.")
+            return 0
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+from decimal import Context, Decimal
+
+# Wide enough for any catalog increment (down to 1e-8) and order value
+FIXED_CONTEXT = Context(prec=28)
+
+
+class FixedPoint:
+    """An exact amount held as an integer count of 10**exponent: price ticks or
+    size lots of a product's increment. Orders carry these from the ladder to
+    the API payload and the history DB, so no float or string round trip sits
+    between the computed rung and what is sent and stored."""
+
+    __slots__ = ("units", "exponent")
+
+    def __init__(self, units, exponent):
+        self.units = units
+        self.exponent = exponent
+
+    @classmethod
+    def from_decimal(cls, value, increment):
+        # Truncates to the increment's exponent, like quantize(..., rounding=ROUND_DOWN)
+        exponent = increment.as_tuple().exponent
+        return cls(int(value.scaleb(-exponent, FIXED_CONTEXT)), exponent)
+
+    @classmethod
+    def from_value(cls, value, increment):
+        # Floats go through str() first, as the order maths always has
+        if isinstance(value, FixedPoint):
+            return value
+        if not isinstance(value, Decimal):
+            value = Decimal(str(value))
+        return cls.from_decimal(value, increment)
+
+    def decimal(self):
+        return Decimal(self.units).scaleb(self.exponent, FIXED_CONTEXT)
+
+    def __str__(self):
+        # Plain notation with exactly -exponent decimals, as the API expects
+        if self.exponent >= 0:
+            return str(self.units * 10 ** self.exponent)
+        sign = "-" if self.units < 0 else ""
+        digits = str(abs(self.units)).rjust(1 - self.exponent, "0")
+        return f"{sign}{digits[:self.exponent]}.{digits[self.exponent:]}"
+
+    def __float__(self):
+        return float(self.decimal())
+
+    def __mul__(self, other):
+        # Exact product, e.g. the quote value of price * size
+        return FixedPoint(self.units * other.units, self.exponent + other.exponent)
+
+    def __bool__(self):
+        return self.units != 0
+
+    def _key(self):
+        # Equal amounts compare equal whatever their exponents
+        return self.decimal()
+
+    def __eq__(self, other):
+        if not isinstance(other, FixedPoint):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __lt__(self, other):
+        return self._key() < other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"FixedPoint({self})"
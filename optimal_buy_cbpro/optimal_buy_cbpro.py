@@ -1,77 +1,154 @@
 #!/usr/bin/env python3
 
-from coinbase.rest import RESTClient
-import argparse
 import sys
 import math
-import time
-import dateutil.parser
 import json
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone # Added for created_at
-from decimal import Decimal, getcontext, ROUND_DOWN
+from decimal import Context, Decimal, ROUND_DOWN
 
 # Assuming history.py is in the same directory or Python path
 # and defines Order, Deposit, Withdrawal, get_session SQLAlchemy models
-from .history import Order, Deposit, Withdrawal, get_session
+from .cache import get_cache
+from .cli import main
+from .common import get_decimal_precision, get_price_precision, make_client_order_id, new_run_id
+from .defaults import (
+    DEFAULT_LADDER_TOLERANCE,
+    DEFAULT_ORDER_RATE,
+    DEFAULT_ORDER_SYNC,
+    DEFAULT_ORDER_WORKERS,
+    DEFAULT_PRICE_ANCHOR,
+    DEFAULT_PRICE_SOURCE,
+    DEFAULT_PRICE_TIMEOUT,
+    DEFAULT_PRICE_WORKERS,
+    DEFAULT_PRODUCTS_TTL,
+    DEFAULT_WEIGHTS_MAX_STALENESS,
+    DEFAULT_WEIGHTS_TTL,
+)
+from .ratelimit import RateLimitedClient, TokenBucket
+from .history import Order, get_session, ledger_totals
+from .deposits import deposit_hold, make_deposit
+from .ladder import build_ladders, diff_ladder, ladder_orders
+from .money import FixedPoint
+from .prices import get_market_prices, get_prices
+from .signing import get_raw_client
+from .withdrawals import refresh_pending_withdrawals, withdraw_coins
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
 
-# Use different precision for different coins
-DECIMAL_PRECISION_MAP = {
-    'BTC': Decimal('0.00001'),  # 6 decimal places for BTC
-    'ETH': Decimal('0.00001'),  # 6 decimal places for ETH
-    'JASMY': Decimal('1'),     # 1 decimal place for JASMY
-}
-
-# Price precision can be different from size precision for some coins
-PRICE_PRECISION_MAP = {
-    'BTC': Decimal('0.01'),      # 2 decimal places for BTC price
-    'ETH': Decimal('0.01'),      # 2 decimal places for ETH price
-    'JASMY': Decimal('0.00001'), # 6 decimal places for JASMY price
-}
-
-DEFAULT_PRECISION = Decimal('0.00001')  # Default 4 decimal places
-DEFAULT_PRICE_PRECISION = Decimal('0.01')  # Default 2 decimal places for price
-
-def get_decimal_precision(coin_symbol):
-    return DECIMAL_PRECISION_MAP.get(coin_symbol.upper(), DEFAULT_PRECISION)
+# CoinGecko market caps barely move between runs, so they are cached next to the
+# history DB (see cache.py)
+COINGECKO_API_URL = "https://api.coingecko.com/api/v3"
+COINGECKO_TIMEOUT = 30  # Seconds
+COIN_ID_INDEX_TTL = 7 * 86400.0  # Symbol -> CoinGecko id index, refreshed weekly
+COIN_ID_INDEX_MAX_STALENESS = 30 * 86400.0
+
+# Order cancellation: one paginated listing for all products, then the batch
+# cancel endpoint, which accepts at most 100 order ids per request
+LIST_ORDERS_PAGE_SIZE = 1000
+CANCEL_ORDERS_BATCH_SIZE = 100
+
+# The product catalog (see get_products_info) is cached next to the history DB and
+# refreshed daily, or right after an order is rejected
+PRODUCTS_MAX_STALENESS = 7 * 86400.0
+PRODUCT_CATALOG_FIELDS = (
+    "product_id",
+    "status",
+    "quote_min_size",
+    "base_min_size",
+    "base_increment",
+    "quote_increment",
+    "price_increment",
+    "trading_disabled",
+    "cancel_only",
+    "is_disabled",
+)
+
+def quantize_down(value, increment):
+    # quantize() needs a context with room for every digit down to the
+    # increment, which the 8 digit context used for the order maths lacks once
+    # catalog increments go down to 1e-8
+    return value.quantize(increment, rounding=ROUND_DOWN, context=Context(prec=28))
+
+def fetch_coin_id_index():
+    # Every coin CoinGecko knows about, as symbol -> [[id, name], ...] sorted by id.
+    # Several coins can share a ticker, so a symbol may map to many ids.
+    response = requests.get(f"{COINGECKO_API_URL}/coins/list", timeout=COINGECKO_TIMEOUT)
+    response.raise_for_status()
+    index = {}
+    for coin_info in response.json():
+        index.setdefault(coin_info['symbol'].upper(), []).append([coin_info['id'], coin_info['name']])
+    for candidates in index.values():
+        candidates.sort()
+    return index
+
+
+_coin_id_index = None
+
+def get_coin_id_index(cache=None):
+    global _coin_id_index
+    if cache is not None:
+        index = cache.fetch("coins", fetch_coin_id_index, COIN_ID_INDEX_TTL, COIN_ID_INDEX_MAX_STALENESS)
+        print(cache.stats())
+        return index
+    # Without an on-disk cache, build the index once per process
+    if _coin_id_index is None:
+        _coin_id_index = fetch_coin_id_index()
+    return _coin_id_index
+
+
+def get_coin_id_candidates(coins, index):
+    # `coins` is either a list of symbols or the coins config dict, whose entries
+    # may pin a "coingecko_id" or disambiguate a shared ticker by "name"
+    candidates = {}
+    for c in coins:
+        coin_config = coins[c] if isinstance(coins, dict) else {}
+        coin_config = coin_config or {}
+        if coin_config.get("coingecko_id"):
+            candidates[c.upper()] = [coin_config["coingecko_id"]]
+            continue
+        matches = index.get(c.upper(), [])
+        name = (coin_config.get("name") or "").lower()
+        named = [coin_id for coin_id, coin_name in matches if coin_name.lower() == name]
+        candidates[c.upper()] = named[:1] if named else [coin_id for coin_id, _ in matches]
+    return candidates
 
-def get_price_precision(coin_symbol):
-    return PRICE_PRECISION_MAP.get(coin_symbol.upper(), DEFAULT_PRICE_PRECISION)
 
-def get_weights(coins, fiat_currency):
+def fetch_market_caps(coins, id_index_cache=None):
     market_cap = {}
     try:
-        # CoinGecko API - This part remains unchanged as it's an external API call
-        response = requests.get("https://api.coingecko.com/api/v3/coins/markets", params={
-            'vs_currency': 'usd', # Assuming USD for market cap comparison, adjust if needed
-            'order': 'market_cap_desc',
-            'per_page': 200, # Fetching enough coins to likely find those in user's list
-            'page': 1,
-            'sparkline': False
-        })
-        response.raise_for_status() # Check for HTTP errors
-        assets = response.json()
+        candidates = get_coin_id_candidates(coins, get_coin_id_index(id_index_cache))
+        coin_ids = sorted({coin_id for ids in candidates.values() for coin_id in ids})
+        assets = []
+        if coin_ids:
+            # Only the configured coins (plus any same-ticker candidates still to
+            # be told apart), instead of paging through the top of the market
+            response = requests.get(f"{COINGECKO_API_URL}/coins/markets", params={
+                'vs_currency': 'usd', # Assuming USD for market cap comparison, adjust if needed
+                'ids': ",".join(coin_ids),
+                'per_page': len(coin_ids),
+                'page': 1,
+                'sparkline': False
+            }, timeout=COINGECKO_TIMEOUT)
+            response.raise_for_status() # Check for HTTP errors
+            assets = response.json()
         coin_data = {}
         for coin_info in assets:
-            coin_data[coin_info['symbol'].upper()] = coin_info
-        
+            coin_data[coin_info['id']] = coin_info
+
         found_all_coins = True
         for c in coins:
-            if c.upper() in coin_data:
-                market_cap[c.upper()] = float(coin_data[c.upper()]['market_cap'])
+            found = [coin_id for coin_id in candidates[c.upper()] if coin_id in coin_data]
+            if found:
+                # A ticker shared by several coins resolves to the largest one,
+                # ties broken by id, so the choice is the same on every run
+                coin_id = min(found, key=lambda i: (-float(coin_data[i]['market_cap'] or 0), i))
+                market_cap[c.upper()] = float(coin_data[coin_id]['market_cap'] or 0)
             else:
                 print(f"Warning: Market cap data not found for {c} on CoinGecko.")
                 found_all_coins = False
-                # Fallback or error handling:
-                # Option 1: Assign a zero or very small market cap (might skew weights)
-                # market_cap[c.upper()] = 0 
-                # Option 2: Skip this coin for weighting (adjust logic below)
-                # Option 3: Raise an error
-                # For this example, let's try to proceed but warn the user
-                # and potentially exclude it from total_market_cap calculation if 0.
-                market_cap[c.upper()] = 0 # Or handle as an error
-
+                market_cap[c.upper()] = 0
 
         if not found_all_coins and not any(market_cap.values()): # if all coins failed to fetch
              raise Exception("Could not fetch market cap data for any of the specified coins from CoinGecko.")
@@ -89,6 +166,16 @@ def get_weights(coins, fiat_currency):
         print(f"ValueError while processing CoinGecko data: {e}")
         raise e
 
+    return market_cap
+
+
+def get_weights(coins, fiat_currency, cache=None, ttl=DEFAULT_WEIGHTS_TTL, max_staleness=DEFAULT_WEIGHTS_MAX_STALENESS, id_index_cache=None):
+    if cache is None:
+        market_cap = fetch_market_caps(coins, id_index_cache)
+    else:
+        cache_key = ",".join(sorted(c.upper() for c in coins))
+        market_cap = cache.fetch(cache_key, lambda: fetch_market_caps(coins, id_index_cache), ttl, max_staleness)
+        print(cache.stats())
 
     total_market_cap = sum(market_cap.values())
     if total_market_cap == 0 and market_cap: # Avoid division by zero if all found coins have 0 mcap
@@ -116,52 +203,60 @@ def deposit(args, client, db_session):
         sys.exit(1)
 
     print(f"Performing deposit, amount={args.amount} {args.fiat_currency}")
-    
-    # NOTE: The coinbase-advanced-py SDK version reflected in the provided files
-    # does not show a direct method in RESTClient for making fiat deposits
-    # from a payment_method_id (like bank).
-    # This functionality might be available through a different API,
-    # via the Coinbase website/app, or a future/different version of the SDK.
-    # The original script's client.deposit(...) call cannot be directly translated.
-    print("Fiat deposit functionality via payment_method_id is not directly available in this SDK version.")
-    print("Please handle deposits manually or explore other Coinbase APIs/SDKs for this feature.")
-    
-    # Assuming the old `deposit` response structure and DB logging.
-    # If an alternative method is found, this part would need to be adapted.
-    # For now, this part of the function will not execute.
-    deposit_response_simulated = {
-        # "id": "simulated_deposit_id_123",
-        # "payout_at": datetime.now(timezone.utc).isoformat() 
-    } # Example structure
-
-    if "id" in deposit_response_simulated: # This block will not run with the current placeholder
-        # db_session.add(
-        #     Deposit(
-        #         payment_method_id=args.payment_method_id,
-        #         amount=args.amount,
-        #         currency=args.fiat_currency,
-        #         payout_at=dateutil.parser.parse(deposit_response_simulated["payout_at"]),
-        #         coinbase_deposit_id=deposit_response_simulated["id"], # Renamed field
-        #     )
-        # )
-        # db_session.commit()
-        pass
-
-
-def get_products_info(client, coins_dict, fiat_currency):
+    return make_deposit(args, client, db_session)
+
+
+def product_field(product, field):
+    # Catalog values are strings or flags; anything else means the API didn't send the field
+    value = getattr(product, field, None)
+    return value if isinstance(value, (str, bool)) else None
+
+
+def fetch_product_catalog(client, coin_symbols, fiat_currency):
+    # Only the configured products, not the whole SPOT listing
+    product_ids = [f"{c_symbol}-{fiat_currency}" for c_symbol in coin_symbols]
+    products_response = client.get_products(product_type="SPOT", product_ids=product_ids)
+    catalog = {}
+    if products_response and products_response.products:
+        for p in products_response.products:
+            if p.base_currency_id in coin_symbols and p.quote_currency_id == fiat_currency:
+                catalog[p.base_currency_id] = {field: product_field(p, field) for field in PRODUCT_CATALOG_FIELDS}
+    else:
+        print("Warning: Could not retrieve products or no products found.")
+    return catalog
+
+
+def get_products_info(client, coins_dict, fiat_currency, cache=None, ttl=DEFAULT_PRODUCTS_TTL):
     # coins_dict is the original dict from args.coins
-    # We'll update it with minimum_order_size
+    # We'll update it with minimum_order_size, increments and trading status
     try:
-        products_response = client.get_products(product_type="SPOT")
-        if products_response and products_response.products:
-            for p in products_response.products:
-                base_currency = p.base_currency_id
-                if base_currency in coins_dict and p.quote_currency_id == fiat_currency:
-                    # Use quote_min_size for minimum order value in fiat
-                    # The original script used "min_market_funds"
-                    coins_dict[base_currency]["minimum_order_size"] = float(p.quote_min_size) 
+        coin_symbols = list(coins_dict.keys())
+        if cache is None:
+            catalog = fetch_product_catalog(client, coin_symbols, fiat_currency)
         else:
-            print("Warning: Could not retrieve products or no products found.")
+            cache_key = f"{fiat_currency}:{','.join(sorted(coin_symbols))}"
+            catalog = cache.fetch(
+                cache_key,
+                lambda: fetch_product_catalog(client, coin_symbols, fiat_currency),
+                ttl,
+                max(ttl, PRODUCTS_MAX_STALENESS),
+            )
+            print(cache.stats())
+        for base_currency, product in catalog.items():
+            coin_config = coins_dict[base_currency]
+            if product["quote_min_size"]:
+                # Use quote_min_size for minimum order value in fiat
+                # The original script used "min_market_funds"
+                coin_config["minimum_order_size"] = float(product["quote_min_size"])
+            for field in ("base_increment", "price_increment"):
+                if product[field]:
+                    coin_config[field] = product[field]
+            coin_config["trading_disabled"] = bool(
+                product["trading_disabled"]
+                or product["cancel_only"]
+                or product["is_disabled"]
+                or (product["status"] and product["status"] != "online")
+            )
     except HTTPError as e:
         print(f"HTTPError fetching products: {e}")
         raise
@@ -171,25 +266,12 @@ def get_products_info(client, coins_dict, fiat_currency):
     return coins_dict
 
 
-def get_prices(client, coins_symbols_list, fiat_currency):
-    prices = {}
-    for c_symbol in coins_symbols_list:
-        product_id = f"{c_symbol}-{fiat_currency}"
-        try:
-            ticker_response = client.get_product(product_id=product_id)
-            if ticker_response and ticker_response.price:
-                print(f"{c_symbol} ticker price: {ticker_response.price}")
-                prices[c_symbol] = float(ticker_response.price)
-            else:
-                raise Exception(f"No price available for {c_symbol} or invalid response. Ticker: {ticker_response}")
-        except HTTPError as e:
-            print(f"HTTPError fetching ticker for {product_id}: {e}")
-            raise
-        except Exception as e:
-            print(f"Error fetching ticker for {product_id}: {e}")
-            # Decide if you want to raise or try to continue with other coins
-            raise # Or prices[c_symbol] = None and handle later
-    return prices
+def invalidate_product_catalog(args):
+    # A rejected order usually means the cached limits are out of date
+    cache = get_cache(getattr(args, "db_engine", None), "products")
+    if cache is not None:
+        print("Invalidating cached product catalog after a failed order.")
+        cache.invalidate()
 
 
 def get_external_balance(coins_dict, coin_symbol):
@@ -237,32 +319,25 @@ def get_fiat_balances(args, coins_dict, accounts_response, withdrawn_balances, p
             
     return balances
 
-def get_account_by_currency(accounts_response, currency_symbol):
-    if accounts_response and accounts_response.accounts:
-        for acc in accounts_response.accounts:
-            if acc.currency == currency_symbol:
-                return acc
-    return None
-
-
-def set_buy_order(args, coin_symbol, price, size, client, db_session):
+def send_buy_order(args, coin_symbol, price, size, client, coins_config=None, client_order_id=""):
+    # Places one limit buy order; returns (order_response, order_id), where
+    # order_id is None if the exchange didn't accept the order
     product_id = f"{coin_symbol}-{args.fiat_currency}"
-    # Use coin-specific precision for size and price
-    size_precision = get_decimal_precision(coin_symbol)
-    price_precision = get_price_precision(coin_symbol)
-    
-    formatted_price = str(Decimal(str(price)).quantize(price_precision, rounding=ROUND_DOWN))
-    formatted_size = str(Decimal(str(size)).quantize(size_precision, rounding=ROUND_DOWN))
+    # Ladder rungs are already FixedPoint ticks/lots; plain numbers from other
+    # callers are truncated to the coin's increments
+    price = FixedPoint.from_value(price, get_price_precision(coin_symbol, coins_config))
+    size = FixedPoint.from_value(size, get_decimal_precision(coin_symbol, coins_config))
+    formatted_price = str(price)
+    formatted_size = str(size)
 
     print(f"Placing limit buy order: coin={coin_symbol}, price={formatted_price}, size={formatted_size}")
     
-    # client_order_id should be unique. SDK generates one if not provided or empty.
-    # The old script didn't provide one here, relying on the exchange.
-    # The new SDK's helpers generate one.
-    # limit_order_gtc takes client_order_id, let's pass an empty string to let SDK handle it.
+    # client_order_id should be unique. The SDK generates a random one when it's
+    # empty, but a retry would then place a second order; submit_buy_orders
+    # passes ids derived from the run, coin and rung instead.
     try:
         order_response = client.limit_order_gtc(
-            client_order_id="", # Let SDK generate
+            client_order_id=client_order_id,
             product_id=product_id,
             side="BUY",
             base_size=formatted_size, # size is base_size
@@ -288,125 +363,174 @@ def set_buy_order(args, coin_symbol, price, size, client, db_session):
                 order_id = None
 
         if success and order_id:
-            db_session.add(
-                Order(
-                    currency=coin_symbol,
-                    size=float(size), # Store as float
-                    price=float(price), # Store as float
-                    cbpro_order_id=order_id, # Fixed field name
-                    created_at=datetime.now(timezone.utc), # Using current UTC time
-                )
-            )
-            db_session.commit()
-            return order_response
-        else:
-            print(f"Order placement failed or no success response: {order_response}")
-            return order_response # Or handle error appropriately
+            return order_response, order_id
+        print(f"Order placement failed or no success response: {order_response}")
+        invalidate_product_catalog(args)
+        return order_response, None
     except HTTPError as e:
         print(f"HTTPError placing order for {product_id}: {e}")
+        invalidate_product_catalog(args)
         raise
     except Exception as e:
         print(f"Error placing order for {product_id}: {e}")
         raise
 
 
-def generate_buy_orders(coins_config, coin_symbol, args, amount_to_buy_fiat, current_price):
-    getcontext().prec = 8 # Precision for crypto size calculations
-    
-    buy_orders = []
-    
-    minimum_order_value_fiat = coins_config[coin_symbol].get("minimum_order_size", 0.01) # This is quote_min_size
+def set_buy_order(args, coin_symbol, price, size, client, db_session, coins_config=None):
+    price = FixedPoint.from_value(price, get_price_precision(coin_symbol, coins_config))
+    size = FixedPoint.from_value(size, get_decimal_precision(coin_symbol, coins_config))
+    order_response, order_id = send_buy_order(args, coin_symbol, price, size, client, coins_config)
+    if order_id:
+        db_session.add(
+            Order(
+                currency=coin_symbol,
+                size=size.decimal(),
+                price=price.decimal(),
+                cbpro_order_id=order_id, # Fixed field name
+                created_at=datetime.now(timezone.utc), # Using current UTC time
+            )
+        )
+        # Committed by the caller, so several orders go in one transaction
+        # (see history.unit_of_work)
+        db_session.flush()
+    return order_response
+
+
+def submit_buy_orders(args, ladder, client, db_session, coins_config=None, rate_limiter=None, run_id=None, rung_indexes=None):
+    # ladder is a list of (coin_symbol, price, size) in ladder order. Orders are
+    # sent from a worker pool, throttled by rate_limiter, and the accepted ones
+    # are written to the history DB in one transaction, still in ladder order.
+    # When ladder is only some of the rungs (see sync_buy_orders), rung_indexes
+    # gives each order's index in its coin's full ladder, so its client_order_id
+    # is the one it would have had in a full submission.
+    if not ladder:
+        return []
+    if rate_limiter is None:
+        rate_limiter = TokenBucket(getattr(args, "order_rate", DEFAULT_ORDER_RATE))
+    if run_id is None:
+        run_id = new_run_id()
+    max_workers = max(1, min(getattr(args, "order_workers", DEFAULT_ORDER_WORKERS), len(ladder)))
+
+    if rung_indexes is None:
+        rung_indexes = []
+        rungs = {}
+        for coin_symbol, _, _ in ladder:
+            rungs[coin_symbol] = rungs.get(coin_symbol, -1) + 1
+            rung_indexes.append(rungs[coin_symbol])
+    client_order_ids = [
+        make_client_order_id(run_id, coin_symbol, rung) for (coin_symbol, _, _), rung in zip(ladder, rung_indexes)
+    ]
+
+    def submit(coin_symbol, price, size, client_order_id):
+        rate_limiter.acquire()
+        order_response, order_id = send_buy_order(
+            args, coin_symbol, price, size, client, coins_config, client_order_id=client_order_id
+        )
+        return order_response, order_id, datetime.now(timezone.utc)
+
+    results = [None] * len(ladder)
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(submit, *order, client_order_id)
+            for order, client_order_id in zip(ladder, client_order_ids)
+        ]
+        for i, future in enumerate(futures):
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                errors.append((ladder[i], e))
+
+    placed_orders = [
+        Order(
+            currency=coin_symbol,
+            size=FixedPoint.from_value(size, get_decimal_precision(coin_symbol, coins_config)).decimal(),
+            price=FixedPoint.from_value(price, get_price_precision(coin_symbol, coins_config)).decimal(),
+            cbpro_order_id=result[1],
+            created_at=result[2],
+        )
+        for (coin_symbol, price, size), result in zip(ladder, results)
+        if result is not None and result[1]
+    ]
+    if placed_orders:
+        db_session.add_all(placed_orders)
+        db_session.commit()
+    print(f"Placed {len(placed_orders)} of {len(ladder)} buy orders ({rate_limiter.waited:.2f}s throttled).")
 
-    # Ensure amount_to_buy_fiat meets the minimum order value
+    if errors:
+        (coin_symbol, price, size), error = errors[0]
+        raise Exception(f"{len(errors)} buy orders failed, first: {coin_symbol} price={price} size={size}: {error}") from error
+    return [result[0] for result in results]
+
+
+def ladder_spec(coins_config, coin_symbol, amount_to_buy_fiat, current_price):
+    minimum_order_value_fiat = coins_config[coin_symbol].get("minimum_order_size", 0.01) # This is quote_min_size
     if amount_to_buy_fiat < minimum_order_value_fiat:
         print(f"Amount to buy {amount_to_buy_fiat} for {coin_symbol} is less than minimum order value {minimum_order_value_fiat}. Skipping.")
-        return buy_orders
-
-    # Calculate number of orders
-    # Ensure each split order also meets minimum value
-    # max number of orders if each is minimum_order_value_fiat
-    max_possible_orders_by_value = math.floor(amount_to_buy_fiat / minimum_order_value_fiat)
-    
-    number_of_orders = min(
-        args.order_count,
-        max(1, max_possible_orders_by_value) 
+    return (
+        coin_symbol,
+        amount_to_buy_fiat,
+        current_price,
+        minimum_order_value_fiat,
+        get_decimal_precision(coin_symbol, coins_config),
+        get_price_precision(coin_symbol, coins_config),
     )
-    
-    if number_of_orders == 0 : # Should be caught by amount_to_buy_fiat check already
-        return buy_orders
-
-    # Amount of fiat per order
-    amount_fiat_per_order = Decimal(str(amount_to_buy_fiat)) / Decimal(str(number_of_orders))
-    print(f"precision: {get_decimal_precision(coin_symbol)}")
-    amount_fiat_per_order = amount_fiat_per_order.quantize(get_decimal_precision(coin_symbol), rounding=ROUND_DOWN)
-    print(f"Initial amount fiat per order: {amount_fiat_per_order}")
-
-    if amount_fiat_per_order < Decimal(str(minimum_order_value_fiat)):
-        # This can happen if amount_to_buy_fiat is small, and order_count is high
-        # Recalculate number_of_orders based on minimum value per order
-        number_of_orders = max(1, math.floor(Decimal(str(amount_to_buy_fiat)) / Decimal(str(minimum_order_value_fiat))))
-        print(f"Recalculated number of orders: {number_of_orders}")
-        amount_fiat_per_order = Decimal(str(amount_to_buy_fiat)) / Decimal(str(number_of_orders))
-        amount_fiat_per_order = amount_fiat_per_order.quantize(get_decimal_precision(coin_symbol), rounding=ROUND_DOWN)
-        print(f"Adjusted amount fiat per order: {amount_fiat_per_order}")
-
-    discount_factor = Decimal(str(1 - args.starting_discount))
-    price_decimal = Decimal(str(current_price))
-    print(f"Starting discount factor: {discount_factor}, price: {price_decimal}")
-
-    for i in range(number_of_orders):
-        # Ensure discounted price has appropriate precision
-        
-        discounted_price = (price_decimal * discount_factor).quantize(get_price_precision(coin_symbol), rounding=ROUND_DOWN)
-        print(f"Calculated discounted price: {discounted_price} for {coin_symbol} (original: {price_decimal}, discount: {discount_factor}, precision: {get_price_precision(coin_symbol)})")
-        print(f"Discounted price for {coin_symbol}: {discounted_price}")
-        if discounted_price <= Decimal("0"): # Price cannot be zero or negative
-            print(f"Warning: Discounted price for {coin_symbol} is too low ({discounted_price}). Skipping this order split.")
+
+
+def generate_buy_orders(coins_config, coin_symbol, args, amount_to_buy_fiat, current_price):
+    spec = ladder_spec(coins_config, coin_symbol, amount_to_buy_fiat, current_price)
+    ladders = build_ladders([spec], args.order_count, args.starting_discount, args.discount_step)
+    return ladder_orders(ladders[coin_symbol])
+
+
+def plan_ladders(args, amounts_to_buy_fiat, coins_config, prices):
+    # The ladders of (coin_symbol, price, size) orders to place for every coin,
+    # built in one pass over all coins and rungs; prices and sizes are FixedPoint
+    specs = []
+    for coin_symbol, amount_to_buy_fiat in amounts_to_buy_fiat.items():
+        current_price = prices[coin_symbol]
+        if amount_to_buy_fiat <= 0.01: # Miniscule amount
+            print(
+                f"{coin_symbol}: amount_to_buy_fiat={amount_to_buy_fiat}, not buying {coin_symbol}"
+            )
             continue
-            
-        # Calculate size in base currency - as price increases, size should decrease
-        # to maintain the same fiat value per order
-        print(f"Amount fiat per order for {coin_symbol}: {amount_fiat_per_order}")
-        print(f"Discounted price for {coin_symbol}: {discounted_price}")
-        size_base_currency = amount_fiat_per_order / discounted_price
-        size_base_currency = size_base_currency.quantize(get_decimal_precision(coin_symbol), rounding=ROUND_DOWN)
-
-        if size_base_currency * discounted_price < Decimal(str(minimum_order_value_fiat)):
-             print(f"Skipping order for {coin_symbol} at price {discounted_price} due to size {size_base_currency} valuing less than minimum.")
-             continue
-
-        buy_orders.append({"price": float(discounted_price), "size": float(size_base_currency)})
-        discount_factor -= Decimal(str(args.discount_step))
-        
-    return buy_orders
+        if current_price <= 0:
+            print(f"Current price={current_price} for {coin_symbol}, not buying.")
+            continue
+        if coins_config[coin_symbol].get("trading_disabled"):
+            print(f"Trading is disabled for {coin_symbol}-{args.fiat_currency}, not buying.")
+            continue
+        print(f"Placing buy orders for {coin_symbol} with amount {amount_to_buy_fiat} at price {current_price}")
+        specs.append(ladder_spec(coins_config, coin_symbol, amount_to_buy_fiat, current_price))
 
+    ladders = build_ladders(specs, args.order_count, args.starting_discount, args.discount_step)
+    ladder = []
+    for coin_symbol, rungs in ladders.items():
+        print(f"{coin_symbol} ladder ({len(rungs)} orders): {', '.join(f'{size} @ {price}' for price, size in rungs)}")
+        ladder.extend((coin_symbol, price, size) for price, size in rungs)
+    return ladder
 
-def place_buy_orders(args, amount_to_buy_fiat, coins_config, coin_symbol, current_price, client, db_session):
-    if amount_to_buy_fiat <= 0.01: # Miniscule amount
-        print(
-            f"{coin_symbol}: amount_to_buy_fiat={amount_to_buy_fiat}, not buying {coin_symbol}"
-        )
-        return
-    if current_price <= 0:
-        print(f"Current price={current_price} for {coin_symbol}, not buying.")
-        return
-    print(f"Placing buy orders for {coin_symbol} with amount {amount_to_buy_fiat} at price {current_price}")
-    buy_orders_params = generate_buy_orders(coins_config, coin_symbol, args, amount_to_buy_fiat, current_price)
-    for order_params in buy_orders_params:
-        set_buy_order(
-            args, coin_symbol, order_params["price"], order_params["size"], client, db_session
-        )
+
+def plan_buy_orders(args, amount_to_buy_fiat, coins_config, coin_symbol, current_price):
+    # The ladder of (coin_symbol, price, size) orders to place for one coin
+    return plan_ladders(args, {coin_symbol: amount_to_buy_fiat}, coins_config, {coin_symbol: current_price})
+
+
+def place_buy_orders(args, amount_to_buy_fiat, coins_config, coin_symbol, current_price, client, db_session, run_id=None):
+    ladder = plan_buy_orders(args, amount_to_buy_fiat, coins_config, coin_symbol, current_price)
+    submit_buy_orders(args, ladder, client, db_session, coins_config, run_id=run_id)
 
 
 def start_buy_orders(
-    args, coins_config, accounts_response, prices, fiat_balances_per_coin, total_fiat_to_spend, client, db_session
+    args, coins_config, accounts_response, prices, fiat_balances_per_coin, total_fiat_to_spend, client, db_session, run_id=None, weights=None, open_orders=None
 ):
     # coins_config: original dict from args.coins, updated with min_order_size
     # fiat_balances_per_coin: dict of coin_symbol -> fiat_value_of_coin_holding
     # total_fiat_to_spend: fiat amount available for buying (after fees reserved)
     
     coin_symbols_list = list(coins_config.keys())
-    weights = get_weights(coin_symbols_list, args.fiat_currency)
+    if weights is None:
+        weights = get_configured_weights(args, coins_config)
 
     # Total portfolio value in fiat (sum of current holdings in fiat + fiat to spend now)
     current_portfolio_fiat_value = sum(fiat_balances_per_coin.values()) + total_fiat_to_spend
@@ -446,150 +570,312 @@ def start_buy_orders(
 
     print(f"Final fiat amount to spend per coin: {json.dumps(final_fiat_to_buy_per_coin, indent=2)}")
 
+    # Plan every coin's ladder first, then submit them all through one pool
+    amounts_to_buy_fiat = {}
     for c_symbol in coin_symbols_list:
         if c_symbol.upper() in prices and prices[c_symbol.upper()] > 0:
-            place_buy_orders(
-                args, final_fiat_to_buy_per_coin[c_symbol.upper()], coins_config, c_symbol.upper(), prices[c_symbol.upper()], client, db_session
-            )
+            amounts_to_buy_fiat[c_symbol.upper()] = final_fiat_to_buy_per_coin[c_symbol.upper()]
         else:
             print(f"Skipping buy for {c_symbol} due to missing or invalid price.")
+    ladder = plan_ladders(args, amounts_to_buy_fiat, coins_config, prices)
+    if open_orders is None:
+        submit_buy_orders(args, ladder, client, db_session, coins_config, run_id=run_id)
+    else:
+        sync_buy_orders(args, ladder, open_orders, client, db_session, coins_config, run_id=run_id)
 
 
-def execute_withdrawal(client, amount_str, currency_symbol, crypto_address, db_session):
-    # Ensure amount is a string with correct precision for the API
-    try:
-        amount_decimal = Decimal(str(amount_str))
-        formatted_amount = str(amount_decimal.quantize(get_decimal_precision(currency_symbol), rounding=ROUND_DOWN))
-    except:
-        print(f"Could not format amount {amount_str} for withdrawal. Using as is.")
-        formatted_amount = str(amount_str)
-
-    print(f"Attempting to withdraw {formatted_amount} {currency_symbol} to {crypto_address}")
-
-    # NOTE: The coinbase-advanced-py SDK version reflected in the provided files
-    # does not show a direct method in RESTClient for crypto withdrawals.
-    # This functionality might be available through a different API,
-    # via the Coinbase website/app, or a future/different version of the SDK.
-    # The original script's client.withdraw_to_crypto(...) call cannot be directly translated.
-    print("Crypto withdrawal functionality is not directly available in this SDK version.")
-    print("Please handle withdrawals manually or explore other Coinbase APIs/SDKs for this feature.")
-
-    transaction_response_simulated = {
-        # "id": "simulated_withdrawal_id_456"
-    } # Example
-
-    if "id" in transaction_response_simulated: # This block will not run with the current placeholder
-        # db_session.add(
-        #     Withdrawal(
-        #         amount=float(formatted_amount),
-        #         currency=currency_symbol,
-        #         crypto_address=crypto_address,
-        #         coinbase_withdrawal_id=transaction_response_simulated["id"], # Renamed field
-        #         # timestamp might be useful here too: withdrawn_at=datetime.now(timezone.utc)
-        #     )
-        # )
-        # db_session.commit()
-        pass
-
-
-def withdraw(coins_config, accounts_response, client, db_session):
-    if not (accounts_response and accounts_response.accounts):
-        print("No accounts data to process for withdrawals.")
-        return
+def withdraw(args, coins_config, accounts_response, client, db_session, run_id=None):
+    # Sends the coins whose balances are worth withdrawing (see withdrawals.py)
+    return withdraw_coins(args, coins_config, accounts_response, client, db_session, run_id=run_id)
 
-    for coin_symbol, config in coins_config.items():
-        withdrawal_address = config.get("withdrawal_address")
-        if not withdrawal_address:
-            print(f"No withdrawal address specified for {coin_symbol}, not withdrawing.")
-            continue
 
-        account = get_account_by_currency(accounts_response, coin_symbol)
-        if not account:
-            print(f"No account found for {coin_symbol}, cannot withdraw.")
+def list_open_orders(client, product_ids):
+    # Open orders for every product in one paginated query, instead of one per product
+    open_orders = []
+    cursor = None
+    while True:
+        open_orders_response = client.list_orders(
+            product_ids=product_ids,
+            order_status=["OPEN", "PENDING"],
+            limit=LIST_ORDERS_PAGE_SIZE,
+            cursor=cursor,
+        )
+        open_orders.extend(open_orders_response.orders or [])
+        cursor = getattr(open_orders_response, "cursor", None)
+        if getattr(open_orders_response, "has_next", False) is not True or not cursor:
+            break
+    return open_orders
+
+
+def cancel_orders_in_batches(client, order_ids):
+    # Returns {"cancelled": [order_id, ...], "failed": {order_id: reason, ...}}
+    result = {"cancelled": [], "failed": {}}
+    for i in range(0, len(order_ids), CANCEL_ORDERS_BATCH_SIZE):
+        batch = order_ids[i:i + CANCEL_ORDERS_BATCH_SIZE]
+        print(f"Cancelling order IDs: {batch}")
+        try:
+            cancel_response = client.cancel_orders(order_ids=batch)
+        except Exception as e:
+            # Keep going with the remaining batches
+            print(f"Error cancelling orders {batch}: {e}")
+            for order_id in batch:
+                result["failed"][order_id] = str(e)
             continue
-        
-        balance_to_withdraw = float(account.available_balance.value)
+        for res in cancel_response.results or []:
+            if res.success:
+                print(f"Successfully cancelled order {res.order_id}")
+                result["cancelled"].append(res.order_id)
+            else:
+                print(f"Failed to cancel order {res.order_id}: {res.failure_reason}")
+                result["failed"][res.order_id] = str(res.failure_reason)
+    return result
 
-        # Consider a minimum withdrawal amount if applicable from API docs or typical exchange behavior
-        if balance_to_withdraw < 0.00000001: # Example small threshold
-            print(
-                f"{coin_symbol} balance {balance_to_withdraw} is too small, not withdrawing."
-            )
+
+def cancel_open_orders(client, product_ids):
+    print(f"Fetching open orders for {product_ids} to cancel...")
+    order_ids_to_cancel = [o.order_id for o in list_open_orders(client, product_ids)]
+    if not order_ids_to_cancel:
+        print("No open orders found to cancel.")
+        return {"cancelled": [], "failed": {}}
+    return cancel_orders_in_batches(client, order_ids_to_cancel)
+
+
+def limit_order_terms(order):
+    # (price, base_size, filled_size) of a resting GTC limit order, or None for
+    # any other kind of order
+    config = getattr(getattr(order, "order_configuration", None), "limit_limit_gtc", None)
+    try:
+        return (
+            float(config.limit_price),
+            float(config.base_size),
+            float(getattr(order, "filled_size", None) or 0),
+        )
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def fiat_buy_coin(order, fiat_currency):
+    # Coin symbol of a buy order quoted in fiat_currency, or None for sells and
+    # orders on any other quote currency
+    product_id = getattr(order, "product_id", None)
+    if getattr(order, "side", None) != "BUY" or not isinstance(product_id, str):
+        return None
+    coin_symbol, _, quote = product_id.partition("-")
+    return coin_symbol if quote == fiat_currency.upper() else None
+
+
+def remaining_value(order, fiat_currency):
+    # Fiat value of what is left of a resting limit buy in fiat_currency; other
+    # orders don't hold any of it
+    terms = limit_order_terms(order)
+    if terms is None or fiat_buy_coin(order, fiat_currency) is None:
+        return 0.0
+    price, base_size, filled_size = terms
+    return max(base_size - filled_size, 0.0) * price
+
+
+def edit_buy_order(args, coin_symbol, order_id, price, size, client, coins_config=None):
+    # Moves a resting order to a new price and size (its total size, so what
+    # has already filled is included); returns whether the exchange accepted it
+    price = FixedPoint.from_value(price, get_price_precision(coin_symbol, coins_config))
+    size = FixedPoint.from_value(size, get_decimal_precision(coin_symbol, coins_config))
+    print(f"Editing buy order {order_id}: coin={coin_symbol}, price={price}, size={size}")
+    try:
+        edit_response = client.edit_order(order_id=order_id, size=str(size), price=str(price))
+    except Exception as e:
+        print(f"Error editing order {order_id}: {e}")
+        return False
+    if isinstance(edit_response, dict):
+        success = edit_response.get("success", False)
+    else:
+        success = getattr(edit_response, "success", False)
+    if not success:
+        print(f"Edit of order {order_id} failed: {getattr(edit_response, 'errors', edit_response)}")
+    return bool(success)
+
+
+def prepare_open_orders(args, coins_config, client):
+    # Step 1 of a buy cycle. With --order-sync replace every open order is
+    # cancelled and None returned; with diff (the default) the open orders are
+    # only listed, for sync_buy_orders to reconcile with the new ladder.
+    if getattr(args, "order_sync", DEFAULT_ORDER_SYNC) == "replace":
+        cancel_configured_orders(args, coins_config, client)
+        return None
+    print("Step 1: Listing open orders for configured products.")
+    product_ids = [f"{coin_symbol.upper()}-{args.fiat_currency.upper()}" for coin_symbol in coins_config.keys()]
+    open_orders = list_open_orders(client, product_ids)
+    print(f"Found {len(open_orders)} open orders.")
+    return open_orders
+
+
+def sync_buy_orders(args, ladder, open_orders, client, db_session, coins_config=None, run_id=None):
+    # Brings the open orders in line with the planned ladder of (coin_symbol,
+    # price, size) orders: orders within --ladder-tolerance of a rung are left
+    # alone, others are edited onto the rungs still missing, and only then are
+    # the leftovers cancelled and the remaining rungs placed. Anything that
+    # isn't one of our GTC limit buys is cancelled, as a full replace would.
+    tolerance = getattr(args, "ladder_tolerance", DEFAULT_LADDER_TOLERANCE)
+    edit = getattr(args, "edit_orders", True)
+    rungs = {}
+    for coin_symbol, price, size in ladder:
+        rungs.setdefault(coin_symbol, []).append((price, size))
+    live = {}
+    filled = {}
+    cancels = []
+    for order in open_orders:
+        terms = limit_order_terms(order)
+        coin_symbol = fiat_buy_coin(order, args.fiat_currency)
+        if terms is None or coin_symbol is None:
+            cancels.append(order.order_id)
+            continue
+        price, base_size, filled_size = terms
+        live.setdefault(coin_symbol, []).append((order.order_id, price, base_size - filled_size))
+        filled[order.order_id] = filled_size
+
+    kept = 0
+    edits = []
+    places = []
+    for coin_symbol in list(rungs) + [c for c in live if c not in rungs]:
+        keep, coin_edits, coin_cancels, coin_places = diff_ladder(rungs.get(coin_symbol, []), live.get(coin_symbol, []), tolerance, edit)
+        kept += len(keep)
+        edits.extend((coin_symbol,) + e for e in coin_edits)
+        cancels.extend(coin_cancels)
+        places.extend((coin_symbol,) + place for place in coin_places)
+
+    # Cancels go first so the funds they release can back the edits and new orders
+    cancelled = cancel_orders_in_batches(client, cancels)["cancelled"] if cancels else []
+
+    edited = {}
+    failed_edits = {}
+    for coin_symbol, order_id, rung, price, size in edits:
+        total_size = Decimal(str(size)) + Decimal(str(filled[order_id]))
+        if edit_buy_order(args, coin_symbol, order_id, price, total_size, client, coins_config):
+            edited[order_id] = (coin_symbol, price, total_size)
         else:
-            execute_withdrawal(
-                client,
-                str(balance_to_withdraw), # Pass as string
-                coin_symbol,
-                withdrawal_address,
-                db_session,
-            )
+            failed_edits[order_id] = (coin_symbol, rung, price, size)
+    if failed_edits:
+        # Fall back to replacing them, but only once the old order is gone:
+        # re-placing a rung whose order is still on the book would spend its budget twice
+        replaced = cancel_orders_in_batches(client, list(failed_edits))["cancelled"]
+        cancelled.extend(replaced)
+        places.extend(failed_edits[order_id] for order_id in replaced if order_id in failed_edits)
+    if edited:
+        for row in db_session.query(Order).filter(Order.cbpro_order_id.in_(list(edited))):
+            coin_symbol, price, total_size = edited[row.cbpro_order_id]
+            row.price = FixedPoint.from_value(price, get_price_precision(coin_symbol, coins_config)).decimal()
+            row.size = FixedPoint.from_value(total_size, get_decimal_precision(coin_symbol, coins_config)).decimal()
+        db_session.commit()
+
+    print(
+        f"Ladder sync: kept {kept}, edited {len(edited)}, cancelled {len(cancelled)}, "
+        f"placing {len(places)} of {len(ladder)} orders."
+    )
+    submit_buy_orders(
+        args,
+        [(coin_symbol, price, size) for coin_symbol, _, price, size in places],
+        client,
+        db_session,
+        coins_config,
+        run_id=run_id,
+        rung_indexes=[rung for _, rung, _, _ in places],
+    )
+    return {"kept": kept, "edited": len(edited), "cancelled": len(cancelled), "placed": len(places)}
 
 
 def get_withdrawn_balances(db_session):
-    from sqlalchemy import func # Keep this import local if only used here
-
     withdrawn_balances = {}
     try:
-        # Ensure Withdrawal.amount is a numeric type in the DB for sum() to work correctly.
-        withdrawals = (
-            db_session.query(func.sum(Withdrawal.amount), Withdrawal.currency)
-            .group_by(Withdrawal.currency)
-            .all()
-        )
-        for total_amount, currency_symbol in withdrawals:
-            withdrawn_balances[currency_symbol.upper()] = total_amount if total_amount else 0.0
+        # Read from the balance ledger, then handed on as floats like the exchange balances
+        for currency_symbol, total_amount in ledger_totals(db_session, "withdrawn").items():
+            withdrawn_balances[currency_symbol] = float(total_amount)
     except Exception as e:
         print(f"Error fetching withdrawn balances from DB: {e}")
         # Return empty or partially filled dict, or raise
     return withdrawn_balances
 
 
-def buy(args, coins_config, client, db_session):
-    # coins_config is the original dict from args.coins
-    print("Starting buy and (maybe) withdrawal process.")
-    
+def cancel_configured_orders(args, coins_config, client):
     print("Step 1: Cancelling existing open orders for configured products.")
     active_product_ids_to_cancel = [f"{coin_symbol.upper()}-{args.fiat_currency.upper()}" for coin_symbol in coins_config.keys()]
     
     try:
-        for product_id in active_product_ids_to_cancel:
-            print(f"Fetching open orders for {product_id} to cancel...")
-            # Consider relevant statuses for cancellation
-            open_orders_response = client.list_orders(product_ids=[product_id], order_status=["OPEN", "PENDING"])
-            if open_orders_response.orders:
-                order_ids_to_cancel = [o.order_id for o in open_orders_response.orders]
-                if order_ids_to_cancel:
-                    print(f"Cancelling order IDs for {product_id}: {order_ids_to_cancel}")
-                    cancel_response = client.cancel_orders(order_ids=order_ids_to_cancel)
-                    # Process cancel_response to check for success/failures
-                    if cancel_response.results:
-                        for res in cancel_response.results:
-                            if res.success:
-                                print(f"Successfully cancelled order {res.order_id}")
-                            else:
-                                print(f"Failed to cancel order {res.order_id}: {res.failure_reason}")
-                else:
-                    print(f"No open orders found for {product_id} to cancel.")
-            else:
-                print(f"No orders listed for {product_id} (or error in listing).")
+        cancel_result = cancel_open_orders(client, active_product_ids_to_cancel)
+        print(f"Cancelled {len(cancel_result['cancelled'])} open orders, {len(cancel_result['failed'])} failed.")
     except HTTPError as e:
         print(f"HTTPError during order cancellation pre-process: {e}") # Continue if non-critical
     except Exception as e:
         print(f"Error during order cancellation pre-process: {e}") # Continue if non-critical
 
 
+def get_configured_products_info(args, coins_config, client):
+    # Update a copy of coins_config with minimum order sizes from product info;
+    # each coin's dict is copied too so the caller's config is left as parsed
+    return get_products_info(
+        client,
+        {coin_symbol: dict(coin_config) for coin_symbol, coin_config in coins_config.items()},
+        args.fiat_currency.upper(),
+        cache=get_cache(getattr(args, "db_engine", None), "products"),
+        ttl=getattr(args, "products_ttl", DEFAULT_PRODUCTS_TTL),
+    )
+
+
+def get_configured_prices(args, coin_symbols_list, client):
+    return get_market_prices(
+        client,
+        coin_symbols_list,
+        args.fiat_currency.upper(),
+        source=getattr(args, "price_source", DEFAULT_PRICE_SOURCE),
+        anchor=getattr(args, "price_anchor", DEFAULT_PRICE_ANCHOR),
+        max_workers=getattr(args, "price_workers", DEFAULT_PRICE_WORKERS),
+        timeout=getattr(args, "price_timeout", DEFAULT_PRICE_TIMEOUT),
+    )
+
+
+def get_configured_weights(args, coins_config):
+    return get_weights(
+        coins_config,
+        args.fiat_currency,
+        cache=get_cache(getattr(args, "db_engine", None), "weights"),
+        ttl=getattr(args, "weights_ttl", DEFAULT_WEIGHTS_TTL),
+        max_staleness=getattr(args, "weights_max_staleness", DEFAULT_WEIGHTS_MAX_STALENESS),
+        id_index_cache=get_cache(getattr(args, "db_engine", None), "coingecko_ids"),
+    )
+
+
+def buy(args, coins_config, client, db_session):
+    # coins_config is the original dict from args.coins
+    run_id = getattr(args, "run_id", None) or new_run_id()
+    print(f"Starting buy and (maybe) withdrawal process, run id {run_id}.")
+    
+    try:
+        open_orders = prepare_open_orders(args, coins_config, client)
+    except Exception as e:
+        print(f"Error listing open orders: {e}. Aborting buy cycle.")
+        return
+
     print("\nStep 2: Fetching current account balances and market prices.")
     try:
         accounts_response = client.get_accounts()
-        # Update coins_config with minimum order sizes from product info
-        coins_config_updated = get_products_info(client, coins_config.copy(), args.fiat_currency.upper())
+        coins_config_updated = get_configured_products_info(args, coins_config, client)
         
         coin_symbols_list = list(coins_config_updated.keys())
-        prices = get_prices(client, coin_symbols_list, args.fiat_currency.upper())
+        prices = get_configured_prices(args, coin_symbols_list, client)
     except Exception as e:
         print(f"Critical error fetching accounts/products/prices: {e}. Aborting buy cycle.")
         return
 
+    buy_with_balances(args, coins_config_updated, accounts_response, prices, client, db_session, run_id, open_orders=open_orders)
+
+
+def buy_with_balances(args, coins_config_updated, accounts_response, prices, client, db_session, run_id, weights=None, open_orders=None):
+    # Everything after the API fetches; shared by the sync and async engines.
+    # open_orders is None when they were cancelled in step 1, otherwise the
+    # open orders to reconcile with the new ladders (see sync_buy_orders).
+    try:
+        # Sends that failed since drop out of the withdrawn balances
+        refresh_pending_withdrawals(args, accounts_response, db_session)
+    except Exception as e:
+        print(f"Error refreshing pending withdrawals: {e}")
     withdrawn_balances = get_withdrawn_balances(db_session)
     
     print(f"Accounts: {json.dumps(accounts_response.to_dict(), indent=2) if accounts_response else 'N/A'}")
@@ -601,6 +887,12 @@ def buy(args, coins_config, client, db_session):
     print(f"Current Fiat Value of Holdings (per coin): {json.dumps(fiat_balances_per_coin, indent=2)}")
 
     available_fiat_cash = fiat_balances_per_coin.get(args.fiat_currency.upper(), 0.0)
+    if open_orders:
+        # Cash held by the open orders is spent again on the new ladders, as it
+        # would be had they been cancelled
+        held_fiat_cash = sum(remaining_value(order, args.fiat_currency) for order in open_orders)
+        print(f"Fiat held by {len(open_orders)} open orders: {held_fiat_cash:.2f}")
+        available_fiat_cash += held_fiat_cash
     print(f"Available Fiat Cash ({args.fiat_currency.upper()}): {available_fiat_cash:.2f}")
 
     # Reserve fee amount from available fiat cash
@@ -621,106 +913,97 @@ def buy(args, coins_config, client, db_session):
             fiat_to_spend_after_fees, # Pass the actual amount to spend
             client,
             db_session,
+            run_id=run_id,
+            weights=weights,
+            open_orders=open_orders,
         )
     else:
         print(
             f"Fiat balance after fee reservation ({fiat_to_spend_after_fees:.2f} {args.fiat_currency.upper()}) is not above threshold ({args.withdrawal_threshold} {args.fiat_currency.upper()})."
             " Proceeding to withdraw coins without new buys."
         )
+        if open_orders:
+            # Nothing to ladder, so no open order is kept either
+            sync_buy_orders(args, [], open_orders, client, db_session, coins_config_updated, run_id=run_id)
         # Fetch accounts again if needed, or pass if still valid
         # The current accounts_response should be fresh enough
-        withdraw(coins_config_updated, accounts_response, client, db_session)
-
-
-def main():
-    default_coins_str = """
-    {
-      "BTC":{
-        "name":"Bitcoin",
-        "withdrawal_address":null,
-        "external_balance":0
-      },
-      "ETH":{
-        "name":"Ethereum",
-        "withdrawal_address":null,
-        "external_balance":0
-      },
-      "LTC":{
-        "name":"Litecoin",
-        "withdrawal_address":null,
-        "external_balance":0
-      }
-    }
-    """
-
-    parser = argparse.ArgumentParser(
-        description="Coinbase Advanced Trade Bot: Buy coins based on market cap weights or deposit funds.",
-        epilog=f"Default coins configuration: {default_coins_str}",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-    )
-    parser.add_argument("--mode", choices=['deposit', 'buy'], help="Operational mode: 'deposit' or 'buy'", required=True)
-    parser.add_argument("--amount", type=float, help="Amount for deposit (only in 'deposit' mode)")
-    parser.add_argument("--key", help="Coinbase API Key (name, e.g., organizations/org-id/apiKeys/key-id)", required=True)
-    parser.add_argument("--secret", help="Coinbase API Secret (the private key string)", required=True)
-    # Passphrase is not used with CDP API keys for Advanced Trade
-    # parser.add_argument("--passphrase", help="API passphrase", required=True) 
-    # API URL is handled by the SDK, using its default or allowing base_url override if necessary,
-    # but for typical use, it's not needed.
-    # parser.add_argument("--api-url", help="API URL", default="https://api.coinbase.com")
-
-    parser.add_argument("--payment-method-id", help="Payment Method ID for fiat deposits (only in 'deposit' mode)")
-    parser.add_argument("--starting-discount", type=float, help="Starting discount for limit buy orders (e.g., 0.005 for 0.5%%, default: 0.005)", default=0.005)
-    parser.add_argument("--discount-step", type=float, help="Incremental discount step for subsequent buy orders (e.g., 0.01 for 1%%, default: 0.01)", default=0.01)
-    parser.add_argument("--order-count", type=int, help="Number of buy orders to split into (default: 5)", default=5)
-    parser.add_argument("--fiat-currency", help="Fiat currency for trading and balances (default: USD)", default="USD")
-    parser.add_argument("--withdrawal-threshold", help="If fiat balance (after reserving fees) is below this, withdraw instead of buying (default: 25.0)", type=float, default=25.0)
-    parser.add_argument("--db-engine", help="SQLAlchemy DB engine string (default: sqlite:///cbpro_history.db)", default="sqlite:///cbpro_history.db")
-    parser.add_argument("--max-retries", help="Max retries on API failures (default: 3)", type=int, default=3)
-    parser.add_argument("--coins", help="JSON string for coins to trade, their names, withdrawal addresses, and external balances.", default=default_coins_str)
-    parser.add_argument("--base-fee", help="Estimated trading fee rate to reserve from fiat balance (e.g., 0.006 for 0.6%%, default: 0.0060)", type=float, default=0.0060) # Typical taker fee
-
-    args = parser.parse_args()
-    
+        withdraw(args, coins_config_updated, accounts_response, client, db_session, run_id=run_id)
+
+
+def buy_cycle(args, coins_config, client, db_session):
+    # Returns the time (as a timestamp) to try again instead when, with
+    # --wait-for-deposits, the cycle is skipped until a deposit clears
     try:
-        coins_config = json.loads(args.coins)
-        # Ensure coin symbols are uppercase for consistency
-        coins_config = {k.upper(): v for k,v in coins_config.items()}
-    except json.JSONDecodeError as e:
-        print(f"Error: Invalid JSON string for --coins argument: {e}")
-        sys.exit(1)
-        
+        wait_until = deposit_hold(args, client, db_session)
+    except Exception as e:
+        print(f"Error checking pending deposits: {e}")
+        db_session.rollback()
+        wait_until = None
+    if wait_until is not None:
+        print(f"Skipping this buy cycle until the pending deposit clears at {wait_until:%Y-%m-%d %H:%M:%S} UTC.")
+        return wait_until.timestamp()
+    if getattr(args, "engine", "sync") == "async":
+        from .engine_async import run_async_buy
+        run_async_buy(args, coins_config, client, db_session)
+    else:
+        buy(args, coins_config, client, db_session)
+
+
+def configure_connection_pool(client, pool_size):
+    # requests keeps at most 10 connections per host by default, fewer than the
+    # worker pools can use; connections beyond that would be opened and thrown
+    # away on every request
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 10))
+    client.session.mount("https://", adapter)
+
+
+def run(args, coins_config):
+    # Everything after argument parsing; cli.main() only imports this module
+    # (and with it the SDK, requests and SQLAlchemy) once the arguments are valid
+    from coinbase.rest import RESTClient
+
     print(f"--coins='{json.dumps(coins_config, separators=(',', ':'))}'")
     print(f"Using API Key: {args.key[:25]}...") # Print only a part of the key for security
 
-    client = RESTClient(api_key=args.key, api_secret=args.secret)
+    client = RateLimitedClient(
+        RESTClient(api_key=args.key, api_secret=args.secret),
+        private_rate=args.private_rate,
+        public_rate=args.public_rate,
+        max_retries=args.rate_limit_retries,
+        max_transient_retries=args.max_retries,
+    )
+    configure_connection_pool(client, max(args.price_workers, args.order_workers, args.async_workers))
+    # Raw v2 calls (deposits, withdrawals) share the SDK's rate limits and retries
+    get_raw_client(args.key, args.secret, limiter=client)
     db_session = get_session(args.db_engine)
 
-    retry_count = 0
-    backoff_seconds = 5
-    while retry_count < args.max_retries:
-        retry_count += 1
-        print(f"Attempt {retry_count} of {args.max_retries}")
-        try:
-            if args.mode == "deposit":
-                deposit(args, client, db_session)
-            elif args.mode == "buy":
-                buy(args, coins_config, client, db_session)
-            sys.stdout.flush()
-            # If successful, exit
-            sys.exit(0) 
-        except Exception as e:
-            print(f"Caught an exception: {e}")
-            import traceback
-            traceback.print_exc()
-            sys.stderr.flush()
-            sys.stdout.flush()
-            if retry_count < args.max_retries:
-                print(f"Sleeping for {backoff_seconds}s before retrying...")
-                time.sleep(backoff_seconds)
-                backoff_seconds *= 2 # Exponential backoff
-            else:
-                print("Max retries reached. Exiting.")
-                sys.exit(1)
+    # Failed API calls are retried one at a time by RateLimitedClient, so the
+    # cycle itself only runs once
+    try:
+        if args.mode == "deposit":
+            deposit(args, client, db_session)
+        elif args.mode == "buy":
+            buy_cycle(args, coins_config, client, db_session)
+        elif args.mode == "reconcile":
+            from .reconcile import reconcile
+            reconcile(args, client, db_session)
+        elif args.mode == "daemon":
+            from .daemon import run_daemon
+            run_daemon(args, coins_config, client, db_session)
+        elif args.mode == "stream":
+            from .stream import run_stream
+            run_stream(args, coins_config, client, db_session)
+        print(client.stats())
+        sys.stdout.flush()
+    except Exception as e:
+        print(f"Caught an exception: {e}")
+        import traceback
+        traceback.print_exc()
+        print(client.stats())
+        sys.stderr.flush()
+        sys.stdout.flush()
+        sys.exit(1)
+    sys.exit(0)
 
 if __name__ == "__main__": # Corrected conditional
     main()
\ No newline at end of file
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+from concurrent.futures import ThreadPoolExecutor, wait
+import json
+
+from requests.exceptions import HTTPError
+
+from .defaults import (
+    DEFAULT_PRICE_ANCHOR,
+    DEFAULT_PRICE_SOURCE,
+    DEFAULT_PRICE_TIMEOUT,
+    DEFAULT_PRICE_WORKERS,
+)
+
+
+def fetch_ticker_price(client, c_symbol, fiat_currency):
+    product_id = f"{c_symbol}-{fiat_currency}"
+    ticker_response = client.get_product(product_id=product_id)
+    if ticker_response and ticker_response.price:
+        print(f"{c_symbol} ticker price: {ticker_response.price}")
+        return float(ticker_response.price)
+    raise Exception(f"No price available for {c_symbol} or invalid response. Ticker: {ticker_response}")
+
+
+def get_prices(client, coins_symbols_list, fiat_currency, max_workers=DEFAULT_PRICE_WORKERS, timeout=DEFAULT_PRICE_TIMEOUT):
+    # Fetch tickers through a bounded thread pool. A coin whose request fails or
+    # hasn't finished `timeout` seconds after the fetch started (queued requests
+    # share the same deadline) is reported and left out of the result
+    # (start_buy_orders skips coins without a price); we only abort when no price
+    # could be fetched at all.
+    prices = {}
+    failures = {}
+    if not coins_symbols_list:
+        return prices
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(coins_symbols_list))))
+    try:
+        futures = [
+            (c_symbol, executor.submit(fetch_ticker_price, client, c_symbol, fiat_currency))
+            for c_symbol in coins_symbols_list
+        ]
+        _, not_done = wait([future for _, future in futures], timeout=timeout)
+        # Collect in submission order so the mapping keeps the configured coin order
+        for c_symbol, future in futures:
+            product_id = f"{c_symbol}-{fiat_currency}"
+            if future in not_done:
+                future.cancel()
+                print(f"Timed out after {timeout}s fetching ticker for {product_id}")
+                failures[c_symbol] = f"timed out after {timeout}s"
+                continue
+            try:
+                prices[c_symbol] = future.result()
+            except HTTPError as e:
+                print(f"HTTPError fetching ticker for {product_id}: {e}")
+                failures[c_symbol] = str(e)
+            except Exception as e:
+                print(f"Error fetching ticker for {product_id}: {e}")
+                failures[c_symbol] = str(e)
+    finally:
+        # Don't block on requests that are still hanging after their timeout
+        executor.shutdown(wait=False)
+
+    if failures:
+        print(f"Failed to fetch prices for {len(failures)} of {len(coins_symbols_list)} products: {json.dumps(failures, indent=2)}")
+        if not prices:
+            raise Exception(f"Could not fetch a price for any of {coins_symbols_list}")
+    return prices
+
+
+def get_best_bid_ask_prices(client, coins_symbols_list, fiat_currency, anchor=DEFAULT_PRICE_ANCHOR):
+    # One request for every configured product
+    product_ids = [f"{c_symbol}-{fiat_currency}" for c_symbol in coins_symbols_list]
+    response = client.get_best_bid_ask(product_ids=product_ids)
+    prices = {}
+    for pricebook in response.pricebooks or []:
+        c_symbol = pricebook.product_id.split("-")[0]
+        if c_symbol not in coins_symbols_list or not pricebook.bids:
+            continue
+        bid = float(pricebook.bids[0].price)
+        if anchor == "bid" or not pricebook.asks:
+            price = bid
+        else:
+            price = (bid + float(pricebook.asks[0].price)) / 2
+        if price > 0:
+            print(f"{c_symbol} {anchor} price: {price}")
+            prices[c_symbol] = price
+    return prices
+
+
+def get_product_listing_prices(client, coins_symbols_list, fiat_currency, anchor=DEFAULT_PRICE_ANCHOR):
+    # The product listing only carries the last trade price, so `anchor` is ignored
+    product_ids = [f"{c_symbol}-{fiat_currency}" for c_symbol in coins_symbols_list]
+    response = client.get_products(product_type="SPOT", product_ids=product_ids)
+    prices = {}
+    for p in response.products or []:
+        if p.base_currency_id in coins_symbols_list and p.quote_currency_id == fiat_currency and p.price:
+            print(f"{p.base_currency_id} listing price: {p.price}")
+            prices[p.base_currency_id] = float(p.price)
+    return prices
+
+
+# Bulk price sources, each fetching every configured product in a single request.
+# "ticker" is the per-product get_prices path that the bulk sources fall back to.
+PRICE_SOURCES = {
+    "best_bid_ask": get_best_bid_ask_prices,
+    "products": get_product_listing_prices,
+    "ticker": None,
+}
+
+
+def get_market_prices(
+    client,
+    coins_symbols_list,
+    fiat_currency,
+    source=DEFAULT_PRICE_SOURCE,
+    anchor=DEFAULT_PRICE_ANCHOR,
+    max_workers=DEFAULT_PRICE_WORKERS,
+    timeout=DEFAULT_PRICE_TIMEOUT,
+):
+    bulk_source = PRICE_SOURCES[source]
+    if bulk_source is None:
+        return get_prices(client, coins_symbols_list, fiat_currency, max_workers=max_workers, timeout=timeout)
+
+    try:
+        prices = bulk_source(client, coins_symbols_list, fiat_currency, anchor=anchor)
+    except Exception as e:
+        print(f"Bulk price fetch from {source} failed ({e}), falling back to per-product tickers.")
+        return get_prices(client, coins_symbols_list, fiat_currency, max_workers=max_workers, timeout=timeout)
+
+    missing = [c_symbol for c_symbol in coins_symbols_list if c_symbol not in prices]
+    if missing:
+        print(f"No {source} price for {missing}, fetching their tickers individually.")
+        try:
+            fallback_prices = get_prices(client, missing, fiat_currency, max_workers=max_workers, timeout=timeout)
+        except Exception as e:
+            print(f"Error fetching tickers for {missing}: {e}")
+            fallback_prices = {}
+        # Keep the configured coin order
+        prices = {
+            c_symbol: prices.get(c_symbol, fallback_prices.get(c_symbol))
+            for c_symbol in coins_symbols_list
+            if c_symbol in prices or c_symbol in fallback_prices
+        }
+    if not prices:
+        raise Exception(f"Could not fetch a price for any of {coins_symbols_list}")
+    return prices
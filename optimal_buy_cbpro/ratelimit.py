@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+import random
+import threading
+import time
+
+from requests.exceptions import ConnectionError as RequestsConnectionError, HTTPError, Timeout
+
+from .defaults import (
+    DEFAULT_PRIVATE_RATE,
+    DEFAULT_PUBLIC_RATE,
+    DEFAULT_RATE_LIMIT_BACKOFF,
+    DEFAULT_RATE_LIMIT_RETRIES,
+    DEFAULT_TRANSIENT_RETRIES,
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate or 0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.acquired = 0
+        self.waited = 0.0  # Total seconds callers spent throttled
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        # A rate of 0 or None disables throttling
+        if not self.rate:
+            with self._lock:
+                self.acquired += 1
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    self.acquired += 1
+                    return
+                wait = (tokens - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+
+
+PUBLIC_METHODS = {
+    "get_public_candles",
+    "get_public_market_trades",
+    "get_public_product",
+    "get_public_product_book",
+    "get_public_products",
+    "get_unix_time",
+}
+
+
+def is_rate_limited(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) == 429
+
+
+def is_transient(error):
+    if isinstance(error, (RequestsConnectionError, Timeout)):
+        return True
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return isinstance(error, HTTPError) and isinstance(status_code, int) and status_code >= 500
+
+
+class RateLimitedClient:
+    """Wraps a RESTClient so every API call first takes a token from the public
+    or private bucket, and a 429, 5xx or network error is retried on its own
+    with jittered exponential backoff instead of failing the whole buy cycle."""
+
+    def __init__(
+        self,
+        client,
+        private_rate=DEFAULT_PRIVATE_RATE,
+        public_rate=DEFAULT_PUBLIC_RATE,
+        max_retries=DEFAULT_RATE_LIMIT_RETRIES,
+        backoff=DEFAULT_RATE_LIMIT_BACKOFF,
+        max_transient_retries=DEFAULT_TRANSIENT_RETRIES,
+    ):
+        self.client = client
+        self.private_bucket = TokenBucket(private_rate)
+        self.public_bucket = TokenBucket(public_rate)
+        self.max_retries = max_retries
+        self.max_transient_retries = max_transient_retries
+        self.backoff = backoff
+        self.counters = {"calls": 0, "rate_limited": 0, "transient_errors": 0, "retries": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+        bucket = self.public_bucket if name in PUBLIC_METHODS else self.private_bucket
+
+        def call(*args, **kwargs):
+            return self._call(name, bucket, attr, args, kwargs)
+        return call
+
+    def call(self, name, method, *args, **kwargs):
+        # A call the wrapped client doesn't make itself, such as a raw REST
+        # request, under the same private bucket, retries and counters
+        return self._call(name, self.private_bucket, method, args, kwargs)
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _call(self, name, bucket, method, args, kwargs):
+        attempt = 0
+        while True:
+            bucket.acquire()
+            self._count("calls")
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                if is_rate_limited(e):
+                    self._count("rate_limited")
+                    max_retries = self.max_retries
+                elif is_transient(e):
+                    self._count("transient_errors")
+                    max_retries = self.max_transient_retries
+                else:
+                    raise
+                if attempt >= max_retries:
+                    self._count("failures")
+                    raise
+                # Full jitter, so concurrent workers don't retry in lockstep
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                retry_after = getattr(e.response, "headers", {}).get("Retry-After")
+                if retry_after:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+                attempt += 1
+                self._count("retries")
+                print(f"{e} calling {name}, retry {attempt}/{max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def stats(self):
+        throttled = self.private_bucket.waited + self.public_bucket.waited
+        return (
+            f"API calls: {self.counters['calls']}, rate limited: {self.counters['rate_limited']}, "
+            f"server/network errors: {self.counters['transient_errors']}, "
+            f"retried: {self.counters['retries']}, failed: {self.counters['failures']}, "
+            f"throttled for {throttled:.2f}s"
+        )
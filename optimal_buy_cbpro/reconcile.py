@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# Fill reconciliation: copies the exchange's fills and order statuses into the
+# history DB, so cost basis and fill state can be read from the history.
+import json
+from datetime import datetime
+
+from sqlalchemy import insert, select, update
+
+from .history import Fill, Order, OrderStatus, SyncCursor, add_to_ledger, to_decimal
+
+# Fills are paged newest first; each run asks only for fills from the newest
+# sequence timestamp already stored, and the page cursor is stored after every
+# page so an interrupted run resumes where it stopped
+FILLS_PAGE_SIZE = 1000
+# Order statuses are looked up by id for the placed orders that aren't final
+# yet, this many ids per list_orders query (they go in the query string)
+ORDER_STATUS_BATCH_SIZE = 100
+FINAL_ORDER_STATUSES = ("FILLED", "CANCELLED", "EXPIRED", "FAILED")
+# Primary keys per IN (...) lookup, well under SQLite's variable limit
+UPSERT_CHUNK_SIZE = 500
+
+
+def load_cursor(db_session, name):
+    row = db_session.get(SyncCursor, name)
+    return json.loads(row.state) if row else {}
+
+
+def save_cursor(db_session, name, state):
+    row = db_session.get(SyncCursor, name)
+    if row is None:
+        db_session.add(SyncCursor(name=name, state=json.dumps(state)))
+    else:
+        row.state = json.dumps(state)
+
+
+def upsert(db_session, model, rows):
+    # Inserts the new rows and updates the existing ones (by primary key) with
+    # one bulk statement each; returns the rows that were new
+    key = model.__mapper__.primary_key[0]
+    rows_by_key = {row[key.key]: row for row in rows}
+    keys = list(rows_by_key)
+    existing = set()
+    for i in range(0, len(keys), UPSERT_CHUNK_SIZE):
+        existing.update(db_session.scalars(select(key).where(key.in_(keys[i:i + UPSERT_CHUNK_SIZE]))))
+    new_rows = [row for k, row in rows_by_key.items() if k not in existing]
+    changed_rows = [row for k, row in rows_by_key.items() if k in existing]
+    if new_rows:
+        db_session.execute(insert(model), new_rows)
+    if changed_rows:
+        db_session.execute(update(model), changed_rows)
+    return new_rows
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def parse_decimal(value):
+    return to_decimal(value) if value not in (None, "") else None
+
+
+def fill_row(fill):
+    product_id = getattr(fill, "product_id", None)
+    return {
+        "entry_id": fill.entry_id,
+        "trade_id": getattr(fill, "trade_id", None),
+        "cbpro_order_id": getattr(fill, "order_id", None),
+        "product_id": product_id,
+        "currency": product_id.split("-")[0] if product_id else None,
+        "side": getattr(fill, "side", None),
+        "price": parse_decimal(getattr(fill, "price", None)),
+        "size": parse_decimal(getattr(fill, "size", None)),
+        "commission": parse_decimal(getattr(fill, "commission", None)),
+        "trade_time": parse_time(getattr(fill, "trade_time", None)),
+        "sequence_timestamp": getattr(fill, "sequence_timestamp", None),
+    }
+
+
+def order_status_row(order):
+    return {
+        "cbpro_order_id": order.order_id,
+        "product_id": getattr(order, "product_id", None),
+        "status": getattr(order, "status", None),
+        "filled_size": parse_decimal(getattr(order, "filled_size", None)),
+        "average_filled_price": parse_decimal(getattr(order, "average_filled_price", None)),
+        "total_fees": parse_decimal(getattr(order, "total_fees", None)),
+        "updated_at": datetime.now().astimezone(),
+    }
+
+
+def newest_timestamp(current, candidate):
+    if not candidate:
+        return current
+    if current is None or parse_time(candidate) > parse_time(current):
+        return candidate
+    return current
+
+
+def sync_fills(client, db_session):
+    # Returns the number of fills that weren't in the history yet
+    state = load_cursor(db_session, "fills")
+    since = state.get("since")
+    cursor = state.get("cursor")
+    newest = state.get("newest", since)
+    if cursor:
+        print(f"Resuming fill sync from stored cursor (fills since {since}).")
+    new_fills = 0
+    while True:
+        response = client.get_fills(start_sequence_timestamp=since, limit=FILLS_PAGE_SIZE, cursor=cursor)
+        rows = [fill_row(fill) for fill in getattr(response, "fills", None) or []]
+        # Already stored fills (the one at `since` comes back every run) are
+        # updated in place and don't move the ledger again
+        filled = {}
+        for row in upsert(db_session, Fill, rows):
+            if row["currency"] and row["size"] is not None:
+                filled[row["currency"]] = filled.get(row["currency"], 0) + row["size"]
+            new_fills += 1
+        for currency, size in filled.items():
+            add_to_ledger(db_session, currency, "filled", size)
+        for row in rows:
+            newest = newest_timestamp(newest, row["sequence_timestamp"])
+        cursor = getattr(response, "cursor", None)
+        if not rows or not cursor:
+            save_cursor(db_session, "fills", {"since": newest})
+            db_session.commit()
+            return new_fills
+        save_cursor(db_session, "fills", {"since": since, "cursor": cursor, "newest": newest})
+        db_session.commit()
+
+
+def pending_order_ids(db_session):
+    # Placed (or filled) orders whose status isn't final yet
+    final = select(OrderStatus.cbpro_order_id).where(OrderStatus.status.in_(FINAL_ORDER_STATUSES))
+    order_ids = set()
+    for column in (Order.cbpro_order_id, Fill.cbpro_order_id):
+        order_ids.update(db_session.scalars(
+            select(column).distinct().where(column.is_not(None), column.not_in(final))
+        ))
+    return sorted(order_ids)
+
+
+def sync_order_statuses(client, db_session):
+    # Returns the number of orders whose status was refreshed
+    order_ids = pending_order_ids(db_session)
+    refreshed = 0
+    for i in range(0, len(order_ids), ORDER_STATUS_BATCH_SIZE):
+        batch = order_ids[i:i + ORDER_STATUS_BATCH_SIZE]
+        rows = []
+        cursor = None
+        while True:
+            response = client.list_orders(order_ids=batch, limit=len(batch), cursor=cursor)
+            rows.extend(order_status_row(order) for order in response.orders or [])
+            cursor = getattr(response, "cursor", None)
+            if getattr(response, "has_next", False) is not True or not cursor:
+                break
+        upsert(db_session, OrderStatus, rows)
+        db_session.commit()
+        refreshed += len(rows)
+    return refreshed
+
+
+def reconcile(args, client, db_session):
+    print("Reconciling fills and order statuses with the exchange.")
+    new_fills = sync_fills(client, db_session)
+    refreshed = sync_order_statuses(client, db_session)
+    print(f"Stored {new_fills} new fills, refreshed the status of {refreshed} orders.")
+    return {"fills": new_fills, "orders": refreshed}
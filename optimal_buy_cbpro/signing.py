@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# JWT signing for the raw REST calls the SDK doesn't wrap, such as the v2
+# deposit and commit endpoints. The PEM key is parsed once per API key, a
+# token is reused for the same method and path until shortly before it
+# expires, and every call goes over one pooled requests.Session, so repeated
+# calls pay neither for signing nor for a new TLS handshake.
+import hashlib
+import secrets
+import threading
+import time
+
+import jwt
+import requests
+from cryptography.hazmat.primitives import serialization
+from requests.adapters import HTTPAdapter
+
+API_HOST = "api.coinbase.com"
+JWT_LIFETIME = 120  # Seconds; Coinbase rejects tokens valid for longer
+# A cached token is replaced this many seconds before it expires, leaving
+# room for clock skew and for the request still being in flight
+JWT_REFRESH_MARGIN = 15
+RAW_REQUEST_TIMEOUT = 30  # Seconds
+RAW_POOL_SIZE = 10
+
+
+def format_uri(method, path, host=API_HOST):
+    # The "uri" claim, e.g. "POST api.coinbase.com/v2/accounts/<id>/deposits"
+    return f"{method.upper()} {host}{path}"
+
+
+class JWTSigner:
+    """Signs ES256 JWTs for one CDP API key. Tokens are cached per URI and
+    handed out again until JWT_REFRESH_MARGIN seconds before their exp."""
+
+    def __init__(self, api_key, api_secret, lifetime=JWT_LIFETIME, margin=JWT_REFRESH_MARGIN, clock=time.time):
+        self.api_key = api_key
+        self.private_key = serialization.load_pem_private_key(api_secret.encode("utf-8"), password=None)
+        self.lifetime = lifetime
+        self.margin = margin
+        self.clock = clock
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.signed = 0
+
+    def sign(self, uri, now):
+        payload = {
+            "sub": self.api_key,
+            "iss": "cdp",
+            "nbf": now,
+            "exp": now + self.lifetime,
+            "uri": uri,
+        }
+        return jwt.encode(
+            payload,
+            self.private_key,
+            algorithm="ES256",
+            headers={"kid": self.api_key, "nonce": secrets.token_hex()},
+        )
+
+    def token(self, uri):
+        now = int(self.clock())
+        with self.lock:
+            cached = self.tokens.get(uri)
+            if cached is not None and now < cached[1] - self.margin:
+                return cached[0]
+            token = self.sign(uri, now)
+            self.tokens[uri] = (token, now + self.lifetime)
+            self.signed += 1
+            return token
+
+    def headers(self, method, path, host=API_HOST):
+        return {"Authorization": f"Bearer {self.token(format_uri(method, path, host))}"}
+
+
+_signers = {}
+_signers_lock = threading.Lock()
+
+
+def get_signer(api_key, api_secret):
+    # One signer, and so one parsed key and token cache, per API key
+    fingerprint = (api_key, hashlib.sha256(api_secret.encode("utf-8")).hexdigest())
+    with _signers_lock:
+        signer = _signers.get(fingerprint)
+        if signer is None:
+            signer = _signers[fingerprint] = JWTSigner(api_key, api_secret)
+        return signer
+
+
+def build_jwt(uri, api_key, api_secret):
+    # Drop-in for the scripts' old build_jwt(uri), minus the per-call key parsing
+    return get_signer(api_key, api_secret).token(uri)
+
+
+def make_session(pool_size=RAW_POOL_SIZE):
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return session
+
+
+class RawClient:
+    """Signed JSON requests to endpoints outside the SDK, over a shared
+    keep-alive session. Non-2xx answers raise requests' HTTPError, as the
+    SDK's own calls do. Given a RateLimitedClient as limiter, each request
+    takes a token from its private bucket and is retried as the SDK's are."""
+
+    def __init__(self, api_key, api_secret, host=API_HOST, session=None, timeout=RAW_REQUEST_TIMEOUT, limiter=None):
+        self.signer = get_signer(api_key, api_secret)
+        self.host = host
+        self.session = session or make_session()
+        self.timeout = timeout
+        self.limiter = limiter
+
+    def request(self, method, path, **kwargs):
+        if self.limiter is not None:
+            return self.limiter.call(f"{method} {path}", self.send, method, path, **kwargs)
+        return self.send(method, path, **kwargs)
+
+    def send(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(
+            method,
+            f"https://{self.host}{path}",
+            headers=self.signer.headers(method, path, self.host),
+            **kwargs,
+        )
+        response.raise_for_status()
+        # A 204, or a 202 with nothing to say, has no JSON to parse
+        if response.status_code == 204 or not response.content:
+            return {}
+        return response.json()
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+
+_raw_clients = {}
+
+
+def get_raw_client(api_key, api_secret, limiter=None):
+    # One client, and so one connection pool, per API key for the whole
+    # process. A limiter given once is kept for every later caller.
+    with _signers_lock:
+        raw = _raw_clients.get(api_key)
+    if raw is None or raw.signer is not get_signer(api_key, api_secret):
+        raw = RawClient(api_key, api_secret, limiter=raw.limiter if raw is not None else None)
+        with _signers_lock:
+            _raw_clients[api_key] = raw
+    if limiter is not None:
+        raw.limiter = limiter
+    return raw
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# Streaming mode: keeps a price book from the WebSocket feed and moves a coin's
+# ladder as soon as its price leaves a band around the price the ladder was
+# built at, instead of waiting for the next timer-driven buy cycle.
+import json
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .defaults import DEFAULT_PRICE_ANCHOR, DEFAULT_REANCHOR_BAND, DEFAULT_STREAM_CHANNEL
+from .optimal_buy_cbpro import (
+    buy_cycle,
+    cancel_orders_in_batches,
+    get_configured_products_info,
+    list_open_orders,
+    plan_ladders,
+    remaining_value,
+    submit_buy_orders,
+)
+
+# Latest reaction times kept; the count and the slowest are kept for the whole run
+REACTION_TIMES_KEPT = 1000
+
+
+class PriceBook:
+    """Best bid, best ask and last trade price per product, kept up to date
+    from ticker and level2 messages. level2 updates are applied to the full
+    order book, whose best levels are only searched again when the best one
+    empties."""
+
+    def __init__(self):
+        self.bids = {}
+        self.asks = {}
+        self.best_bid = {}
+        self.best_ask = {}
+        self.last = {}
+
+    def apply(self, message):
+        # Returns the product ids whose prices may have changed
+        channel = message.get("channel")
+        updated = set()
+        for event in message.get("events") or []:
+            if channel == "ticker":
+                for ticker in event.get("tickers") or []:
+                    product_id = ticker["product_id"]
+                    if ticker.get("price"):
+                        self.last[product_id] = float(ticker["price"])
+                    if ticker.get("best_bid") and product_id not in self.bids:
+                        self.best_bid[product_id] = float(ticker["best_bid"])
+                    if ticker.get("best_ask") and product_id not in self.asks:
+                        self.best_ask[product_id] = float(ticker["best_ask"])
+                    updated.add(product_id)
+            elif channel == "l2_data":
+                product_id = event["product_id"]
+                if event.get("type") == "snapshot":
+                    self.bids[product_id] = {}
+                    self.asks[product_id] = {}
+                for update in event.get("updates") or []:
+                    self.apply_level(product_id, update["side"], float(update["price_level"]), float(update["new_quantity"]))
+                updated.add(product_id)
+        return updated
+
+    def apply_level(self, product_id, side, price, quantity):
+        if side == "bid":
+            levels, best, better = self.bids.setdefault(product_id, {}), self.best_bid, max
+        else:
+            levels, best, better = self.asks.setdefault(product_id, {}), self.best_ask, min
+        if quantity:
+            levels[price] = quantity
+            current = best.get(product_id)
+            if current is None or better(price, current) == price:
+                best[product_id] = price
+        else:
+            levels.pop(price, None)
+            if best.get(product_id) == price:
+                if levels:
+                    best[product_id] = better(levels)
+                else:
+                    best.pop(product_id, None)
+
+    def price(self, product_id, anchor=DEFAULT_PRICE_ANCHOR):
+        # The price a ladder is anchored to, as prices.get_best_bid_ask_prices
+        # computes it; the last trade price until the book has a bid
+        bid = self.best_bid.get(product_id)
+        if bid is None:
+            return self.last.get(product_id)
+        ask = self.best_ask.get(product_id)
+        if anchor == "bid" or ask is None:
+            return bid
+        return (bid + ask) / 2
+
+
+class StreamTrader:
+    """Re-anchors ladders on price events. Re-anchoring a coin cancels its
+    open orders and spends what they held on a new ladder at the current
+    price; one coin's re-anchor runs at a time on a worker thread, so the
+    WebSocket thread only ever updates the book and compares prices."""
+
+    def __init__(self, args, coins_config, client, db_session, executor=None, clock=time.monotonic):
+        self.args = args
+        self.coins_config = coins_config
+        self.client = client
+        self.db_session = db_session
+        self.fiat_currency = args.fiat_currency.upper()
+        self.band = getattr(args, "reanchor_band", DEFAULT_REANCHOR_BAND)
+        self.anchor = getattr(args, "price_anchor", DEFAULT_PRICE_ANCHOR)
+        self.book = PriceBook()
+        self.anchors = {}
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.clock = clock
+        self.reaction_times = deque(maxlen=REACTION_TIMES_KEPT)
+        self.reactions = 0
+        self.slowest_reaction = 0.0
+
+    def product_ids(self):
+        return [f"{coin_symbol}-{self.fiat_currency}" for coin_symbol in self.coins_config]
+
+    def on_message(self, raw):
+        received = self.clock()
+        message = json.loads(raw)
+        if message.get("type") == "error":
+            print(f"WebSocket error: {message.get('message')}")
+            return
+        for product_id in self.book.apply(message):
+            self.check(product_id, received)
+
+    def check(self, product_id, received=None):
+        coin_symbol = product_id.split("-")[0]
+        if coin_symbol not in self.coins_config:
+            return
+        price = self.book.price(product_id, self.anchor)
+        if not price:
+            return
+        with self.lock:
+            anchored_at = self.anchors.get(coin_symbol)
+            if anchored_at is None:
+                # The ladder placed at startup was built at about this price
+                self.anchors[coin_symbol] = price
+                return
+            if coin_symbol in self.pending or abs(price / anchored_at - 1) < self.band:
+                return
+            self.pending.add(coin_symbol)
+        if received is not None:
+            reaction_time = self.clock() - received
+            self.reaction_times.append(reaction_time)
+            self.reactions += 1
+            self.slowest_reaction = max(self.slowest_reaction, reaction_time)
+        print(f"{coin_symbol} moved {price / anchored_at - 1:+.2%} to {price} from {anchored_at}, re-anchoring its ladder.")
+        self.executor.submit(self.reanchor, coin_symbol, price)
+
+    def reanchor(self, coin_symbol, price):
+        product_id = f"{coin_symbol}-{self.fiat_currency}"
+        try:
+            open_orders = {o.order_id: o for o in list_open_orders(self.client, [product_id])}
+            released = 0.0
+            if open_orders:
+                result = cancel_orders_in_batches(self.client, list(open_orders))
+                released = sum(remaining_value(open_orders[order_id], self.fiat_currency) for order_id in result["cancelled"])
+            if released > 0:
+                ladder = plan_ladders(self.args, {coin_symbol: released}, self.coins_config, {coin_symbol: price})
+                submit_buy_orders(self.args, ladder, self.client, self.db_session, self.coins_config)
+            else:
+                print(f"{coin_symbol} has no open orders left to move.")
+            with self.lock:
+                self.anchors[coin_symbol] = price
+        except Exception as e:
+            # The anchor stays, so the next price event tries again
+            print(f"Error re-anchoring {coin_symbol}: {e}")
+            self.db_session.rollback()
+        finally:
+            with self.lock:
+                self.pending.discard(coin_symbol)
+            sys.stdout.flush()
+
+
+def run_stream(args, coins_config, client, db_session, stop_event=None, ws_client_factory=None):
+    # One regular buy cycle places the ladders, then the feed moves them
+    from .daemon import install_stop_handlers
+
+    stop_event = stop_event or threading.Event()
+    install_stop_handlers(stop_event)
+    buy_cycle(args, coins_config, client, db_session)
+    coins_config = get_configured_products_info(args, coins_config, client)
+
+    trader = StreamTrader(args, coins_config, client, db_session)
+    if ws_client_factory is None:
+        from coinbase.websocket import WSClient
+
+        def ws_client_factory(on_message):
+            return WSClient(api_key=args.key, api_secret=args.secret, on_message=on_message, retry=True)
+    ws_client = ws_client_factory(trader.on_message)
+    channel = getattr(args, "stream_channel", DEFAULT_STREAM_CHANNEL)
+    ws_client.open()
+    ws_client.subscribe(product_ids=trader.product_ids(), channels=[channel, "heartbeats"])
+    print(f"Streaming {channel} for {trader.product_ids()}, re-anchoring on {trader.band:.2%} moves.")
+    sys.stdout.flush()
+    try:
+        while not stop_event.is_set():
+            ws_client.sleep_with_exception_check(1)
+    finally:
+        ws_client.close()
+        trader.executor.shutdown(wait=True)
+    if trader.reactions:
+        print(f"Reacted to {trader.reactions} price moves in {trader.slowest_reaction * 1000:.2f} ms at most.")
+    print("Stream stopped.")
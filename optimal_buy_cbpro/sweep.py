@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Backtests many ladder settings at once on every CPU core and ranks them.
+
+    python -m optimal_buy_cbpro.sweep --candles btc-usd-1m.csv \\
+        --starting-discounts 0,0.005,0.01,0.02 --discount-steps 0.005,0.01,0.02 \\
+        --order-counts 1,3,5,8 --buy-intervals 86400,604800
+
+Every combination of the listed values is backtested (see backtest.py), or,
+with --samples N, N random ones; a value list may then also be a range such
+as 0:0.05. The candles are parsed once into their cache file, which every
+worker process memory maps, so they are shared rather than copied. Results
+go to a columnar file (--output, see columns.py) and the best settings by
+--rank-by are printed.
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from .backtest import DEFAULT_DEPOSIT_AMOUNT, map_candles, run_backtest
+from .columns import read_columns, write_columns
+from .defaults import (
+    DEFAULT_BASE_FEE,
+    DEFAULT_BUY_INTERVAL,
+    DEFAULT_DISCOUNT_STEP,
+    DEFAULT_ORDER_COUNT,
+    DEFAULT_STARTING_DISCOUNT,
+    DEFAULT_WITHDRAWAL_THRESHOLD,
+)
+
+# The swept parameters, with the array typecode each is stored as
+PARAMETERS = (
+    ("starting_discount", "d"),
+    ("discount_step", "d"),
+    ("order_count", "q"),
+    ("buy_interval", "d"),
+)
+# Report fields kept per combination; missing values (e.g. the average cost
+# when nothing filled) are stored as NaN
+METRICS = (
+    ("cycles", "q"),
+    ("orders_placed", "q"),
+    ("orders_filled", "q"),
+    ("fill_rate", "d"),
+    ("value_fill_rate", "d"),
+    ("average_cost", "d"),
+    ("dca_average_cost", "d"),
+    ("cost_vs_dca", "d"),
+    ("idle_cash_fraction", "d"),
+    ("value", "d"),
+    ("dca_value", "d"),
+)
+# Metrics where lower is better when ranking
+LOWER_IS_BETTER = {"average_cost", "cost_vs_dca", "idle_cash_fraction"}
+# Combinations handed to a worker at a time, per worker
+CHUNKS_PER_WORKER = 4
+
+
+def parse_values(text, kind):
+    # "a,b,c" -> [a, b, c]; "lo:hi" -> (lo, hi), a range for random sampling
+    if ":" in text:
+        low, high = (kind(v) for v in text.split(":"))
+        return (low, high)
+    return [kind(v) for v in text.split(",")]
+
+
+def grid(values):
+    # values: {parameter: list}; every combination, in a stable order
+    names = [name for name, _ in PARAMETERS]
+    for name in names:
+        if isinstance(values[name], tuple):
+            raise Exception(f"{name}: ranges need --samples")
+    return [dict(zip(names, combination)) for combination in itertools.product(*(values[n] for n in names))]
+
+
+def sample(values, samples, seed=None):
+    # values: {parameter: list or (low, high)}; random combinations
+    rng = random.Random(seed)
+    combinations = []
+    for _ in range(samples):
+        combination = {}
+        for name, typecode in PARAMETERS:
+            choices = values[name]
+            if isinstance(choices, tuple):
+                low, high = choices
+                combination[name] = rng.randint(low, high) if typecode == "q" else rng.uniform(low, high)
+            else:
+                combination[name] = rng.choice(choices)
+        combinations.append(combination)
+    return combinations
+
+
+_worker = {}
+
+
+def init_worker(candles_path, base_args, coins_config, coin_symbol):
+    # Runs once per worker process: maps the shared candle cache
+    _worker["candles"] = map_candles(candles_path)
+    _worker["base_args"] = base_args
+    _worker["coins_config"] = coins_config
+    _worker["coin_symbol"] = coin_symbol
+
+
+def evaluate(combinations):
+    results = []
+    for combination in combinations:
+        args = SimpleNamespace(**{**vars(_worker["base_args"]), **combination})
+        report = run_backtest(_worker["candles"], args, _worker["coins_config"], _worker["coin_symbol"])
+        results.append([report[name] for name, _ in METRICS])
+    return results
+
+
+def chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def run_sweep(candles_path, combinations, base_args, coins_config=None, coin_symbol="BTC", workers=None):
+    # Returns {column: array} with a row per combination, in the given order
+    workers = workers or os.cpu_count() or 1
+    coins_config = coins_config or {coin_symbol: {}}
+    # Parse (or refresh) the candle cache once, before the workers map it
+    map_candles(candles_path)
+    size = max(1, math.ceil(len(combinations) / (workers * CHUNKS_PER_WORKER)))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(candles_path, base_args, coins_config, coin_symbol),
+    ) as executor:
+        rows = [row for chunk in executor.map(evaluate, chunked(combinations, size)) for row in chunk]
+
+    columns = {name: array(typecode, (c[name] for c in combinations)) for name, typecode in PARAMETERS}
+    for i, (name, typecode) in enumerate(METRICS):
+        missing = 0 if typecode == "q" else math.nan
+        columns[name] = array(typecode, (missing if row[i] is None else row[i] for row in rows))
+    return columns
+
+
+def rank(columns, by, top=10):
+    # Row indexes of the best `top` results by the `by` column, NaNs last
+    values = columns[by]
+    sign = 1 if by in LOWER_IS_BETTER else -1
+    order = sorted(range(len(values)), key=lambda i: (math.isnan(values[i]), sign * values[i]))
+    return order[:top]
+
+
+def format_row(columns, i):
+    return ", ".join(f"{name}={columns[name][i]:.6g}" for name in columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candles", help="CSV or Parquet file of candles")
+    parser.add_argument("--coin", help="Coin the candles are for (default: BTC)", default="BTC")
+    parser.add_argument("--starting-discounts", help=f"Starting discounts to try (default: {DEFAULT_STARTING_DISCOUNT})", default=str(DEFAULT_STARTING_DISCOUNT))
+    parser.add_argument("--discount-steps", help=f"Discount steps to try (default: {DEFAULT_DISCOUNT_STEP})", default=str(DEFAULT_DISCOUNT_STEP))
+    parser.add_argument("--order-counts", help=f"Order counts to try (default: {DEFAULT_ORDER_COUNT})", default=str(DEFAULT_ORDER_COUNT))
+    parser.add_argument("--buy-intervals", help=f"Seconds between cycles to try (default: {DEFAULT_BUY_INTERVAL})", default=str(DEFAULT_BUY_INTERVAL))
+    parser.add_argument("--samples", type=int, help="Try this many random combinations instead of all of them")
+    parser.add_argument("--seed", type=int, help="Random seed for --samples")
+    parser.add_argument("--base-fee", type=float, help=f"Fee rate paid on every fill (default: {DEFAULT_BASE_FEE})", default=DEFAULT_BASE_FEE)
+    parser.add_argument("--withdrawal-threshold", type=float, help=f"No ladder is built while the cash to spend is below this (default: {DEFAULT_WITHDRAWAL_THRESHOLD})", default=DEFAULT_WITHDRAWAL_THRESHOLD)
+    parser.add_argument("--deposit-amount", type=float, help=f"Fiat deposited every cycle (default: {DEFAULT_DEPOSIT_AMOUNT})", default=DEFAULT_DEPOSIT_AMOUNT)
+    parser.add_argument("--minimum-order-size", type=float, help="Minimum order value in fiat (default: 1.0)", default=1.0)
+    parser.add_argument("--base-increment", help="Order size increment (default: the bot's built-in precision for the coin)")
+    parser.add_argument("--price-increment", help="Order price increment (default: the bot's built-in precision for the coin)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--output", help="Columnar results file (default: sweep.cols)", default="sweep.cols")
+    parser.add_argument("--rank", metavar="RESULTS", help="Rank an earlier sweep's results file instead of running one")
+    parser.add_argument("--rank-by", choices=[name for name, _ in METRICS], help="Metric to rank by (default: cost_vs_dca)", default="cost_vs_dca")
+    parser.add_argument("--top", type=int, help="Number of results to print (default: 10)", default=10)
+    args = parser.parse_args(argv)
+
+    if args.rank:
+        _, columns = read_columns(args.rank)
+    else:
+        if not args.candles:
+            parser.error("--candles is required unless --rank is given")
+        values = {
+            "starting_discount": parse_values(args.starting_discounts, float),
+            "discount_step": parse_values(args.discount_steps, float),
+            "order_count": parse_values(args.order_counts, int),
+            "buy_interval": parse_values(args.buy_intervals, float),
+        }
+        combinations = sample(values, args.samples, args.seed) if args.samples else grid(values)
+        coin_symbol = args.coin.upper()
+        coin_config = {"minimum_order_size": args.minimum_order_size}
+        if args.base_increment:
+            coin_config["base_increment"] = args.base_increment
+        if args.price_increment:
+            coin_config["price_increment"] = args.price_increment
+        base_args = SimpleNamespace(
+            base_fee=args.base_fee,
+            withdrawal_threshold=args.withdrawal_threshold,
+            deposit_amount=args.deposit_amount,
+        )
+        print(f"Backtesting {len(combinations)} combinations on {args.workers or os.cpu_count()} workers.")
+        columns = run_sweep(args.candles, combinations, base_args, {coin_symbol: coin_config}, coin_symbol, args.workers)
+        write_columns(args.output, columns, candles=os.path.abspath(args.candles))
+        print(f"Wrote {len(combinations)} results to {args.output}.")
+
+    print(f"Best by {args.rank_by}:")
+    for i in rank(columns, args.rank_by, args.top):
+        print(format_row(columns, i))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
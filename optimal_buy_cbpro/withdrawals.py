@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# Crypto withdrawals through the v2 send endpoint. A coin is only withdrawn
+# once its balance is worth --withdrawal-fee-multiple network fees, so fees are
+# paid on fewer, larger sends. Each coin's fee estimate is the network fee
+# Coinbase charged on its latest send (or a "network_fee" pinned in --coins),
+# cached next to the history DB instead of being looked up on every pass. A
+# coin with neither is not withdrawn.
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+from .cache import get_cache
+from .common import CLIENT_ORDER_ID_NAMESPACE, get_account_by_currency, get_decimal_precision, new_run_id
+from .defaults import (
+    DEFAULT_WITHDRAWAL_FEE_MAX_STALENESS,
+    DEFAULT_WITHDRAWAL_FEE_MULTIPLE,
+    DEFAULT_WITHDRAWAL_FEE_TTL,
+)
+from .history import Withdrawal, to_decimal
+from .money import FixedPoint
+from .signing import get_raw_client
+
+# Recent transactions searched for the coin's latest on-chain send
+FEE_LOOKUP_PAGE_SIZE = 25
+WITHDRAWAL_WORKERS = 4
+FINAL_WITHDRAWAL_STATUSES = ("completed", "canceled", "failed", "expired")
+
+
+def transactions_path(account_id, transaction_id=None):
+    path = f"/v2/accounts/{account_id}/transactions"
+    if transaction_id:
+        path += f"/{transaction_id}"
+    return path
+
+
+def make_withdrawal_idem(run_id, coin_symbol, amount):
+    # Like make_client_order_id: the same send in the same run gets the same key
+    return str(uuid.uuid5(CLIENT_ORDER_ID_NAMESPACE, f"{run_id}:withdraw:{coin_symbol}:{amount}"))
+
+
+def network_fee_of(transaction):
+    fee = ((transaction.get("network") or {}).get("transaction_fee") or {}).get("amount")
+    return to_decimal(fee) if fee not in (None, "") else None
+
+
+def fetch_network_fee(raw, account_id):
+    # The fee of the latest send that paid one (sends to other Coinbase users
+    # are off-chain and free), as a string for the JSON cache; None if none
+    page = raw.get(transactions_path(account_id), params={"limit": FEE_LOOKUP_PAGE_SIZE, "order": "desc"})
+    for transaction in page.get("data") or []:
+        if transaction.get("type") != "send":
+            continue
+        fee = network_fee_of(transaction)
+        if fee:
+            return str(fee)
+    return None
+
+
+def get_network_fee(coin_symbol, coin_config, account_id, raw, cache=None, ttl=DEFAULT_WITHDRAWAL_FEE_TTL, max_staleness=DEFAULT_WITHDRAWAL_FEE_MAX_STALENESS):
+    pinned = coin_config.get("network_fee")
+    if pinned is not None:
+        return to_decimal(pinned)
+    if cache is None:
+        fee = fetch_network_fee(raw, account_id)
+    else:
+        fee = cache.fetch(coin_symbol, lambda: fetch_network_fee(raw, account_id), ttl, max_staleness)
+    return to_decimal(fee) if fee is not None else None
+
+
+def available_balance(account):
+    balance = getattr(account, "available_balance", None)
+    if isinstance(balance, dict):
+        return to_decimal(balance.get("value", 0))
+    return to_decimal(getattr(balance, "value", 0) or 0)
+
+
+def send_withdrawal(raw, account_id, coin_symbol, amount, crypto_address, idem):
+    # idem makes the exchange ignore a repeat of the same send
+    return raw.post(
+        transactions_path(account_id),
+        json={
+            "type": "send",
+            "to": crypto_address,
+            "amount": str(amount),
+            "currency": coin_symbol,
+            "idem": idem,
+        },
+    )["data"]
+
+
+def update_withdrawal(row, data):
+    row.status = data.get("status") or row.status
+    fee = network_fee_of(data)
+    if fee is not None:
+        row.network_fee = fee
+
+
+def pending_withdrawals(db_session):
+    return list(db_session.scalars(
+        select(Withdrawal)
+        .where(Withdrawal.status.is_not(None))
+        .where(Withdrawal.status.not_in(FINAL_WITHDRAWAL_STATUSES))
+        .order_by(Withdrawal.created_at)
+    ))
+
+
+def refresh_pending_withdrawals(args, accounts_response, db_session, raw=None):
+    # Looks up the sends that hadn't settled yet. One that ends canceled,
+    # failed or expired drops out of the withdrawn ledger (see VOID_STATUSES
+    # in history.py), so its coins count as held on the exchange again.
+    pending = pending_withdrawals(db_session)
+    if not pending:
+        return []
+    raw = raw or get_raw_client(args.key, args.secret)
+    for row in pending:
+        account = get_account_by_currency(accounts_response, row.currency)
+        if not account:
+            print(f"No account found for {row.currency}, cannot refresh withdrawal {row.cbpro_withdrawal_id}.")
+            continue
+        try:
+            update_withdrawal(row, raw.get(transactions_path(account.uuid, row.cbpro_withdrawal_id))["data"])
+        except Exception as e:
+            print(f"Error refreshing withdrawal {row.cbpro_withdrawal_id}: {e}")
+            continue
+        print(f"Withdrawal {row.cbpro_withdrawal_id} of {row.amount} {row.currency} is {row.status}.")
+    db_session.commit()
+    return [row for row in pending if row.status not in FINAL_WITHDRAWAL_STATUSES]
+
+
+def plan_withdrawals(args, coins_config, accounts_response, raw, cache=None):
+    # The (coin_symbol, account_id, amount, crypto_address) sends worth making now
+    fee_multiple = getattr(args, "withdrawal_fee_multiple", DEFAULT_WITHDRAWAL_FEE_MULTIPLE)
+    ttl = getattr(args, "withdrawal_fee_ttl", DEFAULT_WITHDRAWAL_FEE_TTL)
+    planned = []
+    for coin_symbol, config in coins_config.items():
+        crypto_address = config.get("withdrawal_address")
+        if not crypto_address:
+            print(f"No withdrawal address specified for {coin_symbol}, not withdrawing.")
+            continue
+        account = get_account_by_currency(accounts_response, coin_symbol)
+        if not account:
+            print(f"No account found for {coin_symbol}, cannot withdraw.")
+            continue
+        amount = FixedPoint.from_value(available_balance(account), get_decimal_precision(coin_symbol, coins_config))
+        if not amount or amount.units < 0:
+            print(f"{coin_symbol} balance {amount} is too small, not withdrawing.")
+            continue
+
+        # Without an estimate there's no telling whether the send is worth its
+        # fee, so the coin waits; a pinned "network_fee" gets its first send out
+        try:
+            fee = get_network_fee(coin_symbol, config, account.uuid, raw, cache, ttl, max(ttl, DEFAULT_WITHDRAWAL_FEE_MAX_STALENESS))
+        except Exception as e:
+            print(f"Error estimating the {coin_symbol} network fee, not withdrawing: {e}")
+            continue
+        if fee is None:
+            print(f"No {coin_symbol} network fee estimate, not withdrawing; pin a \"network_fee\" in --coins to send it.")
+            continue
+        if amount.decimal() < fee * to_decimal(fee_multiple):
+            print(f"Holding {amount} {coin_symbol}: below {fee_multiple} x the {fee} {coin_symbol} network fee.")
+            continue
+        planned.append((coin_symbol, account.uuid, amount, crypto_address))
+    return planned
+
+
+def withdraw_coins(args, coins_config, accounts_response, client, db_session, raw=None, cache=None, run_id=None):
+    # Sends every coin that is worth withdrawing in one pass, then records the
+    # sends that went out in one transaction; the balance ledger picks up the
+    # new Withdrawal rows. Like submit_buy_orders, failures are raised after
+    # the successful ones are stored.
+    if not (accounts_response and accounts_response.accounts):
+        print("No accounts data to process for withdrawals.")
+        return []
+    if run_id is None:
+        run_id = new_run_id()
+    raw = raw or get_raw_client(args.key, args.secret)
+    if cache is None:
+        cache = get_cache(getattr(args, "db_engine", None), "withdrawal_fees")
+    planned = plan_withdrawals(args, coins_config, accounts_response, raw, cache)
+    if not planned:
+        return []
+
+    def send(coin_symbol, account_id, amount, crypto_address):
+        print(f"Withdrawing {amount} {coin_symbol} to {crypto_address}")
+        return send_withdrawal(raw, account_id, coin_symbol, amount, crypto_address, make_withdrawal_idem(run_id, coin_symbol, amount))
+
+    results = [None] * len(planned)
+    errors = []
+    with ThreadPoolExecutor(max_workers=min(WITHDRAWAL_WORKERS, len(planned))) as executor:
+        futures = [executor.submit(send, *withdrawal) for withdrawal in planned]
+        for i, future in enumerate(futures):
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                errors.append((planned[i], e))
+
+    rows = []
+    for (coin_symbol, _, amount, crypto_address), data in zip(planned, results):
+        if data is None:
+            continue
+        fee = network_fee_of(data)
+        sent = (data.get("amount") or {}).get("amount")
+        rows.append(Withdrawal(
+            # Sends show as negative amounts on the account
+            amount=abs(to_decimal(sent)) if sent else amount.decimal(),
+            currency=coin_symbol,
+            crypto_address=crypto_address,
+            cbpro_withdrawal_id=data.get("id"),
+            status=data.get("status"),
+            network_fee=fee,
+        ))
+        if fee and cache is not None and coins_config[coin_symbol].get("network_fee") is None:
+            # The fee just paid is the best estimate for the next send
+            cache.put(coin_symbol, str(fee))
+    if rows:
+        db_session.add_all(rows)
+        db_session.commit()
+    print(f"Withdrew {len(rows)} of {len(planned)} coins.")
+
+    if errors:
+        (coin_symbol, _, amount, _), error = errors[0]
+        raise Exception(f"{len(errors)} withdrawals failed, first: {amount} {coin_symbol}: {error}") from error
+    return rows
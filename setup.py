@@ -23,7 +23,7 @@ setup(
     packages=find_packages(),
     entry_points={
         "console_scripts": [
-            "optimal-buy-cbpro=optimal_buy_cbpro.optimal_buy_cbpro:main"
+            "optimal-buy-cbpro=optimal_buy_cbpro.cli:main"
         ]
     },
     classifiers=[
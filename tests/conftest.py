@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+from types import SimpleNamespace
+
+import pytest
+
+from optimal_buy_cbpro.history import get_session
+
+# The parsed command line, as much of it as the tests rely on
+ARGS = dict(
+    key="key", secret="secret", fiat_currency="USD", base_fee=0.006, withdrawal_threshold=25.0,
+    starting_discount=0.005, discount_step=0.01, order_count=2, reanchor_band=0.01,
+    amount=10.0, payment_method_id="pm-1", deposit_account_id="acct-1", deposit_poll_timeout=60.0, wait_for_deposits=False,
+    withdrawal_fee_multiple=50.0, withdrawal_fee_ttl=86400.0,
+)
+
+
+class FakeV2:
+    # The v2 endpoints behind signing.RawClient. A deposit stays "created" for
+    # as many status lookups as `clears_after`, then ends as `final`. An
+    # account's transactions include a send that paid the fee in `fees`, if
+    # any; sends from accounts in `fail` are rejected, the others stay
+    # "pending" until given a status in `statuses`.
+    def __init__(self):
+        self.clears_after = 2
+        self.final = "completed"
+        self.payout_at = "2024-01-05T12:00:00Z"
+        self.fees = {}
+        self.fail = set()
+        self.statuses = {}
+        self.calls = []
+        self.lookups = 0
+        self.fee_lookups = []
+        self.sends = []
+
+    def deposit(self, status, committed):
+        return {"data": {
+            "id": "dep-1", "status": status, "committed": committed, "payout_at": self.payout_at,
+            "amount": {"amount": "10.00", "currency": "USD"},
+        }}
+
+    def post(self, path, json=None):
+        self.calls.append(("POST", path, json))
+        if "/transactions" in path:
+            return self.send(path.split("/")[3], json)
+        return self.deposit("created", path.endswith("/commit"))
+
+    def get(self, path, params=None):
+        self.calls.append(("GET", path, None))
+        parts = path.split("/")
+        if "transactions" in parts:
+            return self.transactions(parts[3], parts[5] if len(parts) > 5 else None)
+        self.lookups += 1
+        return self.deposit(self.final if self.lookups >= self.clears_after else "created", True)
+
+    def transactions(self, account_id, transaction_id):
+        if transaction_id:
+            return {"data": {"id": transaction_id, "type": "send", "status": self.statuses.get(transaction_id, "pending")}}
+        self.fee_lookups.append(account_id)
+        transactions = [{"type": "buy"}, {"type": "send", "network": {"status": "off_blockchain"}}]
+        if account_id in self.fees:
+            transactions.append({"type": "send", "network": {"transaction_fee": {"amount": self.fees[account_id], "currency": "X"}}})
+        return {"data": transactions}
+
+    def send(self, account_id, json):
+        if account_id in self.fail:
+            raise Exception("400 Client Error: insufficient funds")
+        self.sends.append((account_id, json))
+        return {"data": {
+            "id": f"send-{account_id}", "type": "send", "status": "pending",
+            "amount": {"amount": f"-{json['amount']}", "currency": json["currency"]},
+            "network": {"status": "pending", "transaction_fee": {"amount": "0.0001", "currency": json["currency"]}},
+        }}
+
+
+@pytest.fixture
+def make_args():
+    # For tests that need some options set differently
+    def make(**kwargs):
+        return SimpleNamespace(**{**ARGS, **kwargs})
+    return make
+
+
+@pytest.fixture
+def args(make_args):
+    return make_args()
+
+
+@pytest.fixture
+def v2():
+    return FakeV2()
+
+
+@pytest.fixture
+def db_session():
+    return get_session("sqlite://")
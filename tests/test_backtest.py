@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+import pytest
+
+from optimal_buy_cbpro import backtest
+from optimal_buy_cbpro.backtest import Candles, load_candles, run_backtest
+
+DAY = 86400
+
+
+def daily_candles(days):
+    # [(open, low)] per day, as one candle each
+    return Candles(
+        [i * DAY for i in range(len(days))],
+        [o for o, _ in days],
+        [low for _, low in days],
+        [o for o, _ in days],
+    )
+
+
+COINS = {"BTC": {"minimum_order_size": 1.0, "base_increment": "0.00000001", "price_increment": "0.01"}}
+# Rungs at 1% steps from 99 down, with the whole deposit laddered; cycles and
+# deposits keep the backtest defaults (daily, 100)
+LADDER = dict(starting_discount=0.01, base_fee=0.0, withdrawal_threshold=0.0)
+
+
+def test_rungs_fill_when_traded_through(make_args):
+    # Ladder at 99 and 98: day 1 only reaches 98.5, day 2 trades through both
+    report = run_backtest(daily_candles([(100, 98.5), (100, 90)]), make_args(**LADDER), COINS)
+
+    assert report["cycles"] == 2
+    assert report["orders_placed"] == 4
+    assert report["orders_filled"] == 3
+    # The unfilled 50 from day 1 is cancelled and laddered again with day 2's deposit
+    assert report["idle_cash"] == pytest.approx(200 - 50 - 75 - 75, abs=0.01)
+    assert report["average_cost"] < report["dca_average_cost"] == 100
+
+
+def test_nothing_fills_in_a_rally(make_args):
+    report = run_backtest(daily_candles([(100, 100), (110, 110), (120, 120)]), make_args(**LADDER), COINS)
+
+    assert report["orders_filled"] == 0
+    assert report["fill_rate"] == 0
+    assert report["idle_cash"] == 300
+    assert report["idle_cash_fraction"] == 1
+    assert report["average_cost"] is None
+
+
+def test_fees_paid_on_fills(make_args):
+    report = run_backtest(daily_candles([(100, 50)]), make_args(starting_discount=0.01, withdrawal_threshold=0.0, base_fee=0.01, order_count=1), COINS)
+
+    # 100 less the 1% reserve, laddered at 99
+    assert report["coins"] == pytest.approx(99 / 99, abs=1e-6)
+    assert report["idle_cash"] == pytest.approx(100 - 99 * 1.01, abs=0.01)
+    assert report["average_cost"] == pytest.approx(99 * 1.01, rel=1e-6)
+
+
+def test_cycles_follow_buy_interval_over_minute_candles(make_args):
+    minutes = 3 * 24 * 60
+    candles = Candles([i * 60 for i in range(minutes)], [100.0] * minutes, [100.0] * minutes, [100.0] * minutes)
+
+    assert run_backtest(candles, make_args(**LADDER, buy_interval=6 * 3600), COINS)["cycles"] == 12
+
+
+def test_csv_with_header_and_millisecond_times(tmp_path):
+    path = tmp_path / "candles.csv"
+    path.write_text(
+        "Timestamp,Open,High,Low,Close,Volume\n"
+        "1700000060000,101,102,99,100,5\n"
+        "1700000000000,100,101,98,101,5\n"
+    )
+
+    candles = load_candles(path)
+
+    assert list(candles.times) == [1700000000, 1700000060]
+    assert list(candles.lows) == [98, 99]
+
+
+def test_csv_with_iso_times(tmp_path):
+    path = tmp_path / "candles.csv"
+    path.write_text("time,open,low,close\n2024-01-01T00:00:00Z,1,1,1\n")
+
+    assert list(load_candles(path).times) == [1704067200]
+
+
+def test_csv_missing_column(tmp_path):
+    path = tmp_path / "candles.csv"
+    path.write_text("time,open,close\n0,1,1\n")
+
+    with pytest.raises(Exception, match="no low column"):
+        load_candles(path)
+
+
+def test_cli_prints_report(tmp_path, capsys):
+    path = tmp_path / "candles.csv"
+    path.write_text("time,open,low,close\n0,100,90,100\n86400,100,90,100\n")
+
+    assert backtest.main(["--candles", str(path), "--base-increment", "0.00000001", "--price-increment", "0.01"]) == 0
+    assert '"orders_filled": 10' in capsys.readouterr().out
+
+
+def test_parsed_candles_cached_until_file_changes(tmp_path, mocker):
+    path = tmp_path / "candles.csv"
+    path.write_text("time,open,low,close\n0,100,90,100\n60,100,95,100\n")
+    assert list(load_candles(path).lows) == [90, 95]
+
+    read_csv = mocker.spy(backtest, "read_csv_candles")
+    assert list(load_candles(path).lows) == [90, 95]
+    read_csv.assert_not_called()
+
+    path.write_text("time,open,low,close\n0,100,80,100\n")
+    assert list(load_candles(path).lows) == [80]
+    read_csv.assert_called_once()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import json
+import pytest
+from unittest.mock import Mock
+
+from optimal_buy_cbpro import cache as cache_module
+from optimal_buy_cbpro.cache import FileCache, cache_path
+
+
+def age_entries(path, seconds):
+    with open(path) as f:
+        data = json.load(f)
+    for entry in data.values():
+        entry["stored_at"] -= seconds
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+@pytest.fixture
+def weights_cache(tmp_path):
+    return FileCache(str(tmp_path / "cbpro_weights_cache.json"), "weights")
+
+
+def test_cache_path():
+    assert cache_path("sqlite:////var/lib/state/cbpro_history.db", "weights") == "/var/lib/state/cbpro_weights_cache.json"
+    assert cache_path("sqlite:///cbpro_history.db", "weights") == "cbpro_weights_cache.json"
+    assert cache_path("sqlite://", "weights") is None
+    assert cache_path("postgresql://localhost/cbpro", "weights") is None
+
+
+def test_fetch_hit_and_miss(weights_cache):
+    fetch = Mock(return_value={"BTC": 1.0})
+
+    assert weights_cache.fetch("BTC", fetch, ttl=60, max_staleness=600) == {"BTC": 1.0}
+    assert weights_cache.fetch("BTC", fetch, ttl=60, max_staleness=600) == {"BTC": 1.0}
+
+    assert fetch.call_count == 1
+    assert (weights_cache.hits, weights_cache.misses) == (1, 1)
+
+
+def test_fetch_stale_while_revalidate(weights_cache):
+    weights_cache.put("BTC", {"BTC": 1.0})
+    age_entries(weights_cache.path, 120)
+    fetch = Mock(return_value={"BTC": 2.0})
+
+    assert weights_cache.fetch("BTC", fetch, ttl=60, max_staleness=600) == {"BTC": 1.0}
+    weights_cache.wait()
+
+    assert weights_cache.stale_hits == 1
+    assert weights_cache.get("BTC")[0] == {"BTC": 2.0}
+
+
+def test_fetch_refuses_entries_past_max_staleness(weights_cache):
+    weights_cache.put("BTC", {"BTC": 1.0})
+    age_entries(weights_cache.path, 1200)
+    fetch = Mock(side_effect=Exception("429 Too Many Requests"))
+
+    with pytest.raises(Exception, match="maximum staleness"):
+        weights_cache.fetch("BTC", fetch, ttl=60, max_staleness=600)
+
+
+def test_get_cache_shared_per_path(tmp_path):
+    db_engine = f"sqlite:///{tmp_path}/cbpro_history.db"
+
+    assert cache_module.get_cache(db_engine, "weights") is cache_module.get_cache(db_engine, "weights")
+    assert cache_module.get_cache("sqlite://", "weights") is None
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+import math
+from array import array
+
+import pytest
+
+from optimal_buy_cbpro.columns import map_columns, read_columns, write_columns
+
+
+def test_columns_round_trip(tmp_path):
+    path = tmp_path / "results.cols"
+    columns = {"price": array("d", [1.5, math.nan, -2.0]), "count": array("q", [1, 2, 3])}
+
+    write_columns(path, columns, source="test")
+
+    header, read = read_columns(path)
+    assert header["source"] == "test"
+    assert header["count"] == 3
+    assert list(read["count"]) == [1, 2, 3]
+    assert read["price"][0] == 1.5 and math.isnan(read["price"][1])
+
+
+def test_mapped_columns_are_aligned_views(tmp_path):
+    path = tmp_path / "results.cols"
+    write_columns(path, {"a": array("d", [1.0, 2.0]), "b": array("q", [7, 8])}, note="x" * 5)
+
+    header, mapped = map_columns(path)
+
+    assert isinstance(mapped["a"], memoryview)
+    assert list(mapped["a"]) == [1.0, 2.0]
+    assert list(mapped["b"][1:]) == [8]
+    with open(path, "rb") as f:
+        assert len(f.readline()) % 8 == 0
+
+
+def test_columns_must_be_the_same_length(tmp_path):
+    with pytest.raises(Exception, match="different lengths"):
+        write_columns(tmp_path / "bad.cols", {"a": array("d", [1.0]), "b": array("d", [])})
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import threading
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from optimal_buy_cbpro import daemon
+from optimal_buy_cbpro.cache import FileCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_jobs_run_on_their_intervals():
+    clock = FakeClock()
+    scheduler = daemon.Scheduler(clock=clock)
+    runs = []
+    scheduler.add("deposit", 300, lambda: runs.append("deposit"))
+    scheduler.add("buy", 100, lambda: runs.append("buy"))
+
+    assert scheduler.run_pending() == ["deposit", "buy"]
+    clock.now += 100
+    assert scheduler.run_pending() == ["buy"]
+    clock.now += 50
+    assert scheduler.run_pending() == []
+    # Overdue since 1200, the buy runs once rather than catching up
+    clock.now += 150
+    assert scheduler.run_pending() == ["buy", "deposit"]
+    assert runs == ["deposit", "buy", "buy", "buy", "deposit"]
+    assert scheduler.next_job().next_run == 1400
+
+
+def test_failed_job_is_retried_early():
+    clock = FakeClock()
+    scheduler = daemon.Scheduler(retry_delay=30, clock=clock)
+    fn = Mock(side_effect=[Exception("API down"), None])
+    job = scheduler.add("buy", 3600, fn)
+
+    assert scheduler.run_pending() == ["buy"]
+    assert job.next_run == 1030
+    clock.now = 1030
+    scheduler.run_pending()
+    assert fn.call_count == 2
+    assert job.next_run == 1030 + 3600
+
+
+def test_job_can_ask_to_run_sooner():
+    clock = FakeClock()
+    scheduler = daemon.Scheduler(clock=clock)
+    # A buy held back by a deposit that clears in ten minutes
+    fn = Mock(side_effect=[1600.0, None])
+    job = scheduler.add("buy", 86400, fn)
+
+    scheduler.run_pending()
+    assert job.next_run == 1600
+    clock.now = 1600
+    scheduler.run_pending()
+    # The cadence carries on from the buy that actually ran
+    assert job.next_run == 1600 + 86400
+
+
+def test_restart_keeps_cadence(tmp_path):
+    state = FileCache(str(tmp_path / "schedule.json"), "schedule")
+    clock = FakeClock()
+    scheduler = daemon.Scheduler(state_cache=state, clock=clock)
+    scheduler.add("buy", 3600, lambda: None)
+    scheduler.run_pending()
+
+    # Restarted ten minutes later: the next buy is still due an hour after the last
+    clock.now += 600
+    restarted = daemon.Scheduler(state_cache=state, clock=clock)
+    job = restarted.add("buy", 3600, lambda: None)
+    assert job.next_run == 1000 + 3600
+    assert restarted.run_pending() == []
+
+
+def test_run_daemon_reuses_client_and_session(mocker):
+    stop_event = threading.Event()
+    cycles = []
+
+    def buy_cycle(args, coins_config, client, db_session):
+        cycles.append((args.run_id, client, db_session))
+        stop_event.set()
+
+    mocker.patch.object(daemon, "buy_cycle", side_effect=buy_cycle)
+    client = Mock()
+    args = SimpleNamespace(
+        db_engine="sqlite://", buy_interval=60, deposit_interval=0, amount=None,
+        payment_method_id=None, run_id="fixed",
+    )
+
+    daemon.run_daemon(args, {"BTC": {}}, client, "session", stop_event=stop_event)
+
+    # Each cycle gets its own run id, never the fixed one
+    assert cycles == [(None, client, "session")]
+    assert args.run_id == "fixed"
+
+
+def test_deposit_interval_needs_amount():
+    args = SimpleNamespace(db_engine="sqlite://", buy_interval=60, deposit_interval=60, amount=None, payment_method_id=None)
+
+    with pytest.raises(Exception, match="--amount"):
+        daemon.build_scheduler(args, {}, Mock(), Mock())
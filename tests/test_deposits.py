@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest.mock import Mock
+
+import pytest
+
+from optimal_buy_cbpro import deposits, optimal_buy_cbpro
+from optimal_buy_cbpro.history import Deposit, check_ledger, ledger_totals
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_time():
+    return FakeTime()
+
+
+def test_deposit_created_committed_and_polled(args, v2, db_session, fake_time):
+    v2.clears_after = 3
+
+    row = deposits.make_deposit(args, Mock(), db_session, raw=v2, sleep=fake_time.sleep, clock=fake_time.clock)
+
+    assert [(method, path) for method, path, _ in v2.calls] == [
+        ("POST", "/v2/accounts/acct-1/deposits"),
+        ("POST", "/v2/accounts/acct-1/deposits/dep-1/commit"),
+        ("GET", "/v2/accounts/acct-1/deposits/dep-1"),
+        ("GET", "/v2/accounts/acct-1/deposits/dep-1"),
+        ("GET", "/v2/accounts/acct-1/deposits/dep-1"),
+    ]
+    assert v2.calls[0][2] == {"amount": "10.0", "currency": "USD", "payment_method": "pm-1", "commit": False}
+    assert fake_time.sleeps == [1.0, 2.0, 4.0]
+    stored = db_session.query(Deposit).one()
+    assert stored is row
+    assert (stored.status, stored.amount, stored.payout_at) == ("completed", Decimal("10.00"), datetime(2024, 1, 5, 12))
+    assert ledger_totals(db_session, "deposited") == {"USD": Decimal("10.00")}
+
+
+def test_poll_gives_up_at_timeout(make_args, v2, db_session, fake_time):
+    v2.clears_after = 100
+
+    row = deposits.make_deposit(make_args(deposit_poll_timeout=10), Mock(), db_session, raw=v2, sleep=fake_time.sleep, clock=fake_time.clock)
+
+    assert fake_time.sleeps == [1.0, 2.0, 4.0, 3.0]
+    assert row.status == "created"
+    assert deposits.pending_deposits(db_session, "USD") == [row]
+
+
+def test_failed_poll_keeps_the_committed_deposit(args, v2, db_session, fake_time):
+    v2.get = Mock(side_effect=Exception("503 Server Error"))
+
+    row = deposits.make_deposit(args, Mock(), db_session, raw=v2, sleep=fake_time.sleep, clock=fake_time.clock)
+
+    assert [path for method, path, _ in v2.calls if method == "POST"] == [
+        "/v2/accounts/acct-1/deposits",
+        "/v2/accounts/acct-1/deposits/dep-1/commit",
+    ]
+    assert row.status == "created"
+    assert deposits.pending_deposits(db_session, "USD") == [row]
+
+
+def test_buy_cycle_waits_for_pending_deposit(make_args, v2, db_session, mocker):
+    buy = mocker.patch.object(optimal_buy_cbpro, "buy")
+    now = datetime.now(timezone.utc)
+    payout_at = now + timedelta(days=3)
+    db_session.add(Deposit(currency="USD", amount=Decimal("10"), cbpro_deposit_id="dep-1", status="created", payout_at=payout_at.replace(tzinfo=None)))
+    db_session.commit()
+    mocker.patch.object(deposits, "get_raw_client", return_value=v2)
+
+    # Not yet due: no lookup, and only a note unless --wait-for-deposits
+    assert optimal_buy_cbpro.buy_cycle(make_args(), {}, Mock(), db_session) is None
+    buy.assert_called_once()
+    wait_until = optimal_buy_cbpro.buy_cycle(make_args(wait_for_deposits=True), {}, Mock(), db_session)
+    assert wait_until == pytest.approx(payout_at.timestamp(), abs=1e-3)
+    buy.assert_called_once()
+    assert v2.calls == []
+
+    # Past its payout time the deposit is looked up once and, cleared, no longer holds the cycle
+    v2.clears_after = 1
+    later = now + timedelta(days=4)
+    assert deposits.deposit_hold(make_args(wait_for_deposits=True), Mock(), db_session, now=later) is None
+    assert [method for method, _, _ in v2.calls] == ["GET"]
+    assert deposits.pending_deposits(db_session, "USD") == []
+
+
+def test_canceled_deposit_leaves_the_ledger(make_args, v2, db_session, fake_time):
+    v2.clears_after = 100
+    v2.final = "canceled"
+    args = make_args(deposit_poll_timeout=0)
+
+    deposits.make_deposit(args, Mock(), db_session, raw=v2, sleep=fake_time.sleep, clock=fake_time.clock)
+    assert ledger_totals(db_session, "deposited") == {"USD": Decimal("10.00")}
+
+    # Found canceled once it is past its payout time
+    v2.clears_after = 1
+    deposits.refresh_pending_deposits(args, Mock(), db_session, raw=v2, now=datetime(2024, 1, 6))
+    assert db_session.query(Deposit).one().status == "canceled"
+    assert ledger_totals(db_session, "deposited") == {"USD": Decimal("0.00")}
+    assert check_ledger(db_session) == []
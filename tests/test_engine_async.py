@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from optimal_buy_cbpro import engine_async
+
+
+@pytest.fixture
+def steps(mocker):
+    calls = []
+    fetches_started = threading.Barrier(3, timeout=5)
+
+    def fetch(name, result):
+        def step(*args, **kwargs):
+            calls.append(name)
+            # Products, prices and weights have to be in flight together
+            fetches_started.wait()
+            return result
+        return step
+
+    def open_orders(*args, **kwargs):
+        calls.append("open_orders")
+        return ["order"]
+
+    mocker.patch.object(engine_async, "prepare_open_orders", side_effect=open_orders)
+    mocker.patch.object(engine_async, "get_configured_products_info", side_effect=fetch("products", {"BTC": {}}))
+    mocker.patch.object(engine_async, "get_configured_prices", side_effect=fetch("prices", {"BTC": 50000.0}))
+    mocker.patch.object(engine_async, "get_configured_weights", side_effect=fetch("weights", {"BTC": 1.0}))
+    buy_with_balances = mocker.patch.object(engine_async, "buy_with_balances")
+    return SimpleNamespace(calls=calls, buy_with_balances=buy_with_balances)
+
+
+def test_async_buy_fetches_concurrently(steps):
+    client = Mock()
+    client.get_accounts.side_effect = lambda: steps.calls.append("accounts") or "accounts"
+    args = SimpleNamespace(fiat_currency="USD", run_id="run-1")
+
+    asyncio.run(engine_async.async_buy(args, {"BTC": {}}, client, "db"))
+
+    # Balances are only read once the open orders are cancelled or listed
+    assert steps.calls.index("open_orders") < steps.calls.index("accounts")
+    steps.buy_with_balances.assert_called_once_with(
+        args, {"BTC": {}}, "accounts", {"BTC": 50000.0}, client, "db", "run-1", weights={"BTC": 1.0}, open_orders=["order"]
+    )
+
+
+def test_async_buy_weights_failure_falls_back(steps, mocker):
+    mocker.patch.object(engine_async, "get_configured_weights", side_effect=Exception("CoinGecko down"))
+    # Without the weights call the barrier would never fill
+    mocker.patch.object(engine_async, "get_configured_products_info", return_value={"BTC": {}})
+    mocker.patch.object(engine_async, "get_configured_prices", return_value={"BTC": 50000.0})
+    client = Mock()
+    client.get_accounts.return_value = "accounts"
+    args = SimpleNamespace(fiat_currency="USD", run_id="run-1")
+
+    asyncio.run(engine_async.async_buy(args, {"BTC": {}}, client, "db"))
+
+    assert steps.buy_with_balances.call_args.kwargs["weights"] is None
+
+
+def test_async_buy_aborts_without_prices(steps, mocker):
+    mocker.patch.object(engine_async, "get_configured_prices", side_effect=Exception("no prices"))
+    mocker.patch.object(engine_async, "get_configured_products_info", return_value={"BTC": {}})
+    mocker.patch.object(engine_async, "get_configured_weights", return_value={"BTC": 1.0})
+    client = Mock()
+    args = SimpleNamespace(fiat_currency="USD", run_id="run-1")
+
+    asyncio.run(engine_async.async_buy(args, {"BTC": {}}, client, "db"))
+
+    steps.buy_with_balances.assert_not_called()
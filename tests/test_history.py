@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+import sqlite3
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import inspect, text
+
+from optimal_buy_cbpro import history, ledger_check
+from optimal_buy_cbpro.history import (
+    Deposit, Order, Withdrawal, check_ledger, get_session, ledger_totals, sum_by_currency, unit_of_work,
+)
+
+
+def create_old_schema(path):
+    # The tables as older versions created them: Float amounts, no created_at
+    # on withdrawals or deposits and no indexes
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE orders (id INTEGER PRIMARY KEY, currency VARCHAR, price FLOAT, size FLOAT,
+                             cbpro_order_id VARCHAR, created_at DATETIME);
+        CREATE TABLE withdrawals (id INTEGER PRIMARY KEY, currency VARCHAR, amount FLOAT,
+                                  crypto_address VARCHAR, cbpro_withdrawal_id VARCHAR);
+        CREATE TABLE deposits (id INTEGER PRIMARY KEY, currency VARCHAR, amount FLOAT,
+                               payment_method_id VARCHAR, payout_at DATETIME, cbpro_deposit_id VARCHAR);
+        INSERT INTO orders VALUES (1, 'BTC', 4975.0, 0.0201005, 'o1', '2021-03-04 05:06:07.000000');
+        INSERT INTO withdrawals VALUES (1, 'BTC', 0.1, 'addr', 'w1');
+        INSERT INTO withdrawals VALUES (2, 'BTC', 0.2, 'addr', 'w2');
+        INSERT INTO withdrawals VALUES (3, 'ETH', 1.0, 'addr', 'w3');
+    """)
+    connection.commit()
+    connection.close()
+
+
+def test_migrates_float_history_to_exact_decimals(tmp_path):
+    path = tmp_path / "cbpro_history.db"
+    create_old_schema(path)
+
+    session = get_session(f"sqlite:///{path}")
+
+    order = session.query(Order).one()
+    assert order.price == Decimal("4975.0")
+    assert order.size == Decimal("0.0201005")
+    assert order.created_at == datetime(2021, 3, 4, 5, 6, 7)
+    assert [w.amount for w in session.query(Withdrawal).order_by(Withdrawal.id)] == [
+        Decimal("0.1"), Decimal("0.2"), Decimal("1.0"),
+    ]
+    # 0.1 + 0.2 is 0.30000000000000004 in floats
+    assert sum_by_currency(session, Withdrawal.amount) == {"BTC": Decimal("0.3"), "ETH": Decimal("1.0")}
+
+    inspector = inspect(session.get_bind())
+    for table in ("orders", "withdrawals", "deposits"):
+        indexes = {tuple(index["column_names"]) for index in inspector.get_indexes(table)}
+        assert ("currency",) in indexes
+        assert ("created_at",) in indexes
+    assert "created_at" in {c["name"] for c in inspector.get_columns("deposits")}
+
+
+def test_migration_is_idempotent(tmp_path, capsys):
+    path = tmp_path / "cbpro_history.db"
+    create_old_schema(path)
+    get_session(f"sqlite:///{path}").close()
+    capsys.readouterr()
+
+    session = get_session(f"sqlite:///{path}")
+
+    assert "Migrated" not in capsys.readouterr().out
+    assert session.query(Withdrawal).count() == 3
+
+
+def test_new_rows_keep_every_digit():
+    session = get_session("sqlite://")
+    session.add(Withdrawal(currency="BTC", amount=Decimal("0.123456789012345678")))
+    session.add(Withdrawal(currency="BTC", amount=0.1))
+    session.commit()
+
+    amounts = sorted(w.amount for w in session.query(Withdrawal))
+    assert amounts == [Decimal("0.1"), Decimal("0.123456789012345678")]
+    assert session.query(Withdrawal).first().created_at is not None
+    assert sum_by_currency(session, Withdrawal.amount) == {"BTC": Decimal("0.223456789012345678")}
+
+
+def test_decimal_sum_in_sql():
+    session = get_session("sqlite://")
+    session.add_all([Withdrawal(currency="BTC", amount=Decimal("0.1")) for _ in range(3)])
+    session.commit()
+
+    # SQLite's SUM() gives 0.30000000000000004
+    assert session.execute(text("SELECT decimal_sum(amount) FROM withdrawals")).scalar() == "0.3"
+
+
+def test_concurrent_writers_keep_every_ledger_update(tmp_path):
+    # Two processes sharing the database, e.g. the daemon and a reconcile run
+    path = f"sqlite:///{tmp_path / 'cbpro_history.db'}"
+    daemon, manual = get_session(path), get_session(path)
+    daemon.add(Withdrawal(currency="BTC", amount=Decimal("1")))
+    daemon.commit()
+    # The other writer has read the running total in its own transaction
+    read_earlier = manual.query(history.Balance).all()
+    assert [b.total for b in read_earlier] == [Decimal("1")]
+
+    daemon.add(Withdrawal(currency="BTC", amount=Decimal("2")))
+    daemon.commit()
+    manual.add(Withdrawal(currency="BTC", amount=Decimal("4")))
+    manual.commit()
+
+    assert ledger_totals(daemon, "withdrawn") == {"BTC": Decimal("7")}
+
+
+def test_ledger_follows_inserts_and_deletes():
+    session = get_session("sqlite://")
+    session.add_all([
+        Withdrawal(currency="BTC", amount=Decimal("0.1")),
+        Withdrawal(currency="BTC", amount=Decimal("0.2")),
+        Deposit(currency="USD", amount=Decimal("100.00")),
+    ])
+    session.commit()
+    assert ledger_totals(session, "withdrawn") == {"BTC": Decimal("0.3")}
+    assert ledger_totals(session, "deposited") == {"USD": Decimal("100.00")}
+
+    session.delete(session.query(Withdrawal).filter_by(amount=Decimal("0.1")).one())
+    session.add(Withdrawal(currency="ETH", amount=Decimal("1.5")))
+    session.commit()
+    assert ledger_totals(session, "withdrawn") == {"BTC": Decimal("0.2"), "ETH": Decimal("1.5")}
+
+    # A rolled back insert doesn't move the ledger
+    session.add(Withdrawal(currency="BTC", amount=Decimal("5")))
+    session.flush()
+    session.rollback()
+    assert ledger_totals(session, "withdrawn")["BTC"] == Decimal("0.2")
+    assert check_ledger(session) == []
+
+
+def test_ledger_built_from_existing_history(tmp_path):
+    path = tmp_path / "cbpro_history.db"
+    create_old_schema(path)
+
+    session = get_session(f"sqlite:///{path}")
+
+    assert ledger_totals(session, "withdrawn") == {"BTC": Decimal("0.3"), "ETH": Decimal("1.0")}
+    assert check_ledger(session) == []
+
+
+def test_check_ledger_finds_drift_and_rebuild_fixes_it(tmp_path, capsys):
+    path = tmp_path / "cbpro_history.db"
+    session = get_session(f"sqlite:///{path}")
+    session.add(Withdrawal(currency="BTC", amount=Decimal("0.5")))
+    session.commit()
+    # Edited in place, behind the ledger's back
+    session.query(Withdrawal).update({"amount": Decimal("0.4")})
+    session.commit()
+
+    assert check_ledger(session) == [("BTC", "withdrawn", Decimal("0.5"), Decimal("0.4"))]
+    assert ledger_check.main(["--db-engine", f"sqlite:///{path}"]) == 1
+    assert ledger_check.main(["--db-engine", f"sqlite:///{path}", "--rebuild"]) == 0
+    assert ledger_check.main(["--db-engine", f"sqlite:///{path}"]) == 0
+    assert "BTC withdrawn: ledger 0.5, history 0.4" in capsys.readouterr().out
+
+
+def test_sqlite_engine_uses_wal_and_pragmas(tmp_path):
+    session = get_session(f"sqlite:///{tmp_path / 'cbpro_history.db'}")
+
+    pragmas = {name: session.execute(text(f"PRAGMA {name}")).scalar() for name in ("journal_mode", "synchronous", "busy_timeout")}
+    assert pragmas == {"journal_mode": "wal", "synchronous": 1, "busy_timeout": history.SQLITE_BUSY_TIMEOUT_MS}
+
+
+def test_factory_shared_and_schema_checked_once(tmp_path, mocker):
+    url = f"sqlite:///{tmp_path / 'cbpro_history.db'}"
+    factory = history.get_session_factory(url)
+    assert history.get_session_factory(url) is factory
+
+    # A new process (a new engine) finds the schema current and skips the migration
+    migrate = mocker.patch.object(history, "migrate")
+    history.ensure_schema(history.create_db_engine(url))
+    migrate.assert_not_called()
+
+    mocker.patch.object(history, "SCHEMA_VERSION", history.SCHEMA_VERSION + 1)
+    history.ensure_schema(history.create_db_engine(url))
+    migrate.assert_called_once()
+
+
+def test_reader_does_not_block_writer(tmp_path):
+    path = tmp_path / "cbpro_history.db"
+    factory = history.get_session_factory(f"sqlite:///{path}")
+    # A separate process's open read transaction, like a long report. Without
+    # WAL the writer's commit would wait for it and then fail as locked.
+    reader = sqlite3.connect(path, isolation_level=None)
+    reader.execute("BEGIN")
+    assert reader.execute("SELECT count(*) FROM withdrawals").fetchone() == (0,)
+
+    start = time.monotonic()
+    with unit_of_work(factory) as writer:
+        writer.add(Withdrawal(currency="BTC", amount=Decimal("0.1")))
+    assert time.monotonic() - start < 1
+
+    # The reader keeps its snapshot until its transaction ends
+    assert reader.execute("SELECT count(*) FROM withdrawals").fetchone() == (0,)
+    reader.execute("COMMIT")
+    assert reader.execute("SELECT count(*) FROM withdrawals").fetchone() == (1,)
+    reader.close()
+
+
+def test_unit_of_work_commits_once_or_rolls_back(tmp_path):
+    factory = history.get_session_factory(f"sqlite:///{tmp_path / 'cbpro_history.db'}")
+
+    with unit_of_work(factory) as db_session:
+        db_session.add_all([Withdrawal(currency="BTC", amount=Decimal("0.1")) for _ in range(3)])
+    with pytest.raises(ValueError):
+        with unit_of_work(factory) as db_session:
+            db_session.add(Withdrawal(currency="BTC", amount=Decimal("5")))
+            db_session.flush()
+            raise ValueError("failed half way")
+
+    with unit_of_work(factory) as db_session:
+        assert db_session.query(Withdrawal).count() == 3
+        assert ledger_totals(db_session, "withdrawn") == {"BTC": Decimal("0.3")}
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import math
+import random
+from decimal import Context, Decimal, getcontext, localcontext, ROUND_DOWN
+from types import SimpleNamespace
+
+from optimal_buy_cbpro import ladder
+from optimal_buy_cbpro import optimal_buy_cbpro
+
+
+def quantize_down(value, increment):
+    return value.quantize(increment, rounding=ROUND_DOWN, context=Context(prec=28))
+
+
+def reference_buy_orders(amount_to_buy_fiat, current_price, minimum_order_value_fiat, size_precision, price_precision, args):
+    # generate_buy_orders as it was before the ladder module, minus the prints
+    # and with the 8 digit context made local
+    with localcontext() as ctx:
+        ctx.prec = 8
+        buy_orders = []
+        if amount_to_buy_fiat < minimum_order_value_fiat:
+            return buy_orders
+        max_possible_orders_by_value = math.floor(amount_to_buy_fiat / minimum_order_value_fiat)
+        number_of_orders = min(args.order_count, max(1, max_possible_orders_by_value))
+        if number_of_orders == 0:
+            return buy_orders
+        amount_fiat_per_order = Decimal(str(amount_to_buy_fiat)) / Decimal(str(number_of_orders))
+        amount_fiat_per_order = quantize_down(amount_fiat_per_order, size_precision)
+        if amount_fiat_per_order < Decimal(str(minimum_order_value_fiat)):
+            number_of_orders = max(1, math.floor(Decimal(str(amount_to_buy_fiat)) / Decimal(str(minimum_order_value_fiat))))
+            amount_fiat_per_order = Decimal(str(amount_to_buy_fiat)) / Decimal(str(number_of_orders))
+            amount_fiat_per_order = quantize_down(amount_fiat_per_order, size_precision)
+        discount_factor = Decimal(str(1 - args.starting_discount))
+        price_decimal = Decimal(str(current_price))
+        for i in range(number_of_orders):
+            discounted_price = quantize_down(price_decimal * discount_factor, price_precision)
+            if discounted_price <= Decimal("0"):
+                continue
+            size_base_currency = quantize_down(amount_fiat_per_order / discounted_price, size_precision)
+            if size_base_currency * discounted_price < Decimal(str(minimum_order_value_fiat)):
+                continue
+            buy_orders.append({"price": float(discounted_price), "size": float(size_base_currency)})
+            discount_factor -= Decimal(str(args.discount_step))
+        return buy_orders
+
+
+def random_case(rng):
+    price = round(rng.choice([rng.uniform(0.0001, 1), rng.uniform(1, 500), rng.uniform(500, 120000)]), rng.randint(0, 8))
+    size_increment = Decimal(rng.choice(["1", "0.1", "0.01", "0.0001", "0.00001", "0.00000001"]))
+    price_increment = Decimal(rng.choice(["1", "0.5", "0.01", "0.001", "0.00001", "0.000001"]))
+    args = SimpleNamespace(
+        order_count=rng.randint(0, 12),
+        starting_discount=rng.choice([0, 0.005, 0.0123, 0.1, rng.uniform(0, 0.2)]),
+        discount_step=rng.choice([0.01, 0.005, 0.25, rng.uniform(0, 0.3)]),
+    )
+    amount = round(rng.uniform(0, 5000), rng.randint(0, 4))
+    minimum = rng.choice([0.01, 1, 1.0, 10, rng.uniform(0.01, 50)])
+    return amount, price, minimum, size_increment, price_increment, args
+
+
+def test_ladder_matches_reference_exactly():
+    rng = random.Random(1234)
+    for _ in range(3000):
+        amount, price, minimum, size_increment, price_increment, args = random_case(rng)
+        ladders = ladder.build_ladders(
+            [("X", amount, price, minimum, size_increment, price_increment)],
+            args.order_count, args.starting_discount, args.discount_step,
+        )
+        expected = reference_buy_orders(amount, price, minimum, size_increment, price_increment, args)
+        assert ladder.ladder_orders(ladders["X"]) == expected, (amount, price, minimum, size_increment, price_increment, vars(args))
+
+
+def test_ladders_for_many_coins_in_one_pass():
+    args = SimpleNamespace(order_count=5, starting_discount=0.005, discount_step=0.01)
+    specs = [
+        ("BTC", 500.0, 5000.0, 1.0, Decimal("0.00000001"), Decimal("0.01")),
+        ("ETH", 300.0, 3000.0, 1.0, Decimal("0.0001"), Decimal("0.01")),
+        ("DOGE", 0.5, 0.1, 1.0, Decimal("0.1"), Decimal("0.00001")),
+    ]
+
+    ladders = ladder.build_ladders(specs, args.order_count, args.starting_discount, args.discount_step)
+
+    rungs = ladders["BTC"]
+    assert [(price.units, price.exponent) for price, _ in rungs][:2] == [(497500, -2), (492500, -2)]
+    assert (rungs[0][1].units, rungs[0][1].exponent) == (2010050, -8)  # 0.02010050 BTC
+    for spec in specs:
+        assert ladder.ladder_orders(ladders[spec[0]]) == reference_buy_orders(*spec[1:], args)
+    assert ladders["DOGE"] == []
+
+
+def test_generate_buy_orders_leaves_global_context_alone():
+    coins = {"BTC": {"minimum_order_size": 1.0}}
+    args = SimpleNamespace(order_count=5, starting_discount=0.005, discount_step=0.01)
+    prec = getcontext().prec
+
+    orders = optimal_buy_cbpro.generate_buy_orders(coins, "BTC", args, 500, 5000)
+
+    assert getcontext().prec == prec
+    assert [o["price"] for o in orders] == [4975.0, 4925.0, 4875.0, 4825.0, 4775.0]
+
+
+def test_diff_ladder_touches_only_what_moved():
+    rungs = [(100.0, 1.0), (99.0, 1.0), (98.0, 1.0), (97.0, 1.0)]
+    orders = [
+        ("keep", 100.05, 1.0),  # within 0.1% of the first rung
+        ("stale-high", 120.0, 1.0),
+        ("stale-low", 50.0, 1.0),
+        ("keep-too", 98.0, 0.9995),
+        ("extra", 10.0, 1.0),
+    ]
+
+    keep, edits, cancels, places = ladder.diff_ladder(rungs, orders, 0.001)
+    assert keep == ["keep", "keep-too"]
+    # Leftover orders move onto the missing rungs, highest first
+    assert edits == [("stale-high", 1, 99.0, 1.0), ("stale-low", 3, 97.0, 1.0)]
+    assert cancels == ["extra"]
+    assert places == []
+
+    keep, edits, cancels, places = ladder.diff_ladder(rungs, orders, 0.001, edit=False)
+    assert edits == []
+    assert cancels == ["stale-high", "stale-low", "extra"]
+    assert places == [(1, 99.0, 1.0), (3, 97.0, 1.0)]
+
+    # An unchanged ladder costs nothing
+    same = [(f"order-{i}", price, size) for i, (price, size) in enumerate(rungs)]
+    assert ladder.diff_ladder(rungs, same, 0.001) == (["order-0", "order-1", "order-2", "order-3"], [], [], [])
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+from decimal import Decimal
+
+import pytest
+
+from optimal_buy_cbpro.money import FixedPoint
+
+
+@pytest.mark.parametrize("units,exponent,text", [
+    (6012345, -2, "60123.45"),
+    (2010050, -8, "0.02010050"),
+    (5, -3, "0.005"),
+    (0, -2, "0.00"),
+    (-150, -2, "-1.50"),
+    (42, 0, "42"),
+    (3, 2, "300"),
+])
+def test_str_is_exact_plain_notation(units, exponent, text):
+    assert str(FixedPoint(units, exponent)) == text
+    assert FixedPoint(units, exponent).decimal() == Decimal(text)
+
+
+def test_from_value_truncates_to_increment():
+    assert str(FixedPoint.from_value(2999.999, Decimal("0.01"))) == "2999.99"
+    assert str(FixedPoint.from_value(1.234567891, Decimal("0.00000001"))) == "1.23456789"
+    assert str(FixedPoint.from_value("0.00012345", Decimal("0.0001"))) == "0.0001"
+    # The increment's exponent is what counts, as with quantize()
+    assert str(FixedPoint.from_value(1.27, Decimal("0.05"))) == "1.27"
+    price = FixedPoint(6012345, -2)
+    assert FixedPoint.from_value(price, Decimal("0.0001")) is price
+
+
+def test_float_equality_and_product():
+    price = FixedPoint(497500, -2)
+    size = FixedPoint(2010050, -8)
+
+    assert float(price) == 4975.0
+    assert price == FixedPoint(4975, 0)
+    assert hash(price) == hash(FixedPoint(4975, 0))
+    assert FixedPoint(1, -2) < FixedPoint(2, -2)
+    assert str(price * size) == "99.9999875000"
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 import pytest
 import math
+import time
 import json
 from coinbase.rest import RESTClient
+from decimal import Decimal
 from unittest.mock import Mock, patch
 from optimal_buy_cbpro.optimal_buy_cbpro import buy
 from optimal_buy_cbpro.history import get_session
+from optimal_buy_cbpro.cache import FileCache
 import os
 from dotenv import load_dotenv
 
@@ -291,6 +294,7 @@ def mock_client():
     # Mock list_orders and cancel_orders
     mock_orders = Mock()
     mock_orders.orders = []
+    mock_orders.has_next = False
     mock_orders.to_dict = Mock(return_value={"orders": []})
     client.list_orders.return_value = mock_orders
     
@@ -322,7 +326,9 @@ def test_buy_function(mock_client, mock_db_session):
     expected_product_ids = ["BTC-USD", "ETH-USD"]
     for product_id in expected_product_ids:
         mock_client.get_product.assert_any_call(product_id=product_id)
-        mock_client.list_orders.assert_any_call(product_ids=[product_id], order_status=["OPEN", "PENDING"])
+    mock_client.list_orders.assert_called_once_with(
+        product_ids=expected_product_ids, order_status=["OPEN", "PENDING"], limit=1000, cursor=None
+    )
 
 def test_buy_function_with_low_balance(mock_client, mock_db_session):
     args = MockArgs()
@@ -375,6 +381,7 @@ def test_buy_function_with_open_orders(mock_client, mock_db_session):
         Mock(order_id="test_order_1"),
         Mock(order_id="test_order_2")
     ]
+    mock_orders.has_next = False
     mock_orders.to_dict = Mock(return_value={
         "orders": [
             {"order_id": "test_order_1"},
@@ -401,3 +408,368 @@ def test_buy_function_with_error(mock_client, mock_db_session):
     
     assert str(exc_info.value) == "API Error"
     mock_client.get_accounts.assert_called_once()
+
+def test_get_prices_concurrent_partial_failure():
+    client = Mock()
+
+    def mock_get_product(product_id):
+        if product_id == "ETH-USD":
+            raise Exception("503 Server Error")
+        return Mock(price="50000.00")
+    client.get_product.side_effect = mock_get_product
+
+    prices = optimal_buy_cbpro.get_prices(client, ["BTC", "ETH", "LTC"], "USD", max_workers=3)
+
+    assert prices == {"BTC": 50000.0, "LTC": 50000.0}
+    assert list(prices) == ["BTC", "LTC"]
+    assert client.get_product.call_count == 3
+
+def test_get_prices_timeout():
+    client = Mock()
+
+    def mock_get_product(product_id):
+        if product_id == "ETH-USD":
+            time.sleep(0.5)
+        return Mock(price="3000.00")
+    client.get_product.side_effect = mock_get_product
+
+    prices = optimal_buy_cbpro.get_prices(client, ["BTC", "ETH"], "USD", max_workers=2, timeout=0.05)
+
+    assert prices == {"BTC": 3000.0}
+
+def test_get_prices_timeout_is_one_deadline():
+    client = Mock()
+
+    def mock_get_product(product_id):
+        if product_id != "BTC-USD":
+            time.sleep(1.0)
+        return Mock(price="3000.00")
+    client.get_product.side_effect = mock_get_product
+
+    # With one worker the slow tickers queue up; they share the timeout instead of getting one each
+    started = time.monotonic()
+    prices = optimal_buy_cbpro.get_prices(client, ["BTC", "ETH", "LTC", "SOL"], "USD", max_workers=1, timeout=0.3)
+
+    assert prices == {"BTC": 3000.0}
+    assert time.monotonic() - started < 0.7
+
+def test_get_prices_all_failed():
+    client = Mock()
+    client.get_product.side_effect = Exception("API Error")
+
+    with pytest.raises(Exception):
+        optimal_buy_cbpro.get_prices(client, ["BTC", "ETH"], "USD")
+
+COINGECKO_COINS_LIST = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+    {"id": "batcat", "symbol": "btc", "name": "batcat"},
+    {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+    {"id": "ethereum-wormhole", "symbol": "eth", "name": "Ethereum (Wormhole)"},
+    {"id": "uniswap", "symbol": "uni", "name": "Uniswap"},
+    {"id": "universe-token", "symbol": "uni", "name": "Universe"},
+]
+
+COINGECKO_MARKETS = {
+    "bitcoin": 800.0,
+    "batcat": 1.0,
+    "ethereum": 200.0,
+    "ethereum-wormhole": 5.0,
+    "uniswap": 40.0,
+    "universe-token": 2.0,
+}
+
+@pytest.fixture
+def mock_coingecko():
+    def mock_get(url, params=None, timeout=None):
+        response = Mock()
+        if url.endswith("/coins/list"):
+            response.json.return_value = COINGECKO_COINS_LIST
+        else:
+            response.json.return_value = [
+                {"id": coin_id, "market_cap": COINGECKO_MARKETS[coin_id]}
+                for coin_id in params["ids"].split(",")
+            ]
+        return response
+
+    with patch("optimal_buy_cbpro.optimal_buy_cbpro.requests.get", side_effect=mock_get) as mock:
+        optimal_buy_cbpro._coin_id_index = None
+        yield mock
+        optimal_buy_cbpro._coin_id_index = None
+
+def test_get_weights_by_coin_id(mock_coingecko):
+    coins_config = {
+        "BTC": {"name": "Bitcoin"},
+        "ETH": {"name": "Ethereum"},
+        "UNI": {"name": "Uniswap Protocol"},
+    }
+    weights = optimal_buy_cbpro.get_weights(coins_config, "USD")
+
+    markets_params = mock_coingecko.call_args_list[-1].kwargs["params"]
+    # BTC and ETH resolve by name; the UNI name matches nothing, so both
+    # candidates are fetched and the larger one wins
+    assert markets_params["ids"] == "bitcoin,ethereum,uniswap,universe-token"
+    assert math.isclose(weights["BTC"], 800.0 / 1040.0)
+    assert math.isclose(weights["ETH"], 200.0 / 1040.0)
+    assert math.isclose(weights["UNI"], 40.0 / 1040.0)
+
+def test_get_weights_pinned_coin_id(mock_coingecko):
+    weights = optimal_buy_cbpro.get_weights({"ETH": {"coingecko_id": "ethereum-wormhole"}, "BTC": None}, "USD")
+
+    assert mock_coingecko.call_args_list[-1].kwargs["params"]["ids"] == "batcat,bitcoin,ethereum-wormhole"
+    assert math.isclose(weights["ETH"], 5.0 / 805.0)
+
+def test_coin_id_index_built_once(mock_coingecko):
+    optimal_buy_cbpro.get_weights(["BTC"], "USD")
+    optimal_buy_cbpro.get_weights(["ETH"], "USD")
+
+    list_calls = [c for c in mock_coingecko.call_args_list if c.args[0].endswith("/coins/list")]
+    assert len(list_calls) == 1
+
+def catalog_product(base, quote_min_size, base_increment, price_increment, status="online"):
+    return Mock(
+        product_id=f"{base}-USD",
+        base_currency_id=base,
+        quote_currency_id="USD",
+        quote_min_size=quote_min_size,
+        base_min_size=None,
+        base_increment=base_increment,
+        quote_increment=price_increment,
+        price_increment=price_increment,
+        status=status,
+        trading_disabled=False,
+        cancel_only=False,
+        is_disabled=False,
+    )
+
+def test_get_products_info_catalog_cache(tmp_path):
+    client = Mock()
+    client.get_products.return_value = Mock(products=[
+        catalog_product("BTC", "1", "0.00000001", "0.01"),
+        catalog_product("JASMY", "1", "1", "0.00001", status="delisted"),
+    ])
+    cache = FileCache(str(tmp_path / "cbpro_products_cache.json"), "products")
+
+    for _ in range(2):
+        coins_config = {"BTC": {}, "JASMY": {}}
+        optimal_buy_cbpro.get_products_info(client, coins_config, "USD", cache=cache)
+
+    client.get_products.assert_called_once_with(product_type="SPOT", product_ids=["BTC-USD", "JASMY-USD"])
+    assert coins_config["BTC"]["minimum_order_size"] == 1.0
+    assert coins_config["BTC"]["trading_disabled"] is False
+    assert coins_config["JASMY"]["trading_disabled"] is True
+    assert optimal_buy_cbpro.get_decimal_precision("BTC", coins_config) == Decimal("0.00000001")
+    assert optimal_buy_cbpro.get_price_precision("JASMY", coins_config) == Decimal("0.00001")
+    # Without catalog data the hard-coded maps still apply
+    assert optimal_buy_cbpro.get_decimal_precision("BTC") == Decimal("0.00001")
+
+def test_configured_products_info_leaves_coins_config_alone():
+    client = Mock()
+    client.get_products.return_value = Mock(products=[catalog_product("BTC", "1", "0.00000001", "0.01")])
+    coins_config = {"BTC": {"withdrawal_address": None}}
+
+    products_info = optimal_buy_cbpro.get_configured_products_info(MockArgs(), coins_config, client)
+
+    assert products_info["BTC"]["minimum_order_size"] == 1.0
+    assert coins_config == {"BTC": {"withdrawal_address": None}}
+
+def test_set_buy_order_uses_catalog_increments():
+    client = Mock()
+    client.limit_order_gtc.return_value = Mock(success=True, success_response=Mock(order_id="order-1"))
+    client.limit_order_gtc.return_value.to_dict.return_value = {"success": True}
+    coins_config = {"ETH": {"base_increment": "0.00000001", "price_increment": "0.01"}}
+
+    optimal_buy_cbpro.set_buy_order(MockArgs(), "ETH", 2999.999, 1.234567891, client, Mock(), coins_config)
+
+    kwargs = client.limit_order_gtc.call_args.kwargs
+    assert kwargs["base_size"] == "1.23456789"
+    assert kwargs["limit_price"] == "2999.99"
+
+def test_planned_ladder_sent_and_stored_exactly():
+    args = MockArgs()
+    client = Mock()
+    response = Mock(success=True, success_response=Mock(order_id="order"))
+    response.to_dict.return_value = {"success": True}
+    client.limit_order_gtc.return_value = response
+    db_session = Mock()
+    coins_config = {"BTC": {"minimum_order_size": 1.0, "base_increment": "0.00000001", "price_increment": "0.01"}}
+
+    ladder = optimal_buy_cbpro.plan_ladders(args, {"BTC": 500.0}, coins_config, {"BTC": 5000.0})
+    optimal_buy_cbpro.submit_buy_orders(args, ladder, client, db_session, coins_config)
+
+    first = client.limit_order_gtc.call_args_list[0].kwargs
+    assert (first["limit_price"], first["base_size"]) == ("4975.00", "0.02010050")
+    row = db_session.add_all.call_args.args[0][0]
+    assert (row.price, row.size) == (Decimal("4975.00"), Decimal("0.02010050"))
+
+def test_cancel_open_orders_paginated_and_batched():
+    client = Mock()
+    first_page = Mock(orders=[Mock(order_id=f"order-{i}") for i in range(150)], has_next=True, cursor="page-2")
+    second_page = Mock(orders=[Mock(order_id=f"order-{i}") for i in range(150, 210)], has_next=False, cursor="")
+    client.list_orders.side_effect = [first_page, second_page]
+
+    def mock_cancel_orders(order_ids):
+        if "order-205" in order_ids:
+            raise Exception("500 Server Error")
+        return Mock(results=[
+            Mock(order_id=order_id, success=order_id != "order-3", failure_reason="UNKNOWN_CANCEL_ORDER")
+            for order_id in order_ids
+        ])
+    client.cancel_orders.side_effect = mock_cancel_orders
+
+    result = optimal_buy_cbpro.cancel_open_orders(client, ["BTC-USD", "ETH-USD"])
+
+    assert client.list_orders.call_count == 2
+    assert client.list_orders.call_args.kwargs["cursor"] == "page-2"
+    assert [len(c.kwargs["order_ids"]) for c in client.cancel_orders.call_args_list] == [100, 100, 10]
+    assert len(result["cancelled"]) == 199
+    assert result["failed"]["order-3"] == "UNKNOWN_CANCEL_ORDER"
+    assert result["failed"]["order-205"] == "500 Server Error"
+    assert len(result["failed"]) == 11
+
+def test_submit_buy_orders_parallel_in_ladder_order():
+    args = MockArgs()
+    args.order_workers = 4
+    client = Mock()
+
+    def mock_limit_order_gtc(client_order_id, product_id, side, base_size, limit_price, post_only):
+        # Earlier rungs answer later, so completion order is the reverse of ladder order
+        time.sleep(0.05 / float(limit_price))
+        if limit_price == "97.00":
+            raise Exception("503 Server Error")
+        response = Mock(success=True, success_response=Mock(order_id=f"{product_id}@{limit_price}"))
+        response.to_dict.return_value = {"success": True}
+        return response
+    client.limit_order_gtc.side_effect = mock_limit_order_gtc
+    db_session = Mock()
+    ladder = [("BTC", 1.0, 1.0), ("BTC", 2.0, 1.0), ("ETH", 3.0, 1.0), ("ETH", 97.0, 1.0)]
+
+    with pytest.raises(Exception, match="1 buy orders failed"):
+        optimal_buy_cbpro.submit_buy_orders(args, ladder, client, db_session)
+
+    db_session.add_all.assert_called_once()
+    db_session.commit.assert_called_once()
+    rows = db_session.add_all.call_args.args[0]
+    assert [row.cbpro_order_id for row in rows] == ["BTC-USD@1.00", "BTC-USD@2.00", "ETH-USD@3.00"]
+
+def test_submit_buy_orders_deterministic_client_order_ids():
+    client = Mock()
+    response = Mock(success=True, success_response=Mock(order_id="order"))
+    response.to_dict.return_value = {"success": True}
+    client.limit_order_gtc.return_value = response
+    ladder = [("BTC", 2.0, 1.0), ("BTC", 1.0, 1.0), ("ETH", 3.0, 1.0)]
+
+    for _ in range(2):
+        optimal_buy_cbpro.submit_buy_orders(MockArgs(), ladder, client, Mock(), run_id="run-1")
+    optimal_buy_cbpro.submit_buy_orders(MockArgs(), ladder, client, Mock(), run_id="run-2")
+
+    ids = [c.kwargs["client_order_id"] for c in client.limit_order_gtc.call_args_list]
+    assert sorted(ids[:3]) == sorted(ids[3:6])
+    assert len(set(ids[:3])) == 3
+    assert not set(ids[:3]) & set(ids[6:])
+    assert optimal_buy_cbpro.make_client_order_id("run-1", "BTC", 0) in ids[:3]
+
+def test_sync_buy_orders_only_changes_what_moved():
+    from optimal_buy_cbpro.history import Order, create_db_engine, migrate
+    from sqlalchemy.orm import Session
+
+    def resting(order_id, price, size, filled="0", product_id="BTC-USD"):
+        return Mock(
+            order_id=order_id, product_id=product_id, side="BUY", filled_size=filled,
+            order_configuration=Mock(limit_limit_gtc=Mock(limit_price=str(price), base_size=str(size))),
+        )
+
+    args = MockArgs()
+    args.order_count = 3
+    coins_config = {"BTC": {"minimum_order_size": 1.0, "base_increment": "0.00000001", "price_increment": "0.01"}}
+    ladder = optimal_buy_cbpro.plan_ladders(args, {"BTC": 300.0}, coins_config, {"BTC": 100.0})
+    (price_0, size_0), (price_1, size_1), (price_2, size_2) = [(float(p), float(s)) for _, p, s in ladder]
+    open_orders = [
+        resting("kept", price_0, size_0),
+        resting("moved", price_1 * 1.05, 0.5, filled="0.25"),
+        resting("stale", price_2 * 0.5, size_2),
+        resting("stale-2", price_2 * 0.4, size_2),
+        Mock(order_id="foreign", product_id="BTC-USD", side="SELL"),
+    ]
+    client = Mock()
+    client.cancel_orders.side_effect = lambda order_ids: Mock(results=[Mock(order_id=o, success=True) for o in order_ids])
+    client.edit_order.side_effect = lambda order_id, size, price: Mock(success=order_id == "moved")
+    response = Mock(success=True, success_response=Mock(order_id="new"))
+    response.to_dict.return_value = {"success": True}
+    client.limit_order_gtc.return_value = response
+    engine = create_db_engine("sqlite://")
+    migrate(engine)
+    db_session = Session(engine)
+    db_session.add(Order(currency="BTC", price=Decimal("10"), size=Decimal("0.5"), cbpro_order_id="moved"))
+    db_session.commit()
+
+    result = optimal_buy_cbpro.sync_buy_orders(args, ladder, open_orders, client, db_session, coins_config)
+
+    assert result == {"kept": 1, "edited": 1, "cancelled": 3, "placed": 1}
+    # Leftovers go in one batch, then the edit that failed is replaced
+    assert [c.kwargs["order_ids"] for c in client.cancel_orders.call_args_list] == [["foreign", "stale-2"], ["stale"]]
+    moved = client.edit_order.call_args_list[0].kwargs
+    # The edited size includes what already filled
+    assert (moved["order_id"], moved["price"]) == ("moved", str(ladder[1][1]))
+    assert Decimal(moved["size"]) == ladder[1][2].decimal() + Decimal("0.25")
+    placed = client.limit_order_gtc.call_args.kwargs
+    assert (placed["limit_price"], placed["base_size"]) == (str(ladder[2][1]), str(ladder[2][2]))
+    row = db_session.query(Order).filter_by(cbpro_order_id="moved").one()
+    assert row.price == ladder[1][1].decimal()
+
+def test_sync_buy_orders_keeps_rung_when_failed_edit_cannot_be_cancelled():
+    args = MockArgs()
+    args.order_count = 1
+    coins_config = {"BTC": {"minimum_order_size": 1.0, "base_increment": "0.00000001", "price_increment": "0.01"}}
+    ladder = optimal_buy_cbpro.plan_ladders(args, {"BTC": 100.0}, coins_config, {"BTC": 100.0})
+    _, price, size = ladder[0]
+    open_orders = [Mock(
+        order_id="moved", product_id="BTC-USD", side="BUY", filled_size="0",
+        order_configuration=Mock(limit_limit_gtc=Mock(limit_price=str(float(price) * 1.05), base_size=str(size))),
+    )]
+    client = Mock()
+    client.edit_order.return_value = Mock(success=False)
+    client.cancel_orders.return_value = Mock(results=[Mock(order_id="moved", success=False, failure_reason="UNKNOWN_CANCEL_ORDER")])
+
+    result = optimal_buy_cbpro.sync_buy_orders(args, ladder, open_orders, client, Mock(), coins_config)
+
+    # The old order is still on the book, so its rung isn't placed a second time
+    assert result == {"kept": 0, "edited": 0, "cancelled": 0, "placed": 0}
+    client.limit_order_gtc.assert_not_called()
+
+def test_sync_buy_orders_rerun_keeps_rung_client_order_ids():
+    args = MockArgs()
+    args.order_count = 3
+    coins_config = {"BTC": {"minimum_order_size": 1.0, "base_increment": "0.00000001", "price_increment": "0.01"}}
+    ladder = optimal_buy_cbpro.plan_ladders(args, {"BTC": 300.0}, coins_config, {"BTC": 100.0})
+    # The first pass only got the top rung onto the book
+    _, price, size = ladder[0]
+    open_orders = [Mock(
+        order_id="placed", product_id="BTC-USD", side="BUY", filled_size="0",
+        order_configuration=Mock(limit_limit_gtc=Mock(limit_price=str(price), base_size=str(size))),
+    )]
+    client = Mock()
+    response = Mock(success=True, success_response=Mock(order_id="new"))
+    response.to_dict.return_value = {"success": True}
+    client.limit_order_gtc.return_value = response
+
+    result = optimal_buy_cbpro.sync_buy_orders(args, ladder, open_orders, client, Mock(), coins_config, run_id="run-1")
+
+    assert result == {"kept": 1, "edited": 0, "cancelled": 0, "placed": 2}
+    # The rerun sends the ids the missing rungs had the first time, not the kept rung's
+    assert [c.kwargs["client_order_id"] for c in client.limit_order_gtc.call_args_list] == [
+        optimal_buy_cbpro.make_client_order_id("run-1", "BTC", 1),
+        optimal_buy_cbpro.make_client_order_id("run-1", "BTC", 2),
+    ]
+
+def test_remaining_value_counts_only_fiat_buys():
+    def resting(product_id, side="BUY"):
+        return Mock(
+            product_id=product_id, side=side, filled_size="0.5",
+            order_configuration=Mock(limit_limit_gtc=Mock(limit_price="100", base_size="2")),
+        )
+
+    assert optimal_buy_cbpro.remaining_value(resting("BTC-USD"), "usd") == 150.0
+    # Sells hold coins and other quotes hold other currencies, not our fiat
+    assert optimal_buy_cbpro.remaining_value(resting("BTC-USD", side="SELL"), "USD") == 0.0
+    assert optimal_buy_cbpro.remaining_value(resting("ETH-BTC"), "USD") == 0.0
+    assert optimal_buy_cbpro.remaining_value(Mock(product_id="BTC-USD", side="BUY", order_configuration=None), "USD") == 0.0
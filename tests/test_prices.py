@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+import pytest
+from unittest.mock import Mock
+
+from optimal_buy_cbpro import prices
+
+
+def pricebook(product_id, bid, ask):
+    return Mock(product_id=product_id, bids=[Mock(price=bid)], asks=[Mock(price=ask)])
+
+
+@pytest.fixture
+def client():
+    client = Mock()
+    client.get_best_bid_ask.return_value = Mock(pricebooks=[
+        pricebook("BTC-USD", "49990.00", "50010.00"),
+        pricebook("ETH-USD", "2999.00", "3001.00"),
+    ])
+    client.get_product.side_effect = lambda product_id: Mock(price="100.00")
+    return client
+
+
+def test_best_bid_ask_single_request(client):
+    result = prices.get_market_prices(client, ["BTC", "ETH"], "USD")
+
+    assert result == {"BTC": 50000.0, "ETH": 3000.0}
+    client.get_best_bid_ask.assert_called_once_with(product_ids=["BTC-USD", "ETH-USD"])
+    client.get_product.assert_not_called()
+
+
+def test_best_bid_ask_bid_anchor(client):
+    result = prices.get_market_prices(client, ["BTC", "ETH"], "USD", anchor="bid")
+
+    assert result == {"BTC": 49990.0, "ETH": 2999.0}
+
+
+def test_missing_products_fetched_individually(client):
+    result = prices.get_market_prices(client, ["BTC", "LTC", "ETH"], "USD")
+
+    assert list(result) == ["BTC", "LTC", "ETH"]
+    assert result["LTC"] == 100.0
+    client.get_product.assert_called_once_with(product_id="LTC-USD")
+
+
+def test_bulk_failure_falls_back_to_tickers(client):
+    client.get_best_bid_ask.side_effect = Exception("429 Client Error")
+
+    result = prices.get_market_prices(client, ["BTC", "ETH"], "USD")
+
+    assert result == {"BTC": 100.0, "ETH": 100.0}
+    assert client.get_product.call_count == 2
+
+
+def test_product_listing_source(client):
+    client.get_products.return_value = Mock(products=[
+        Mock(base_currency_id="BTC", quote_currency_id="USD", price="50001.00"),
+        Mock(base_currency_id="BTC", quote_currency_id="EUR", price="46000.00"),
+    ])
+
+    result = prices.get_market_prices(client, ["BTC"], "USD", source="products")
+
+    assert result == {"BTC": 50001.0}
+    client.get_products.assert_called_once_with(product_type="SPOT", product_ids=["BTC-USD"])
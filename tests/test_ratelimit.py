@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+import pytest
+import time
+from unittest.mock import Mock
+from requests.exceptions import ConnectionError, HTTPError
+
+from optimal_buy_cbpro.ratelimit import RateLimitedClient, TokenBucket
+
+
+def test_token_bucket_throttles_after_burst():
+    bucket = TokenBucket(rate=50, capacity=5)
+
+    start = time.monotonic()
+    for _ in range(10):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+
+    # 5 tokens up front, the other 5 refill at 50/s
+    assert elapsed >= 0.09
+    assert bucket.acquired == 10
+    assert bucket.waited > 0
+
+
+def test_token_bucket_unlimited():
+    bucket = TokenBucket(rate=0)
+
+    for _ in range(1000):
+        bucket.acquire()
+
+    assert bucket.acquired == 1000
+    assert bucket.waited == 0
+
+
+def http_error(status_code):
+    return HTTPError(f"{status_code} Client Error", response=Mock(status_code=status_code, headers={}))
+
+
+def test_rate_limited_client_retries_429():
+    rest_client = Mock()
+    rest_client.get_product.side_effect = [http_error(429), http_error(429), Mock(price="100.00")]
+    client = RateLimitedClient(rest_client, backoff=0.001)
+
+    assert client.get_product(product_id="BTC-USD").price == "100.00"
+    assert client.counters == {"calls": 3, "rate_limited": 2, "transient_errors": 0, "retries": 2, "failures": 0}
+    assert client.private_bucket.acquired == 3
+    assert client.public_bucket.acquired == 0
+
+
+def test_rate_limited_client_gives_up():
+    rest_client = Mock()
+    rest_client.get_public_product.side_effect = http_error(429)
+    client = RateLimitedClient(rest_client, max_retries=2, backoff=0.001)
+
+    with pytest.raises(HTTPError):
+        client.get_public_product(product_id="BTC-USD")
+    assert client.counters["failures"] == 1
+    assert client.public_bucket.acquired == 3
+
+
+def test_rate_limited_client_other_errors_not_retried():
+    rest_client = Mock()
+    rest_client.limit_order_gtc.side_effect = http_error(400)
+    client = RateLimitedClient(rest_client, backoff=0.001)
+
+    with pytest.raises(HTTPError):
+        client.limit_order_gtc(client_order_id="", product_id="BTC-USD")
+    assert client.counters["calls"] == 1
+    assert client.counters["retries"] == 0
+
+
+def test_rate_limited_client_retries_transient_errors():
+    rest_client = Mock()
+    order = Mock(success=True)
+    rest_client.limit_order_gtc.side_effect = [http_error(503), ConnectionError("Connection reset"), order]
+    client = RateLimitedClient(rest_client, backoff=0.001, max_transient_retries=2)
+
+    assert client.limit_order_gtc(client_order_id="abc", product_id="BTC-USD") is order
+    assert client.counters["transient_errors"] == 2
+    # Every attempt resends the same client_order_id
+    assert {c.kwargs["client_order_id"] for c in rest_client.limit_order_gtc.call_args_list} == {"abc"}
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from optimal_buy_cbpro import reconcile
+from optimal_buy_cbpro.history import Fill, Order, OrderStatus, check_ledger, ledger_totals
+
+
+def timestamp(i):
+    return (datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=i)).isoformat().replace("+00:00", "Z")
+
+
+def make_fill(i, order_id="o1"):
+    return SimpleNamespace(
+        entry_id=f"e{i}", trade_id=f"t{i}", order_id=order_id, product_id="BTC-USD", side="BUY",
+        price="40000.01", size="0.001", commission="0.24",
+        trade_time=timestamp(i), sequence_timestamp=timestamp(i),
+    )
+
+
+class FakeExchange:
+    # get_fills/list_orders with the API's paging: newest fills first, an opaque
+    # cursor while there are more pages
+    def __init__(self, fills=(), orders=(), page_size=2):
+        self.fills = list(fills)
+        self.orders = {o.order_id: o for o in orders}
+        self.page_size = page_size
+        self.fill_calls = []
+        self.order_calls = []
+        self.fail_on_call = None
+
+    def get_fills(self, start_sequence_timestamp=None, limit=None, cursor=None):
+        self.fill_calls.append((start_sequence_timestamp, cursor))
+        if self.fail_on_call == len(self.fill_calls):
+            raise Exception("connection reset")
+        fills = sorted(self.fills, key=lambda f: f.sequence_timestamp, reverse=True)
+        if start_sequence_timestamp:
+            fills = [f for f in fills if f.sequence_timestamp >= start_sequence_timestamp]
+        offset = int(cursor or 0)
+        end = offset + self.page_size
+        return SimpleNamespace(fills=fills[offset:end], cursor=str(end) if end < len(fills) else "")
+
+    def list_orders(self, order_ids=None, limit=None, cursor=None):
+        self.order_calls.append(list(order_ids))
+        return SimpleNamespace(orders=[self.orders[i] for i in order_ids if i in self.orders], cursor="", has_next=False)
+
+
+def test_fills_paged_once_then_incrementally(db_session):
+    exchange = FakeExchange(fills=[make_fill(i) for i in range(5)])
+
+    assert reconcile.sync_fills(exchange, db_session) == 5
+    assert exchange.fill_calls == [(None, None), (None, "2"), (None, "4")]
+    assert db_session.query(Fill).count() == 5
+    assert ledger_totals(db_session, "filled") == {"BTC": Decimal("0.005")}
+
+    exchange.fills.append(make_fill(5))
+    exchange.fill_calls.clear()
+
+    # Only fills from the newest stored one on; that one isn't counted twice
+    assert reconcile.sync_fills(exchange, db_session) == 1
+    assert exchange.fill_calls == [(timestamp(4), None)]
+    assert ledger_totals(db_session, "filled") == {"BTC": Decimal("0.006")}
+    assert check_ledger(db_session) == []
+
+
+def test_interrupted_fill_sync_resumes_from_stored_cursor(db_session):
+    exchange = FakeExchange(fills=[make_fill(i) for i in range(5)])
+    exchange.fail_on_call = 2
+
+    with pytest.raises(Exception, match="connection reset"):
+        reconcile.sync_fills(exchange, db_session)
+    db_session.rollback()
+    assert db_session.query(Fill).count() == 2
+
+    exchange.fail_on_call = None
+    exchange.fill_calls.clear()
+    assert reconcile.sync_fills(exchange, db_session) == 3
+    assert exchange.fill_calls == [(None, "2"), (None, "4")]
+    assert reconcile.load_cursor(db_session, "fills") == {"since": timestamp(4)}
+
+
+def test_only_pending_order_statuses_are_refreshed(db_session):
+    db_session.add_all([Order(currency="BTC", cbpro_order_id=f"o{i}") for i in range(3)])
+    db_session.add(OrderStatus(cbpro_order_id="o0", status="FILLED"))
+    db_session.commit()
+    exchange = FakeExchange(orders=[
+        SimpleNamespace(order_id="o1", product_id="BTC-USD", status="CANCELLED", filled_size="0",
+                        average_filled_price="0", total_fees="0"),
+        SimpleNamespace(order_id="o2", product_id="BTC-USD", status="OPEN", filled_size="0.0005",
+                        average_filled_price="40000.01", total_fees="0.12"),
+    ])
+
+    assert reconcile.sync_order_statuses(exchange, db_session) == 2
+    assert exchange.order_calls == [["o1", "o2"]]
+    assert db_session.get(OrderStatus, "o2").filled_size == Decimal("0.0005")
+
+    exchange.order_calls.clear()
+    reconcile.sync_order_statuses(exchange, db_session)
+    # o1 is final now, o2 still open
+    assert exchange.order_calls == [["o2"]]
+
+
+def test_thousands_of_fills_and_orders_in_one_run(db_session):
+    count = 3000
+    db_session.add_all([Order(currency="BTC", cbpro_order_id=f"o{i}") for i in range(count)])
+    db_session.commit()
+    exchange = FakeExchange(
+        fills=[make_fill(i, order_id=f"o{i}") for i in range(count)],
+        orders=[SimpleNamespace(order_id=f"o{i}", status="FILLED") for i in range(count)],
+        page_size=reconcile.FILLS_PAGE_SIZE,
+    )
+
+    assert reconcile.reconcile(SimpleNamespace(), exchange, db_session) == {"fills": count, "orders": count}
+    assert len(exchange.fill_calls) == 3
+    assert len(exchange.order_calls) == count // reconcile.ORDER_STATUS_BATCH_SIZE
+    assert ledger_totals(db_session, "filled") == {"BTC": Decimal("3.000")}
+
+    exchange.fill_calls.clear()
+    exchange.order_calls.clear()
+    assert reconcile.reconcile(SimpleNamespace(), exchange, db_session) == {"fills": 0, "orders": 0}
+    assert exchange.order_calls == []
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+from unittest.mock import Mock
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from requests.exceptions import HTTPError
+
+from optimal_buy_cbpro import signing
+from optimal_buy_cbpro.ratelimit import RateLimitedClient
+
+
+@pytest.fixture
+def key_pair():
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    return pem, private_key.public_key()
+
+
+def test_tokens_cached_per_uri_until_near_expiry(key_pair, mocker):
+    pem, public_key = key_pair
+    load = mocker.spy(signing.serialization, "load_pem_private_key")
+    now = [1000.0]
+    signer = signing.JWTSigner("organizations/o/apiKeys/k", pem, clock=lambda: now[0])
+
+    uri = signing.format_uri("post", "/v2/accounts/a/deposits")
+    assert uri == "POST api.coinbase.com/v2/accounts/a/deposits"
+    token = signer.token(uri)
+    claims = jwt.decode(token, public_key, algorithms=["ES256"], options={"verify_exp": False, "verify_nbf": False})
+    assert claims == {"sub": "organizations/o/apiKeys/k", "iss": "cdp", "nbf": 1000, "exp": 1120, "uri": uri}
+    assert jwt.get_unverified_header(token)["kid"] == "organizations/o/apiKeys/k"
+
+    now[0] = 1000 + signing.JWT_LIFETIME - signing.JWT_REFRESH_MARGIN - 1
+    assert signer.token(uri) == token
+    assert signer.token(signing.format_uri("POST", "/v2/accounts/a/deposits/d/commit")) != token
+    now[0] += 1
+    assert signer.token(uri) != token
+    assert signer.signed == 3
+    load.assert_called_once()
+
+
+def test_raw_client_reuses_signer_and_session(key_pair):
+    pem, _ = key_pair
+    session = Mock()
+    session.request.return_value.json.return_value = {"data": {"id": "deposit-1"}}
+    client = signing.RawClient("key-1", pem, session=session)
+    other = signing.RawClient("key-1", pem, session=session)
+    assert other.signer is client.signer
+
+    for _ in range(3):
+        assert client.post("/v2/accounts/a/deposits", json={"amount": "10"}) == {"data": {"id": "deposit-1"}}
+
+    assert client.signer.signed == 1
+    method, url = session.request.call_args.args
+    kwargs = session.request.call_args.kwargs
+    assert (method, url) == ("POST", "https://api.coinbase.com/v2/accounts/a/deposits")
+    assert kwargs["headers"]["Authorization"].startswith("Bearer ")
+    assert kwargs["timeout"] == signing.RAW_REQUEST_TIMEOUT
+    session.request.return_value.raise_for_status.assert_called()
+
+
+def test_raw_client_empty_body_is_empty_dict(key_pair):
+    pem, _ = key_pair
+    session = Mock()
+    session.request.return_value = Mock(status_code=204, content=b"")
+    session.request.return_value.json.side_effect = ValueError("Expecting value")
+    client = signing.RawClient("key-1", pem, session=session)
+
+    assert client.post("/v2/accounts/a/deposits/d/commit") == {}
+    session.request.return_value = Mock(status_code=202, content=b"")
+    assert client.post("/v2/accounts/a/deposits/d/commit") == {}
+
+
+def test_raw_client_shares_rate_limits_and_retries(key_pair, mocker):
+    pem, _ = key_pair
+    mocker.patch.object(signing, "_raw_clients", {})
+    session = Mock()
+    error = HTTPError("503 Server Error", response=Mock(status_code=503, headers={}))
+    ok = Mock(status_code=200, content=b"{}")
+    ok.json.return_value = {"data": {"id": "deposit-1"}}
+    session.request.side_effect = [Mock(raise_for_status=Mock(side_effect=error)), ok]
+    limiter = RateLimitedClient(Mock(), backoff=0.001)
+    signing.get_raw_client("key-1", pem, limiter=limiter).session = session
+
+    assert signing.get_raw_client("key-1", pem).get("/v2/accounts/a/deposits/d") == {"data": {"id": "deposit-1"}}
+    assert limiter.counters["calls"] == 2
+    assert limiter.counters["retries"] == 1
+    assert limiter.private_bucket.acquired == 2
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("coinbase", "requests", "sqlalchemy", "dateutil")
+
+
+def import_times(*python_args):
+    # Runs python -X importtime and returns (exit code, {module: cumulative us})
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *python_args],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        times[module.strip()] = int(cumulative)
+    return result.returncode, times
+
+
+def heavy_imports(times):
+    return sorted(m for m in times if m.split(".")[0] in HEAVY_MODULES)
+
+
+@pytest.mark.parametrize("cli_args,expected_code", [
+    (["--help"], 0),
+    (["--mode", "buy"], 2),
+    (["--mode", "buy", "--key", "k", "--secret", "s", "--coins", "{"], 1),
+])
+def test_cli_exits_without_heavy_imports(cli_args, expected_code):
+    # --help, a missing argument and bad --coins JSON all return before the SDK,
+    # requests or SQLAlchemy are imported
+    returncode, times = import_times("-m", "optimal_buy_cbpro.cli", *cli_args)
+
+    assert returncode == expected_code
+    assert heavy_imports(times) == []
+
+
+def test_cli_import_time_regression():
+    _, cli_times = import_times("-c", "import optimal_buy_cbpro.cli")
+    _, full_times = import_times("-c", "import optimal_buy_cbpro.optimal_buy_cbpro")
+
+    cli = cli_times["optimal_buy_cbpro.cli"]
+    full = full_times["optimal_buy_cbpro.optimal_buy_cbpro"]
+    # Relative rather than absolute, so a slow CI machine doesn't fail it
+    assert cli * 10 < full
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import json
+import threading
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from optimal_buy_cbpro import stream
+from optimal_buy_cbpro.stream import PriceBook, StreamTrader
+
+COINS = {"BTC": {"minimum_order_size": 1.0, "base_increment": "0.00000001", "price_increment": "0.01"}}
+
+
+class ImmediateExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def ticker(product_id, price, bid=None, ask=None):
+    return json.dumps({"channel": "ticker", "events": [{"type": "update", "tickers": [
+        {"type": "ticker", "product_id": product_id, "price": str(price),
+         "best_bid": str(bid or price), "best_ask": str(ask or price)},
+    ]}]})
+
+
+def level2(product_id, updates, snapshot=False):
+    return {"channel": "l2_data", "events": [{
+        "type": "snapshot" if snapshot else "update",
+        "product_id": product_id,
+        "updates": [{"side": side, "price_level": str(price), "new_quantity": str(quantity)} for side, price, quantity in updates],
+    }]}
+
+
+def resting_order(order_id, price, size, filled="0"):
+    return SimpleNamespace(
+        order_id=order_id, product_id="BTC-USD", side="BUY", filled_size=filled,
+        order_configuration=SimpleNamespace(limit_limit_gtc=SimpleNamespace(base_size=str(size), limit_price=str(price))),
+    )
+
+
+def exchange(open_orders):
+    client = Mock()
+    client.list_orders.return_value = Mock(orders=open_orders, has_next=False, cursor="")
+    client.cancel_orders.side_effect = lambda order_ids: Mock(results=[
+        Mock(order_id=order_id, success=True) for order_id in order_ids
+    ])
+    response = Mock(success=True, success_response=Mock(order_id="new"))
+    response.to_dict.return_value = {"success": True}
+    client.limit_order_gtc.return_value = response
+    return client
+
+
+def test_level2_book_tracks_best_levels():
+    book = PriceBook()
+    book.apply(level2("BTC-USD", [("bid", 99, 1), ("bid", 98, 2), ("offer", 101, 1), ("offer", 102, 1)], snapshot=True))
+    assert book.price("BTC-USD") == 100
+    assert book.price("BTC-USD", anchor="bid") == 99
+
+    # The best bid empties and the next level takes over; a better ask arrives
+    book.apply(level2("BTC-USD", [("bid", 99, 0), ("offer", 100.5, 3)]))
+    assert (book.best_bid["BTC-USD"], book.best_ask["BTC-USD"]) == (98, 100.5)
+
+    # A ticker doesn't override the level2 book
+    book.apply(json.loads(ticker("BTC-USD", 50)))
+    assert book.best_bid["BTC-USD"] == 98
+    assert book.last["BTC-USD"] == 50
+
+
+def test_small_moves_leave_the_ladder_alone(args):
+    client = exchange([])
+    trader = StreamTrader(args, COINS, client, Mock(), executor=ImmediateExecutor())
+
+    trader.on_message(ticker("BTC-USD", 100))
+    trader.on_message(ticker("BTC-USD", 100.9))
+    trader.on_message(ticker("BTC-USD", 99.1))
+    trader.on_message(ticker("ETH-USD", 10))
+
+    assert trader.anchors == {"BTC": 100}
+    client.list_orders.assert_not_called()
+
+
+def test_dip_past_band_moves_the_ladder(args):
+    client = exchange([resting_order("a", 99.5, 0.5), resting_order("b", 98.5, 0.5, filled="0.25")])
+    db_session = Mock()
+    trader = StreamTrader(args, COINS, client, db_session, executor=ImmediateExecutor())
+
+    trader.on_message(ticker("BTC-USD", 100))
+    trader.on_message(ticker("BTC-USD", 98))
+
+    assert [c.kwargs["order_ids"] for c in client.cancel_orders.call_args_list] == [["a", "b"]]
+    # 49.75 + 24.625 released, laddered again from 98 down
+    prices = [c.kwargs["limit_price"] for c in client.limit_order_gtc.call_args_list]
+    assert prices == ["97.51", "96.53"]
+    spent = sum(float(c.kwargs["limit_price"]) * float(c.kwargs["base_size"]) for c in client.limit_order_gtc.call_args_list)
+    assert spent == pytest.approx(74.375, abs=0.01)
+    db_session.commit.assert_called_once()
+    assert trader.anchors == {"BTC": 98}
+    assert trader.pending == set()
+    assert len(trader.reaction_times) == 1 and trader.reaction_times[0] < 0.05
+
+
+def test_reaction_times_are_bounded(args, mocker):
+    mocker.patch.object(stream, "REACTION_TIMES_KEPT", 2)
+    trader = StreamTrader(args, COINS, exchange([]), Mock(), executor=ImmediateExecutor())
+
+    for price in (100, 98, 96, 94):
+        trader.on_message(ticker("BTC-USD", price))
+
+    assert len(trader.reaction_times) == 2
+    assert trader.reactions == 3
+    assert trader.slowest_reaction >= max(trader.reaction_times)
+
+
+def test_failed_reanchor_retried_on_next_event(args):
+    client = exchange([resting_order("a", 99.5, 0.5)])
+    client.list_orders.side_effect = [Exception("503 Server Error"), client.list_orders.return_value]
+    trader = StreamTrader(args, COINS, client, Mock(), executor=ImmediateExecutor())
+
+    trader.on_message(ticker("BTC-USD", 100))
+    trader.on_message(ticker("BTC-USD", 105))
+    assert trader.anchors == {"BTC": 100}
+
+    trader.on_message(ticker("BTC-USD", 105))
+    assert trader.anchors == {"BTC": 105}
+    assert client.limit_order_gtc.call_count == 2
+
+
+def test_run_stream_subscribes_and_stops(make_args, mocker):
+    buy_cycle = mocker.patch.object(stream, "buy_cycle")
+    mocker.patch.object(stream, "get_configured_products_info", return_value=COINS)
+    stop_event = threading.Event()
+    ws_client = Mock()
+
+    def factory(on_message):
+        def sleep(seconds):
+            on_message(ticker("BTC-USD", 100))
+            stop_event.set()
+        ws_client.sleep_with_exception_check.side_effect = sleep
+        return ws_client
+
+    stream.run_stream(make_args(stream_channel="level2"), {"BTC": {}}, exchange([]), Mock(), stop_event=stop_event, ws_client_factory=factory)
+
+    buy_cycle.assert_called_once()
+    ws_client.subscribe.assert_called_once_with(product_ids=["BTC-USD"], channels=["level2", "heartbeats"])
+    ws_client.close.assert_called_once()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import math
+from types import SimpleNamespace
+
+import pytest
+
+from optimal_buy_cbpro import sweep
+from optimal_buy_cbpro.backtest import load_candles, map_candles, run_backtest
+from optimal_buy_cbpro.columns import read_columns
+
+COINS = {"BTC": {"minimum_order_size": 1.0, "base_increment": "0.00000001", "price_increment": "0.01"}}
+
+
+@pytest.fixture
+def candles_path(tmp_path):
+    # Ten days of hourly candles swinging between 90 and 110
+    path = tmp_path / "candles.csv"
+    lines = ["time,open,low,close"]
+    for hour in range(240):
+        price = 100 + 10 * math.sin(hour / 7)
+        lines.append(f"{hour * 3600},{price:.2f},{price * 0.995:.2f},{price:.2f}")
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_mapped_candles_match_parsed(candles_path):
+    parsed = load_candles(candles_path, cache=False)
+    mapped = map_candles(candles_path)
+
+    assert isinstance(mapped.lows, memoryview)
+    assert list(mapped.lows) == list(parsed.lows)
+    args = SimpleNamespace(buy_interval=86400)
+    assert run_backtest(mapped, args, COINS) == run_backtest(parsed, args, COINS)
+
+
+def test_sweep_matches_sequential_backtests(candles_path):
+    values = {
+        "starting_discount": [0.0, 0.02],
+        "discount_step": [0.01, 0.03],
+        "order_count": [1, 4],
+        "buy_interval": [86400.0, 43200.0],
+    }
+    combinations = sweep.grid(values)
+    base_args = SimpleNamespace(base_fee=0.006, withdrawal_threshold=0.0, deposit_amount=100.0)
+
+    columns = sweep.run_sweep(candles_path, combinations, base_args, COINS, workers=2)
+
+    assert len(combinations) == 16
+    parsed = load_candles(candles_path)
+    for i, combination in enumerate(combinations):
+        report = run_backtest(parsed, SimpleNamespace(**vars(base_args), **combination), COINS)
+        assert columns["order_count"][i] == combination["order_count"]
+        assert columns["orders_filled"][i] == report["orders_filled"]
+        assert columns["value"][i] == pytest.approx(report["value"])
+
+
+def test_random_samples_within_ranges():
+    values = {"starting_discount": (0.0, 0.05), "discount_step": [0.01], "order_count": (1, 8), "buy_interval": [86400.0]}
+
+    combinations = sweep.sample(values, 50, seed=3)
+
+    assert combinations == sweep.sample(values, 50, seed=3)
+    assert all(0 <= c["starting_discount"] <= 0.05 and 1 <= c["order_count"] <= 8 for c in combinations)
+    with pytest.raises(Exception, match="ranges need --samples"):
+        sweep.grid(values)
+
+
+def test_cli_writes_results_and_ranks_them(candles_path, tmp_path, capsys):
+    output = tmp_path / "sweep.cols"
+
+    assert sweep.main([
+        "--candles", str(candles_path), "--starting-discounts", "0,0.01,0.05", "--order-counts", "1,3",
+        "--base-increment", "0.00000001", "--price-increment", "0.01",
+        "--workers", "2", "--output", str(output), "--rank-by", "fill_rate", "--top", "2",
+    ]) == 0
+
+    header, columns = read_columns(output)
+    assert header["count"] == 6
+    assert sorted(columns["starting_discount"]) == [0, 0, 0.01, 0.01, 0.05, 0.05]
+    capsys.readouterr()
+
+    assert sweep.main(["--rank", str(output), "--rank-by", "fill_rate", "--top", "1"]) == 0
+    best = capsys.readouterr().out.splitlines()[-1]
+    assert f"fill_rate={max(columns['fill_rate']):.6g}" in best
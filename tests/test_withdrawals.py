@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from optimal_buy_cbpro import withdrawals
+from optimal_buy_cbpro.cache import FileCache
+from optimal_buy_cbpro.history import Withdrawal, check_ledger, ledger_totals
+
+
+def accounts(**balances):
+    return SimpleNamespace(accounts=[
+        SimpleNamespace(currency=currency, uuid=f"acct-{currency}", available_balance={"value": value})
+        for currency, value in balances.items()
+    ])
+
+
+COINS = {
+    "BTC": {"withdrawal_address": "bc1-btc"},
+    "ETH": {"withdrawal_address": "0x-eth", "network_fee": "0.001"},
+    "LTC": {"withdrawal_address": "ltc1-ltc"},
+    "SOL": {},
+}
+PINNED_FEES = {
+    "BTC": {"withdrawal_address": "bc1-btc", "network_fee": "0.0001"},
+    "ETH": {"withdrawal_address": "0x-eth", "network_fee": "0.0001"},
+}
+
+
+def test_withdraws_coins_worth_the_fee_in_one_pass(args, v2, db_session, tmp_path):
+    v2.fees = {"acct-BTC": "0.0002", "acct-LTC": "0.01"}
+    cache = FileCache(str(tmp_path / "fees.json"), "withdrawal_fees")
+    balances = accounts(BTC="0.0150000001", ETH="0.04", LTC="0.2", SOL="3")
+
+    rows = withdrawals.withdraw_coins(args, COINS, balances, Mock(), db_session, raw=v2, cache=cache)
+
+    # BTC is worth 75 fees; ETH (pinned fee, no lookup) only 40 and LTC 20, so they wait
+    assert [(account_id, json["amount"], json["to"]) for account_id, json in v2.sends] == [("acct-BTC", "0.01500", "bc1-btc")]
+    assert sorted(v2.fee_lookups) == ["acct-BTC", "acct-LTC"]
+    assert [(row.currency, row.amount, row.status, row.network_fee) for row in rows] == [
+        ("BTC", Decimal("0.01500"), "pending", Decimal("0.0001")),
+    ]
+    assert ledger_totals(db_session, "withdrawn") == {"BTC": Decimal("0.01500")}
+    # The fee just paid replaces the estimate; nothing is looked up again
+    assert cache.get("BTC")[0] == "0.0001"
+    v2.fee_lookups.clear()
+    withdrawals.withdraw_coins(args, COINS, accounts(LTC="0.6"), Mock(), db_session, raw=v2, cache=cache)
+    assert v2.fee_lookups == []
+    assert v2.sends[-1][0] == "acct-LTC"
+
+
+def test_coin_without_a_fee_estimate_is_not_withdrawn(args, v2):
+    balances = accounts(BTC="1", ETH="1")
+
+    # BTC has never paid a fee, so only ETH's pinned one gets it out
+    planned = withdrawals.plan_withdrawals(args, COINS, balances, v2)
+    assert [coin_symbol for coin_symbol, _, _, _ in planned] == ["ETH"]
+
+    v2.transactions = Mock(side_effect=Exception("503 Server Error"))
+    v2.fees = {"acct-BTC": "0.0002"}
+    planned = withdrawals.plan_withdrawals(args, COINS, balances, v2)
+    assert [coin_symbol for coin_symbol, _, _, _ in planned] == ["ETH"]
+
+
+def test_failed_send_raised_after_others_are_stored(args, v2, db_session):
+    v2.fail = {"acct-ETH"}
+
+    with pytest.raises(Exception, match="1 withdrawals failed, first: 1.00000 ETH"):
+        withdrawals.withdraw_coins(args, PINNED_FEES, accounts(BTC="1", ETH="1"), Mock(), db_session, raw=v2)
+
+    assert [(row.currency, row.cbpro_withdrawal_id) for row in db_session.query(Withdrawal)] == [("BTC", "send-acct-BTC")]
+
+
+def test_resent_withdrawal_keeps_its_idem(args, v2, db_session):
+    for run_id in ("run-1", "run-1", "run-2"):
+        withdrawals.withdraw_coins(args, {"BTC": PINNED_FEES["BTC"]}, accounts(BTC="1"), Mock(), db_session, raw=v2, run_id=run_id)
+
+    idems = [json["idem"] for _, json in v2.sends]
+    assert idems[0] == idems[1] == withdrawals.make_withdrawal_idem("run-1", "BTC", "1.00000")
+    assert idems[2] != idems[0]
+
+
+def test_failed_withdrawal_leaves_the_ledger(args, v2, db_session):
+    balances = accounts(BTC="1", ETH="2")
+    withdrawals.withdraw_coins(args, PINNED_FEES, balances, Mock(), db_session, raw=v2)
+    assert ledger_totals(db_session, "withdrawn") == {"BTC": Decimal("1.00000"), "ETH": Decimal("2.00000")}
+
+    v2.statuses = {"send-acct-BTC": "completed", "send-acct-ETH": "failed"}
+    assert withdrawals.refresh_pending_withdrawals(args, balances, db_session, raw=v2) == []
+
+    assert ledger_totals(db_session, "withdrawn") == {"BTC": Decimal("1.00000"), "ETH": Decimal("0.00000")}
+    assert check_ledger(db_session) == []
+    # Settled sends aren't looked up again
+    assert withdrawals.pending_withdrawals(db_session) == []